@@ -0,0 +1,205 @@
+# UpgradeStateManager 锁竞争基准：原来的单锁设计 vs 短发布锁 + 无锁读的状态槽设计
+# 用法: python bench_state_manager.py --tasks 2000 --writers 200 --readers 8 --seconds 3
+import time
+import random
+import logging
+import argparse
+import threading
+from threading import Lock, Condition
+from typing import Dict, Any
+from getpod import UpgradeStateManager, task_key
+
+logging.disable(logging.INFO)  # 基准中不输出状态更新日志
+
+
+class LockedUpgradeStateManager:
+    """原设计：单个全局锁，读路径持锁遍历所有任务（作为对照）"""
+    def __init__(self):
+        self._lock = Lock()  # 线程锁，防止多个任务同时写入数据造成冲突
+        self._tasks: Dict[str, Dict[str, Any]] = {} # 存储所有任务的状态
+        # 【新增】变更序号：每次状态变化加 1，并记录在对应任务的 seq 字段中
+        self._seq = 0
+        self._changed = Condition(self._lock)  # 有新变更时唤醒等待的推送流
+
+    def _touch(self, name: str):
+        """记录一次变更（调用方持有锁）"""
+        self._seq += 1
+        self._tasks[name]["seq"] = self._seq
+        self._changed.notify_all()
+
+    def register_task(self, task: dict):
+        """在任务开始前，从计划文件中注册任务的基本信息"""
+        name = task_key(task)
+        with self._lock:
+            # 只有当任务首次出现时才注册
+            if name not in self._tasks:
+                self._tasks[name] = {
+                    "status": "pending",  # 状态: pending -> running -> succeeded / failed
+                    "start_time": None,   # 实际开始升级的时间戳
+                    "end_time": None,     # 任务结束的时间戳
+                    "duration": 0.0,      # 任务实际耗时
+                    "from_ver": task.get("version", {}).get("from", "N/A"),
+                    "to_ver": task.get("version", {}).get("to", "N/A"),
+                    "expected_duration": task.get("timeline", {}).get("end", 0) - task.get("timeline", {}).get("start", 0)
+                }
+                self._touch(name)
+
+    def start_task(self, name: str):
+        """标记一个任务已开始执行"""
+        with self._lock:
+            if name in self._tasks:
+                self._tasks[name]["status"] = "running"
+                self._tasks[name]["start_time"] = time.time()
+                self._touch(name)
+                logging.info(f"[State Manager] 任务 '{name}' 状态更新为 running")
+
+    def finish_task(self, name: str, success: bool, duration: float):
+        """标记一个任务已结束，并记录最终状态和耗时"""
+        with self._lock:
+            if name in self._tasks:
+                self._tasks[name]["status"] = "succeeded" if success else "failed"
+                self._tasks[name]["end_time"] = time.time()
+                self._tasks[name]["duration"] = duration
+                self._touch(name)
+                logging.info(f"[State Manager] 任务 '{name}' 状态更新为 {self._tasks[name]['status']}")
+
+    def get_data_for_visualizer(self) -> Dict[str, Any]:
+        """
+        【核心翻译函数】
+        将内部存储的状态，转换成您可视化程序需要的、与AppUpgrader完全兼容的格式。
+        """
+        with self._lock:
+            # 初始化可视化程序需要的6个变量
+            upgrade_status = {}
+            upgrade_times = {}
+            start_times = {}
+            upgrade_durations = {}
+            available_versions = {}
+            upgrade_candidates = {}
+
+            # 遍历所有被管理状态的任务
+            for name, data in self._tasks.items():
+                # 1. 填充 upgrade_status
+                upgrade_status[name] = (data["status"] == "running")
+
+                # 2. 填充 upgrade_times (只有完成的任务才有)
+                if data["status"] in ["succeeded", "failed"]:
+                    upgrade_times[name] = data["duration"]
+
+                # 3. 填充 start_times (只有开始或完成的任务才有)
+                if data["start_time"]:
+                    start_times[name] = data["start_time"]
+                
+                # 4. 填充 upgrade_durations (预计时长)
+                upgrade_durations[name] = data["expected_duration"]
+                
+                # 5. 填充 available_versions (当前版本)
+                available_versions[name] = [data["from_ver"]]
+                
+                # 6. 填充 upgrade_candidates (目标版本)
+                upgrade_candidates[name] = data["to_ver"]
+
+            return {
+                "upgrade_status": upgrade_status,
+                "upgrade_times": upgrade_times,
+                "start_times": start_times,
+                "upgrade_durations": upgrade_durations,
+                "available_versions": available_versions,
+                "upgrade_candidates": upgrade_candidates,
+            }
+
+    def get_changes(self, since: int = 0) -> Dict[str, Any]:
+        """
+        【新增】增量接口：返回序号大于 since 的任务的原始状态
+
+        since 大于当前序号（例如服务端重启过）时返回全部任务，并标记 reset。
+        """
+        with self._lock:
+            return self._changes_locked(since)
+
+    def _changes_locked(self, since: int) -> Dict[str, Any]:
+        reset = since > self._seq
+        if reset:
+            since = 0
+        tasks = {name: dict(data) for name, data in self._tasks.items() if data["seq"] > since}
+        return {"seq": self._seq, "reset": reset, "tasks": tasks}
+
+    def wait_for_changes(self, since: int, timeout: float) -> Dict[str, Any]:
+        """阻塞到有序号大于 since 的变更或超时，供推送流使用"""
+        with self._changed:
+            self._changed.wait_for(lambda: self._seq != since, timeout)
+            return self._changes_locked(since)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))] if ordered else float('nan')
+
+
+def run(manager, tasks: int, writers: int, readers: int, seconds: float,
+        write_pause: float, read_interval: float) -> Dict[str, float]:
+    """
+    writers 个线程反复 start/finish 随机任务（模拟 execute_task 汇报，两次汇报间隔 write_pause 秒），
+    readers 个线程每 read_interval 秒调用一次 get_data_for_visualizer（模拟 API 请求），统计吞吐与写延迟
+    """
+    names = []
+    for i in range(tasks):
+        task = {"name": f"task-{i}", "window_id": 1, "version": {"from": "1.0", "to": "1.1"}, "timeline": {"start": 0, "end": 10}}
+        manager.register_task(task)
+        names.append(task_key(task))
+    stop = threading.Event()
+    write_latencies = [[] for _ in range(writers)]
+    read_counts = [0] * readers
+
+    def writer(i):
+        rng = random.Random(i)
+        lat = write_latencies[i]
+        while not stop.is_set():
+            name = rng.choice(names)
+            t0 = time.perf_counter()
+            manager.start_task(name)
+            lat.append(time.perf_counter() - t0)
+            time.sleep(write_pause)
+            t0 = time.perf_counter()
+            manager.finish_task(name, True, 1.0)
+            lat.append(time.perf_counter() - t0)
+            time.sleep(write_pause)
+
+    def reader(i):
+        while not stop.is_set():
+            manager.get_data_for_visualizer()
+            read_counts[i] += 1
+            time.sleep(read_interval)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for th in threads:
+        th.start()
+    time.sleep(seconds)
+    stop.set()
+    for th in threads:
+        th.join()
+    lat = [x for per in write_latencies for x in per]
+    return {
+        "writes/s": len(lat) / seconds,
+        "reads/s": sum(read_counts) / seconds,
+        "write p50 (ms)": percentile(lat, 50) * 1e3,
+        "write p99 (ms)": percentile(lat, 99) * 1e3,
+        "write max (ms)": max(lat, default=float('nan')) * 1e3,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="UpgradeStateManager 锁竞争基准")
+    parser.add_argument("--tasks", type=int, default=2000)
+    parser.add_argument("--writers", type=int, default=200)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--write-pause", type=float, default=0.001, help="每次汇报之间的间隔(秒)")
+    parser.add_argument("--read-interval", type=float, default=0.001, help="每个读线程两次请求之间的间隔(秒)")
+    args = parser.parse_args()
+
+    for label, manager in (("单锁 (原设计)", LockedUpgradeStateManager()), ("短发布锁 + 无锁读", UpgradeStateManager())):
+        result = run(manager, args.tasks, args.writers, args.readers, args.seconds,
+                     args.write_pause, args.read_interval)
+        print(f"{label}: " + ", ".join(f"{k}={v:.2f}" for k, v in result.items()))
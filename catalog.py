@@ -0,0 +1,74 @@
+from typing import Dict, List, Tuple, Set, Optional, Iterable
+
+
+class VersionCatalog:
+    def __init__(self,
+                 available_versions: Dict[str, List[str]],
+                 incompatible_pairs: Optional[Iterable] = None):
+        """
+        编译后的版本目录，替代 list.index 线性查找
+
+        :param available_versions: 各组件完整版本列表 {组件: [最低版本, ...]}
+        :param incompatible_pairs: 不兼容版本对 [[s1, v1, s2, v2], ...]
+        """
+        self.services: List[str] = list(available_versions.keys())
+        self.service_index: Dict[str, int] = {s: i for i, s in enumerate(self.services)}
+        self.versions: Dict[str, List[str]] = {s: list(vs) for s, vs in available_versions.items()}
+        # 每个服务的 版本 -> 下标 表
+        self.version_index: Dict[str, Dict[str, int]] = {
+            s: {v: i for i, v in enumerate(vs)} for s, vs in self.versions.items()
+        }
+        # (服务, 版本) 的整数编号及其反查表
+        self.keys: List[Tuple[str, str]] = [(s, v) for s in self.services for v in self.versions[s]]
+        self.ids: Dict[Tuple[str, str], int] = {k: i for i, k in enumerate(self.keys)}
+        # 不兼容关系的哈希索引（对称）：(s, v) -> {(s2, v2), ...}
+        self.conflicts: Dict[Tuple[str, str], Set[Tuple[str, str]]] = {}
+        self.incompatible_pairs = [tuple(p) for p in (incompatible_pairs or [])]
+        for s1, v1, s2, v2 in self.incompatible_pairs:
+            self.conflicts.setdefault((s1, v1), set()).add((s2, v2))
+            self.conflicts.setdefault((s2, v2), set()).add((s1, v1))
+
+    def index(self, service: str, version: str) -> int:
+        """版本在该服务完整版本列表中的下标"""
+        return self.version_index[service][version]
+
+    def id(self, service: str, version: str) -> int:
+        """(服务, 版本) 的整数编号"""
+        return self.ids[service, version]
+
+    def conflicts_of(self, service: str, version: str) -> Set[Tuple[str, str]]:
+        """与 (服务, 版本) 不兼容的所有 (服务, 版本)"""
+        return self.conflicts.get((service, version), set())
+
+    def compatible(self, s1: str, v1: str, s2: str, v2: str) -> bool:
+        return (s2, v2) not in self.conflicts.get((s1, v1), ())
+
+    def clashes(self, service: str, current: str, target: str, running: Dict[str, Tuple[str, str]]) -> bool:
+        """
+        service 从 current 升级到 target 时，是否与正在进行的升级在某个混合状态下不兼容
+
+        :param running: 正在进行的升级 {服务: (原版本, 目标版本)}，升级过程中其版本可能是两者之一
+        """
+        for r, (r_from, r_to) in running.items():
+            if r == service:
+                continue
+            for v in (current, target):
+                for rv in (r_from, r_to):
+                    if (r, rv) in self.conflicts.get((service, v), ()):
+                        return True
+        return False
+
+    def candidates(self, service: str, current: str, span: int = 2) -> List[Tuple[str, int]]:
+        """
+        当前版本之后至多 span 个版本
+
+        :return: [(目标版本, 完整列表中的下标), ...]
+        """
+        versions = self.versions[service]
+        current_idx = self.version_index[service][current]
+        return [(versions[i], i) for i in range(current_idx + 1, min(current_idx + span + 1, len(versions)))]
+
+    def offset(self, service: str, current_list: List[str], target: str) -> int:
+        """target 在以 current_list[0] 开头的（已截断）版本列表中的下标"""
+        index = self.version_index[service]
+        return index[target] - index[current_list[0]]
@@ -0,0 +1,583 @@
+# 集群客户端层：Helm/Kubernetes 操作的统一接口，可选 子进程 / 进程内 Kubernetes API / 本地模拟 三种后端
+import os
+import json
+import time
+import threading
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from kubernetes import client as k8s_client, config as k8s_config, watch as k8s_watch
+except ImportError:  # 未安装 kubernetes 时只能使用子进程或模拟后端
+    k8s_client = k8s_config = k8s_watch = None
+
+
+class ClusterClient:
+    """集群操作接口，getpod 中的升级、回滚和就绪检查都通过它完成"""
+    name = "base"
+
+    def namespace_exists(self, namespace: str) -> bool:
+        raise NotImplementedError
+
+    def list_releases(self, namespace: str) -> List[str]:
+        """命名空间中的 Helm release（与 helm list -q 相同）"""
+        raise NotImplementedError
+
+    def release_exists(self, namespace: str, release: str) -> bool:
+        return release in self.list_releases(namespace)
+
+    def list_deployments(self, namespace: str) -> List[str]:
+        raise NotImplementedError
+
+    def deployment_exists(self, namespace: str, deploy_name: str) -> bool:
+        return deploy_name in self.list_deployments(namespace)
+
+    def ensure_pull_secret(self, namespace: str, secret_name: str) -> bool:
+        """给 default ServiceAccount 加上 imagePullSecrets，返回是否成功（命名空间不存在时失败）"""
+        raise NotImplementedError
+
+    def patch_deployment_image_pull(self, deploy_name: str, namespace: str, secret_name: str) -> None:
+        raise NotImplementedError
+
+    def helm_upgrade(self, release: str, chart_path: str, namespace: str, values: Dict[str, str],
+                     install: bool = True) -> Tuple[bool, str]:
+        """
+        helm upgrade --force
+
+        :param values: --set 的键值
+        :param install: 是否带 --install --create-namespace
+        :return: (是否成功, 错误信息)
+        """
+        raise NotImplementedError
+
+    def render_chart(self, release: str, chart_path: str, namespace: str, values: Dict[str, str]) -> Tuple[bool, str]:
+        """
+        在本地渲染 chart（helm template），不改动集群，用于时间窗开始前校验 chart 并找出其中的镜像
+
+        :return: (是否成功, 渲染出的清单或错误信息)
+        """
+        raise NotImplementedError
+
+    def rollout_status(self, namespace: str, deploy_name: str, timeout: int) -> Tuple[bool, str]:
+        """
+        等待 Deployment 滚动完成，最多 timeout 秒
+
+        :return: (是否就绪, 错误信息)
+        """
+        raise NotImplementedError
+
+    def deployment_generation(self, namespace: str, deploy_name: str) -> Optional[int]:
+        """
+        Deployment 当前的 metadata.generation（直接查询 API server，不经过 watch 缓存），不存在或不支持时为 None
+
+        在 helm upgrade 返回后调用：spec 有变化时 API server 已同步递增 generation，spec 未变（只改了 ConfigMap/Service，
+        或 patch 后完全相同）时 generation 不变
+        """
+        return None
+
+    def deployment_source(self):
+        """供 rollout_watch.RolloutWatcher 使用的 Deployment 事件源，不支持时返回 None"""
+        return None
+
+    def close(self) -> None:
+        pass
+
+
+class SubprocessClusterClient(ClusterClient):
+    """原来的实现：每个操作调用一次 helm / kubectl 子进程"""
+    name = "subprocess"
+
+    def namespace_exists(self, namespace):
+        res = subprocess.run(["kubectl", "get", "namespace", namespace, "-o", "name"], capture_output=True, text=True)
+        return res.returncode == 0
+
+    def list_releases(self, namespace):
+        res = subprocess.run(["helm", "list", "-q", "-n", namespace], capture_output=True, text=True)
+        return res.stdout.splitlines() if res.returncode == 0 else []
+
+    def list_deployments(self, namespace):
+        res = subprocess.run(["kubectl", "get", "deployments", "-n", namespace,
+                              "-o", "jsonpath={.items[*].metadata.name}"], capture_output=True, text=True)
+        return res.stdout.split() if res.returncode == 0 else []
+
+    def ensure_pull_secret(self, namespace, secret_name):
+        patch = json.dumps({"imagePullSecrets": [{"name": secret_name}]})
+        res = subprocess.run([
+            "kubectl", "patch", "serviceaccount", "default", "-n", namespace, "-p", patch
+        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return res.returncode == 0
+
+    def patch_deployment_image_pull(self, deploy_name, namespace, secret_name):
+        patch = json.dumps({
+            "spec": {"template": {"spec": {"imagePullSecrets": [{"name": secret_name}]}}}
+        })
+        subprocess.run([
+            "kubectl", "patch", "deployment", deploy_name, "-n", namespace, "-p", patch
+        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def helm_upgrade(self, release, chart_path, namespace, values, install=True):
+        cmd = ["helm", "upgrade", release, chart_path]
+        if install:
+            cmd += ["--install", "--create-namespace"]
+        cmd += ["--namespace", namespace, "--force"]
+        for key, value in values.items():
+            cmd += ["--set", f"{key}={value}"]
+        res = subprocess.run(cmd, capture_output=True, text=True)
+        return res.returncode == 0, res.stderr.strip()
+
+    def render_chart(self, release, chart_path, namespace, values):
+        cmd = ["helm", "template", release, chart_path, "--namespace", namespace]
+        for key, value in values.items():
+            cmd += ["--set", f"{key}={value}"]
+        res = subprocess.run(cmd, capture_output=True, text=True)
+        return (True, res.stdout) if res.returncode == 0 else (False, res.stderr.strip())
+
+    def rollout_status(self, namespace, deploy_name, timeout):
+        res = subprocess.run([
+            "kubectl", "rollout", "status", f"deployment/{deploy_name}",
+            "-n", namespace, f"--timeout={timeout}s"
+        ], capture_output=True, text=True)
+        return res.returncode == 0, res.stderr.strip()
+
+    def deployment_generation(self, namespace, deploy_name):
+        res = subprocess.run(["kubectl", "get", "deployment", deploy_name, "-n", namespace,
+                              "-o", "jsonpath={.metadata.generation}"], capture_output=True, text=True)
+        value = res.stdout.strip()
+        return int(value) if res.returncode == 0 and value.isdigit() else None
+
+    def deployment_source(self):
+        from rollout_watch import KubectlDeploymentSource
+        return KubectlDeploymentSource()
+
+
+class KubernetesClusterClient(SubprocessClusterClient):
+    name = "kubernetes"
+
+    def __init__(self, kubeconfig: Optional[str] = None, context: Optional[str] = None, pool_size: int = 32):
+        """
+        进程内 Kubernetes API 客户端：kubeconfig 只加载一次，所有线程共用一个带连接池的 ApiClient，
+        避免每个操作都启动进程并重新建立 TLS 连接。
+
+        Helm 没有进程内 API，helm upgrade 仍走子进程；release 是否存在通过 Helm 3 存储在
+        命名空间中的 release Secret（标签 owner=helm）直接查询。
+
+        :param kubeconfig: kubeconfig 路径，默认按 kubectl 的规则查找，集群内运行时使用 ServiceAccount
+        :param context: kubeconfig 中的 context
+        :param pool_size: 连接池大小，应不小于同时进行的升级数
+        """
+        if k8s_client is None:
+            raise ImportError("KubernetesClusterClient 需要安装 kubernetes 包")
+        configuration = k8s_client.Configuration()
+        try:
+            k8s_config.load_kube_config(config_file=kubeconfig, context=context, client_configuration=configuration)
+        except k8s_config.ConfigException:
+            k8s_config.load_incluster_config(client_configuration=configuration)
+        configuration.connection_pool_maxsize = pool_size
+        self.api_client = k8s_client.ApiClient(configuration)
+        self.core = k8s_client.CoreV1Api(self.api_client)
+        self.apps = k8s_client.AppsV1Api(self.api_client)
+
+    def namespace_exists(self, namespace):
+        try:
+            self.core.read_namespace(namespace)
+            return True
+        except k8s_client.ApiException:
+            return False
+
+    def list_releases(self, namespace):
+        try:
+            secrets = self.core.list_namespaced_secret(namespace, label_selector="owner=helm")
+        except k8s_client.ApiException:
+            return []
+        # 与 helm list 一致：已卸载的 release 不算存在
+        return sorted({s.metadata.labels["name"] for s in secrets.items
+                       if s.metadata.labels.get("status") != "uninstalled"})
+
+    def release_exists(self, namespace, release):
+        try:
+            secrets = self.core.list_namespaced_secret(namespace, label_selector=f"owner=helm,name={release}")
+        except k8s_client.ApiException:
+            return False
+        return any((s.metadata.labels or {}).get("status") != "uninstalled" for s in secrets.items)
+
+    def list_deployments(self, namespace):
+        try:
+            return [d.metadata.name for d in self.apps.list_namespaced_deployment(namespace).items]
+        except k8s_client.ApiException:
+            return []
+
+    def ensure_pull_secret(self, namespace, secret_name):
+        try:
+            self.core.patch_namespaced_service_account(
+                "default", namespace, {"imagePullSecrets": [{"name": secret_name}]})
+            return True
+        except k8s_client.ApiException:
+            return False  # 与 kubectl 版本一致：失败时不中断升级（命名空间可能尚未创建）
+
+    def patch_deployment_image_pull(self, deploy_name, namespace, secret_name):
+        try:
+            self.apps.patch_namespaced_deployment(
+                deploy_name, namespace, {"spec": {"template": {"spec": {"imagePullSecrets": [{"name": secret_name}]}}}})
+        except k8s_client.ApiException:
+            pass
+
+    @staticmethod
+    def _rolled_out(deploy) -> bool:
+        """与 kubectl rollout status 相同的判定"""
+        spec, status = deploy.spec, deploy.status
+        if (status.observed_generation or 0) < (deploy.metadata.generation or 0):
+            return False
+        replicas = spec.replicas if spec.replicas is not None else 1
+        return ((status.updated_replicas or 0) >= replicas
+                and (status.replicas or 0) <= (status.updated_replicas or 0)
+                and (status.available_replicas or 0) >= (status.updated_replicas or 0))
+
+    def rollout_status(self, namespace, deploy_name, timeout):
+        deadline = time.time() + timeout
+        w = k8s_watch.Watch()
+        try:
+            while True:
+                remaining = int(deadline - time.time())
+                if remaining <= 0:
+                    return False, f"等待 deployment/{deploy_name} 滚动完成超时"
+                for event in w.stream(self.apps.list_namespaced_deployment, namespace,
+                                      field_selector=f"metadata.name={deploy_name}", timeout_seconds=remaining):
+                    if event["type"] == "DELETED":
+                        return False, f"deployment/{deploy_name} 已被删除"
+                    if self._rolled_out(event["object"]):
+                        return True, ""
+        except k8s_client.ApiException as e:
+            return False, str(e.reason)
+        finally:
+            w.stop()
+
+    def deployment_generation(self, namespace, deploy_name):
+        try:
+            return self.apps.read_namespaced_deployment(deploy_name, namespace).metadata.generation
+        except k8s_client.ApiException:
+            return None
+
+    def deployment_source(self):
+        from rollout_watch import KubernetesDeploymentSource
+        return KubernetesDeploymentSource(self.apps)
+
+    def close(self):
+        self.api_client.close()
+
+
+class FakeClusterClient(ClusterClient):
+    name = "fake"
+
+    def __init__(self,
+                 rollout_seconds: Optional[Dict[str, float]] = None,
+                 fail_upgrades: Optional[List[str]] = None,
+                 static_releases: Optional[List[str]] = None,
+                 default_rollout: float = 0.0,
+                 clock=time.time,
+                 sleep=time.sleep):
+        """
+        本地模拟集群，不需要 helm/kubectl，用于测试和演示
+
+        :param rollout_seconds: {deployment 名: 滚动完成所需秒数}，超过 timeout 即就绪失败
+        :param fail_upgrades: helm upgrade 会失败的 release 名
+        :param static_releases: helm upgrade 不改变 Deployment spec 的 release 名（generation 不变，不产生新的滚动）
+        :param default_rollout: 未指定的 deployment 的滚动用时
+        """
+        self.rollout_seconds = rollout_seconds or {}
+        self.fail_upgrades = set(fail_upgrades or [])
+        self.static_releases = set(static_releases or [])
+        self.default_rollout = default_rollout
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self.releases: Dict[Tuple[str, str], dict] = {}        # (namespace, release) -> {"chart", "values"}
+        self.namespaces = set()
+        self.service_accounts: Dict[str, List[str]] = {}       # namespace -> imagePullSecrets
+        self.deployments: Dict[Tuple[str, str], dict] = {}     # (namespace, deployment) -> {"pull_secrets", "ready_at", "generation"}
+        self.calls: List[tuple] = []                           # 调用记录
+        self.events = None                                     # deployment_source() 创建后同步推送状态
+
+    def namespace_exists(self, namespace):
+        with self._lock:
+            self.calls.append(("namespace_exists", namespace))
+            return namespace in self.namespaces
+
+    def list_releases(self, namespace):
+        with self._lock:
+            self.calls.append(("list_releases", namespace))
+            return sorted(r for ns, r in self.releases if ns == namespace)
+
+    def list_deployments(self, namespace):
+        with self._lock:
+            self.calls.append(("list_deployments", namespace))
+            return sorted(d for ns, d in self.deployments if ns == namespace)
+
+    def ensure_pull_secret(self, namespace, secret_name):
+        with self._lock:
+            self.calls.append(("ensure_pull_secret", namespace, secret_name))
+            if namespace not in self.namespaces:
+                return False
+            self.service_accounts[namespace] = [secret_name]
+            return True
+
+    def patch_deployment_image_pull(self, deploy_name, namespace, secret_name):
+        with self._lock:
+            self.calls.append(("patch_deployment", namespace, deploy_name))
+            if (namespace, deploy_name) in self.deployments:
+                self.deployments[namespace, deploy_name]["pull_secrets"] = [secret_name]
+
+    def helm_upgrade(self, release, chart_path, namespace, values, install=True):
+        with self._lock:
+            self.calls.append(("helm_upgrade", namespace, release, chart_path, dict(values)))
+            if release in self.fail_upgrades:
+                return False, f"Error: UPGRADE FAILED: {release}"
+            if not install and (namespace, release) not in self.releases:
+                return False, f'Error: UPGRADE FAILED: "{release}" has no deployed releases'
+            self.namespaces.add(namespace)
+            self.releases[namespace, release] = {"chart": chart_path, "values": dict(values)}
+            # chart 中的 deployment 命名约定为 <服务名>-deployment，release 名为 <服务名>-<版本>
+            deploy_name = f"{release.rsplit('-', 1)[0]}-deployment"
+            existing = self.deployments.get((namespace, deploy_name))
+            if existing is not None and release in self.static_releases:
+                return True, ""  # spec 未变：generation 不变，也没有新的滚动
+            rollout = self.rollout_seconds.get(deploy_name, self.default_rollout)
+            generation = existing["generation"] + 1 if existing is not None else 1
+            self.deployments[namespace, deploy_name] = {"pull_secrets": [], "ready_at": self.clock() + rollout,
+                                                        "generation": generation}
+            events = self.events
+        if events is not None:
+            # 新 generation 先以未就绪状态出现，rollout 秒后全部副本可用
+            events.update(namespace, deploy_name, generation=generation, observed_generation=generation,
+                          replicas=1, status_replicas=1, updated_replicas=1, available_replicas=0)
+            timer = threading.Timer(rollout, self._become_ready, args=(namespace, deploy_name, generation))
+            timer.daemon = True
+            timer.start()
+        return True, ""
+
+    def render_chart(self, release, chart_path, namespace, values):
+        with self._lock:
+            self.calls.append(("render_chart", namespace, release, chart_path, dict(values)))
+        if release in self.fail_upgrades:
+            return False, f"Error: template: {release}: chart 渲染失败"
+        # chart 目录约定为 <chart_root>/<服务名>/<版本>
+        service, version = os.path.basename(os.path.dirname(chart_path)), os.path.basename(chart_path)
+        return True, (f"apiVersion: apps/v1\nkind: Deployment\nmetadata:\n  name: {service}-deployment\n"
+                      f"spec:\n  template:\n    spec:\n      containers:\n        - name: {service}\n"
+                      f"          image: registry.local/{service}:{version}\n")
+
+    def deployment_source(self):
+        from rollout_watch import FakeDeploymentSource
+        with self._lock:
+            if self.events is None:
+                self.events = FakeDeploymentSource()
+            return self.events
+
+    def deployment_generation(self, namespace, deploy_name):
+        with self._lock:
+            self.calls.append(("deployment_generation", namespace, deploy_name))
+            return self.deployments.get((namespace, deploy_name), {}).get("generation")
+
+    def _become_ready(self, namespace: str, deploy_name: str, generation: int) -> None:
+        if self.events.deployments.get((namespace, deploy_name), {}).get("generation") == generation:
+            self.events.update(namespace, deploy_name, available_replicas=1)
+
+    def rollout_status(self, namespace, deploy_name, timeout):
+        with self._lock:
+            self.calls.append(("rollout_status", namespace, deploy_name, timeout))
+            deploy = self.deployments.get((namespace, deploy_name))
+        if deploy is None:
+            return False, f'Error from server (NotFound): deployments.apps "{deploy_name}" not found'
+        wait = deploy["ready_at"] - self.clock()
+        if wait > timeout:
+            self.sleep(timeout)
+            return False, "error: timed out waiting for the condition"
+        if wait > 0:
+            self.sleep(wait)
+        return True, ""
+
+
+class CachingClusterClient(ClusterClient):
+    def __init__(self, inner: ClusterClient, ttl: float = 30.0, clock=time.monotonic):
+        """
+        按命名空间缓存集群事实的包装层：命名空间是否存在、ServiceAccount 是否已加 pull secret、
+        release 列表和 Deployment 列表。条目 ttl 秒后过期，自己发出的写操作会直接更新或作废相关条目，
+        同一区域的后续任务不再重复查询和重复 patch。
+
+        :param inner: 实际执行操作的客户端
+        :param ttl: 缓存有效期(秒)
+        :param clock: 单调时钟
+        """
+        self.inner = inner
+        self.name = f"{inner.name}+cache"
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[tuple, Tuple[object, float]] = {}   # (类别, namespace) -> (值, 过期时间)
+        self._dirty = set()                                    # 写操作后只可信正结果的 Deployment 列表
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+
+    # ---------------- 缓存 ----------------
+
+    def _get(self, kind: str, namespace: str):
+        """返回 (是否命中, 值)"""
+        with self._lock:
+            entry = self._entries.get((kind, namespace))
+            if entry is not None and entry[1] > self.clock():
+                return True, entry[0]
+            return False, None
+
+    def _put(self, kind: str, namespace: str, value) -> None:
+        with self._lock:
+            self._entries[kind, namespace] = (value, self.clock() + self.ttl)
+
+    def _count(self, kind: str, hit: bool) -> None:
+        counter = self.hits if hit else self.misses
+        with self._lock:
+            counter[kind] = counter.get(kind, 0) + 1
+
+    def invalidate(self, namespace: Optional[str] = None) -> None:
+        """作废某个命名空间（默认全部）的缓存"""
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+                self._dirty.clear()
+            else:
+                for key in [k for k in self._entries if k[1] == namespace]:
+                    del self._entries[key]
+                self._dirty.discard(namespace)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """各类查询的命中/未命中次数"""
+        with self._lock:
+            kinds = sorted(set(self.hits) | set(self.misses))
+            return {k: {"hits": self.hits.get(k, 0), "misses": self.misses.get(k, 0)} for k in kinds}
+
+    # ---------------- 读 ----------------
+
+    def namespace_exists(self, namespace):
+        hit, value = self._get("namespace", namespace)
+        self._count("namespace", hit)
+        if not hit:
+            value = self.inner.namespace_exists(namespace)
+            self._put("namespace", namespace, value)
+        return value
+
+    def list_releases(self, namespace):
+        hit, value = self._get("releases", namespace)
+        self._count("releases", hit)
+        if not hit:
+            value = set(self.inner.list_releases(namespace))
+            self._put("releases", namespace, value)
+        return sorted(value)
+
+    def release_exists(self, namespace, release):
+        return release in self.list_releases(namespace)
+
+    def _fetch_deployments(self, namespace):
+        self._count("deployments", False)
+        value = set(self.inner.list_deployments(namespace))
+        self._put("deployments", namespace, value)
+        with self._lock:
+            self._dirty.discard(namespace)
+        return value
+
+    def list_deployments(self, namespace):
+        hit, value = self._get("deployments", namespace)
+        if hit:
+            self._count("deployments", True)
+        else:
+            value = self._fetch_deployments(namespace)
+        return sorted(value)
+
+    def deployment_exists(self, namespace, deploy_name):
+        hit, value = self._get("deployments", namespace)
+        with self._lock:
+            dirty = namespace in self._dirty
+        # 我们的写操作只会新增 Deployment：列表中已有的结果仍然可信，列表中没有且之后有过写操作时重新查询
+        if hit and (deploy_name in value or not dirty):
+            self._count("deployments", True)
+            return deploy_name in value
+        return deploy_name in self._fetch_deployments(namespace)
+
+    # ---------------- 写 ----------------
+
+    def ensure_pull_secret(self, namespace, secret_name):
+        hit, value = self._get("pull_secret", namespace)
+        if hit and value == secret_name:
+            self._count("pull_secret", True)
+            return True
+        self._count("pull_secret", False)
+        if not self.namespace_exists(namespace):
+            return False  # 命名空间尚未创建，patch 必然失败
+        ok = self.inner.ensure_pull_secret(namespace, secret_name)
+        if ok:
+            self._put("pull_secret", namespace, secret_name)
+        return ok
+
+    def patch_deployment_image_pull(self, deploy_name, namespace, secret_name):
+        # helm upgrade --force 会重置 pod 模板，每次升级后都需要重新 patch，不缓存
+        self.inner.patch_deployment_image_pull(deploy_name, namespace, secret_name)
+
+    def helm_upgrade(self, release, chart_path, namespace, values, install=True):
+        ok, err = self.inner.helm_upgrade(release, chart_path, namespace, values, install)
+        if not ok:
+            self.invalidate(namespace)  # 失败的升级可能留下部分状态
+            return ok, err
+        with self._lock:
+            if install:
+                self._entries["namespace", namespace] = (True, self.clock() + self.ttl)  # --create-namespace
+            entry = self._entries.get(("releases", namespace))
+            if entry is not None:
+                entry[0].add(release)
+            self._dirty.add(namespace)
+        return ok, err
+
+    def render_chart(self, release, chart_path, namespace, values):
+        return self.inner.render_chart(release, chart_path, namespace, values)
+
+    def rollout_status(self, namespace, deploy_name, timeout):
+        if not self.deployment_exists(namespace, deploy_name):
+            # 不存在的 Deployment 不会就绪，不必等到超时
+            return False, f'deployments.apps "{deploy_name}" not found'
+        return self.inner.rollout_status(namespace, deploy_name, timeout)
+
+    def deployment_generation(self, namespace, deploy_name):
+        return self.inner.deployment_generation(namespace, deploy_name)
+
+    def deployment_source(self):
+        return self.inner.deployment_source()
+
+    def close(self):
+        self.inner.close()
+
+
+CLUSTER_BACKENDS = {
+    "subprocess": SubprocessClusterClient,
+    "kubernetes": KubernetesClusterClient,
+    "fake": FakeClusterClient,
+}
+
+
+def get_cluster_client(name: str = "auto", cache_ttl: float = 0, **kwargs) -> ClusterClient:
+    """
+    按名称创建集群客户端
+
+    :param name: subprocess / kubernetes / fake / auto（已安装 kubernetes 包时使用进程内客户端，否则子进程）
+    :param cache_ttl: 大于 0 时用 CachingClusterClient 包装，缓存有效期为该秒数
+    """
+    client = _create_client(name, **kwargs)
+    return CachingClusterClient(client, cache_ttl) if cache_ttl > 0 else client
+
+
+def _create_client(name: str, **kwargs) -> ClusterClient:
+    if name == "auto":
+        if k8s_client is not None:
+            try:
+                return KubernetesClusterClient(**kwargs)
+            except k8s_config.ConfigException:
+                pass  # 没有可用的 kubeconfig，退回子进程
+        return SubprocessClusterClient()
+    if name not in CLUSTER_BACKENDS:
+        raise ValueError(f"未知的集群后端: {name}，可选 {', '.join(CLUSTER_BACKENDS)}")
+    return CLUSTER_BACKENDS[name](**kwargs)
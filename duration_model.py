@@ -0,0 +1,264 @@
+# 在线学习的升级用时与成功率模型：按 服务/版本跳 维护流式分位数草图和成功次数，跨运行持久化，
+# 向优化器提供 p90 等分位数用时以取代配置中的固定值
+import os
+import json
+import math
+import tempfile
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+Hop = Tuple[str, Optional[str], Optional[str]]  # (服务, 原版本, 目标版本)
+
+
+class QuantileSketch:
+    __slots__ = ("alpha", "_log_gamma", "bins", "zero", "count", "min", "max")
+
+    def __init__(self, alpha: float = 0.01):
+        """
+        相对误差分位数草图（DDSketch）：值按对数间隔分桶，任意分位数的相对误差不超过 alpha，
+        用时从 10ms 到数小时也只需几百个桶，可合并、可序列化
+
+        :param alpha: 相对误差上限
+        """
+        self.alpha = alpha
+        self._log_gamma = math.log((1 + alpha) / (1 - alpha))
+        self.bins: Dict[int, int] = {}
+        self.zero = 0  # 非正值单独计数
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        if value <= 0:
+            self.zero += 1
+        else:
+            k = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[k] = self.bins.get(k, 0) + 1
+        self.count += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """q 取 0~1，没有样本时返回 None"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero
+        if rank < seen:
+            return max(self.min, 0.0)
+        for k in sorted(self.bins):
+            seen += self.bins[k]
+            if rank < seen:
+                gamma = math.exp(self._log_gamma)
+                estimate = 2 * gamma ** k / (gamma + 1)  # 桶 (γ^(k-1), γ^k] 的相对误差中点
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    def merge(self, other: "QuantileSketch") -> None:
+        for k, n in other.bins.items():
+            self.bins[k] = self.bins.get(k, 0) + n
+        self.zero += other.zero
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def to_dict(self) -> dict:
+        return {"alpha": self.alpha, "bins": {str(k): n for k, n in self.bins.items()},
+                "zero": self.zero, "count": self.count,
+                "min": self.min if self.count else None, "max": self.max if self.count else None}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "QuantileSketch":
+        sketch = cls(d.get("alpha", 0.01))
+        sketch.bins = {int(k): n for k, n in d.get("bins", {}).items()}
+        sketch.zero = d.get("zero", 0)
+        sketch.count = d.get("count", 0)
+        if sketch.count:
+            sketch.min, sketch.max = d["min"], d["max"]
+        return sketch
+
+
+class HopStats:
+    __slots__ = ("durations", "successes", "failures")
+
+    def __init__(self, alpha: float = 0.01):
+        self.durations = QuantileSketch(alpha)  # 只记录成功升级的用时
+        self.successes = 0
+        self.failures = 0
+
+
+class DurationModel:
+    def __init__(self,
+                 path: Optional[str] = "duration_model.json",
+                 quantile: float = 0.9,
+                 min_samples: int = 5,
+                 alpha: float = 0.01,
+                 prior: Tuple[float, float] = (1.0, 1.0),
+                 unit: Optional[str] = "s"):
+        """
+        升级用时与成功率的在线估计
+
+        估计时优先使用该版本跳的样本，样本数不足 min_samples 时退回该服务从当前版本出发的所有跳，
+        再退回该服务的全部样本，仍不足时使用配置中的固定用时。
+
+        :param path: 持久化文件，None 表示不持久化
+        :param quantile: 默认给优化器的分位数，0.9 即 p90
+        :param min_samples: 使用某一级样本所需的最少样本数
+        :param alpha: 分位数草图的相对误差
+        :param prior: 成功率的 Beta 先验 (a, b)，成功率估计为 (成功 + a) / (次数 + a + b)
+        :param unit: 记录的用时单位，随模型写入文件：集群上的真实用时为 "s"，本地模拟的用时为 "sim"。
+                     载入单位不同的文件时抛出 ValueError，避免两种用时混在同一个分布里；None 表示沿用文件中的单位
+        """
+        self.path = path
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.alpha = alpha
+        self.prior = prior
+        self.unit = unit
+        self._lock = threading.Lock()
+        self.hops: Dict[Hop, HopStats] = {}
+        if path and os.path.exists(path):
+            self.load(path)
+
+    # ---------------- 记录 ----------------
+
+    def observe(self, service: str, from_ver: Optional[str], to_ver: Optional[str],
+                duration: float, success: bool) -> None:
+        """
+        记录一次升级结果
+
+        :param duration: 实际用时(秒)，只有成功的升级计入用时分布（失败的用时往往是被超时截断的）
+        """
+        with self._lock:
+            stats = self.hops.get((service, from_ver, to_ver))
+            if stats is None:
+                stats = self.hops[service, from_ver, to_ver] = HopStats(self.alpha)
+            if success:
+                stats.successes += 1
+                stats.durations.add(duration)
+            else:
+                stats.failures += 1
+
+    # ---------------- 估计 ----------------
+
+    def _levels(self, service: str, from_ver: Optional[str], to_ver: Optional[str]) -> List[List[HopStats]]:
+        """由细到粗的样本层级：该版本跳 -> 从该版本出发的所有跳 -> 该服务全部"""
+        mine = [(hop, st) for hop, st in self.hops.items() if hop[0] == service]
+        levels = []
+        if from_ver is not None and to_ver is not None:
+            levels.append([st for hop, st in mine if hop[1] == from_ver and hop[2] == to_ver])
+        if from_ver is not None:
+            levels.append([st for hop, st in mine if hop[1] == from_ver])
+        levels.append([st for _, st in mine])
+        return levels
+
+    def estimate(self, service: str, default: Optional[float] = None,
+                 from_ver: Optional[str] = None, to_ver: Optional[str] = None,
+                 q: Optional[float] = None) -> Optional[float]:
+        """
+        用时的分位数估计(秒)
+
+        :param default: 样本不足时的返回值（通常为配置中的固定用时）
+        :param q: 分位数，默认 self.quantile
+        """
+        q = self.quantile if q is None else q
+        with self._lock:
+            for level in self._levels(service, from_ver, to_ver):
+                if sum(st.durations.count for st in level) >= self.min_samples:
+                    sketch = QuantileSketch(self.alpha)
+                    for st in level:
+                        sketch.merge(st.durations)
+                    return sketch.quantile(q)
+        return default
+
+    def success_prob(self, service: str, from_ver: Optional[str] = None, to_ver: Optional[str] = None) -> float:
+        """成功率的后验均值"""
+        a, b = self.prior
+        with self._lock:
+            for level in self._levels(service, from_ver, to_ver):
+                n_ok = sum(st.successes for st in level)
+                n = n_ok + sum(st.failures for st in level)
+                if n >= self.min_samples:
+                    break  # 否则最终使用最粗一级（该服务全部）的计数
+        return (n_ok + a) / (n + a + b)
+
+    def durations(self, static: Dict[str, float],
+                  current: Optional[Dict[str, str]] = None,
+                  q: Optional[float] = None,
+                  scale: float = 1.0) -> Dict[str, float]:
+        """
+        给优化器/规划器使用的用时表
+
+        :param static: 配置中的固定用时 {服务: 用时}，样本不足的服务沿用该值
+        :param current: 各服务当前版本，给定时优先使用从当前版本出发的样本
+        :param scale: 一个配置时间单位对应的秒数（规划器中为 time_unit）
+        """
+        result = {}
+        for s, default in static.items():
+            est = self.estimate(s, None, (current or {}).get(s), None, q)
+            result[s] = default if est is None else est / scale
+        return result
+
+    def success_probs(self, services: Iterable[str]) -> Dict[str, float]:
+        """{服务: 成功率}，可直接作为 simulator.Simulator 的 success_prob"""
+        return {s: self.success_prob(s) for s in services}
+
+    def summary(self) -> List[dict]:
+        """每个版本跳的样本数、成功率和 p50/p90"""
+        with self._lock:
+            items = sorted(self.hops.items(), key=lambda kv: tuple(x or "" for x in kv[0]))
+            return [{"service": s, "from": f, "to": t, "samples": st.durations.count,
+                     "successes": st.successes, "failures": st.failures,
+                     "p50": st.durations.quantile(0.5), "p90": st.durations.quantile(0.9)}
+                    for (s, f, t), st in items]
+
+    # ---------------- 持久化 ----------------
+
+    def save(self, path: Optional[str] = None) -> None:
+        """原子写入（临时文件 + rename）"""
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            state = {"version": 1, "unit": self.unit, "hops": [
+                {"service": s, "from": f, "to": t, "successes": st.successes, "failures": st.failures,
+                 "durations": st.durations.to_dict()}
+                for (s, f, t), st in self.hops.items()]}
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(prefix='.duration-model-', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def load(self, path: str) -> None:
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+        unit = state.get("unit")  # 旧版本写入的文件没有单位，按与当前一致处理
+        if unit is not None and self.unit is not None and unit != self.unit:
+            raise ValueError(f"用时模型 {path} 记录的单位为 {unit}，与当前的 {self.unit} 不一致，请使用另一个模型文件")
+        if self.unit is None:
+            self.unit = unit
+        with self._lock:
+            for entry in state.get("hops", []):
+                stats = HopStats(self.alpha)
+                stats.successes = entry.get("successes", 0)
+                stats.failures = entry.get("failures", 0)
+                stats.durations = QuantileSketch.from_dict(entry["durations"])
+                self.hops[entry["service"], entry.get("from"), entry.get("to")] = stats
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="查看已学习的升级用时/成功率模型")
+    parser.add_argument("--model", default="duration_model.json")
+    args = parser.parse_args()
+    for row in DurationModel(args.model, unit=None).summary():
+        p50 = "-" if row["p50"] is None else f"{row['p50']:.2f}s"
+        p90 = "-" if row["p90"] is None else f"{row['p90']:.2f}s"
+        print(f"{row['service']:<20} {row['from']} -> {row['to']}: 样本 {row['samples']}, "
+              f"成功 {row['successes']}/{row['successes'] + row['failures']}, p50 {p50}, p90 {p90}")
@@ -0,0 +1,105 @@
+# 事件驱动的升级引擎：单线程 + 定时堆，取代每个组件一个 threading.Timer
+import time
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future, as_completed, wait
+from typing import Callable, Iterable, List, Optional
+
+
+class UpgradeEngine:
+    def __init__(self, clock: Callable[[], float] = time.time):
+        """
+        所有进行中的升级共用一个调度线程，按到期时间从堆中取出并执行完成回调
+
+        :param clock: 时钟函数，默认 time.time（与 AppUpgrader.start_times 一致）
+        """
+        self.clock = clock
+        self._heap = []
+        self._seq = itertools.count()  # 到期时间相同时保持提交顺序
+        self._cond = threading.Condition()
+        self._inflight = set()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    def schedule(self, delay: float, fn: Callable, *args) -> Future:
+        """
+        delay 秒后在引擎线程中执行 fn(*args)
+
+        :return: 以 fn 的返回值（或异常）完成的 Future
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self._cond:
+            heapq.heappush(self._heap, (self.clock() + delay, next(self._seq), fn, args, future))
+            self._inflight.add(future)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="UpgradeEngine", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        future.add_done_callback(self._discard)
+        return future
+
+    def _discard(self, future: Future) -> None:
+        with self._cond:
+            self._inflight.discard(future)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - self.clock()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)  # 新的更早事件加入时会被 notify 唤醒
+                if self._stopped:
+                    return
+                _, _, fn, args, future = heapq.heappop(self._heap)
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def inflight(self) -> List[Future]:
+        """所有尚未完成的升级"""
+        with self._cond:
+            return list(self._inflight)
+
+    def as_completed(self, futures: Optional[Iterable[Future]] = None, timeout: Optional[float] = None):
+        """按完成顺序迭代 futures（默认所有进行中的升级），完成时立即返回而非轮询"""
+        return as_completed(list(futures) if futures is not None else self.inflight(), timeout)
+
+    def await_all(self, futures: Optional[Iterable[Future]] = None, timeout: Optional[float] = None) -> bool:
+        """
+        阻塞直到 futures（默认所有进行中的升级）全部完成
+
+        :return: 是否在 timeout 内全部完成
+        """
+        _, not_done = wait(list(futures) if futures is not None else self.inflight(), timeout)
+        return not not_done
+
+    def shutdown(self) -> None:
+        """停止引擎线程，未到期的事件不再执行"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+            pending = [item[-1] for item in self._heap]
+            self._heap.clear()
+        for future in pending:
+            future.set_exception(RuntimeError("引擎已停止"))
+
+
+_default_engine: Optional[UpgradeEngine] = None
+_default_lock = threading.Lock()
+
+
+def default_engine() -> UpgradeEngine:
+    """进程内共享的引擎"""
+    global _default_engine
+    with _default_lock:
+        if _default_engine is None:
+            _default_engine = UpgradeEngine()
+        return _default_engine
@@ -4,104 +4,208 @@
 import os
 import json
 import argparse
-import subprocess
 import time
 import logging
 import sys
 from datetime import datetime, timedelta
-from threading import Thread, Lock
-from typing import Dict, Any
+from collections import deque
+from threading import Thread, Lock, Condition
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, Any, List, Optional
 
 # 【新增】引入Flask用于创建API服务器
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request, Response
+from engine import UpgradeEngine
+from cluster import ClusterClient, SubprocessClusterClient, CachingClusterClient, CLUSTER_BACKENDS, get_cluster_client
+from rollout_watch import RolloutWatcher
+from metrics import MetricsRegistry, default_registry
+from duration_model import DurationModel
+from watchdog import RolloutWatchdog, TaskBudget
+from warmup import PULLERS, WarmupPipeline, get_puller
 
 # -------------------------------------------------------------------
 # 【新增】第1步：创建一个线程安全的状态管理器
 # -------------------------------------------------------------------
 # 这个类的作用是作为所有升级任务的中央数据库，实时记录它们的状态。
 # 它将被API服务器和任务执行线程共享。
+def task_key(task: dict) -> str:
+    """
+    任务在状态管理器中的键：时间窗:服务:原版本->目标版本
+
+    同一服务在一个时间窗内串联的多跳、在不同时间窗中的升级各占一个状态槽；window_id 由 WindowExecutor 登记时写入任务
+    """
+    ver = task.get("version", {})
+    return f"{task.get('window_id')}:{task.get('name')}:{ver.get('from', 'N/A')}->{ver.get('to', 'N/A')}"
+
+
+class _TaskSlot:
+    """单个任务的状态槽。state 为不可变元组，整体替换，读者无需加锁即可读到一致的状态"""
+    __slots__ = ("name", "window_id", "from_ver", "to_ver", "expected_duration", "state")
+
+    def __init__(self, name: str, window_id, from_ver: str, to_ver: str, expected_duration: float):
+        self.name = name
+        self.window_id = window_id
+        self.from_ver = from_ver
+        self.to_ver = to_ver
+        self.expected_duration = expected_duration
+        # (status, start_time, end_time, duration, seq)
+        # status: pending -> running -> succeeded / failed
+        self.state = ("pending", None, None, 0.0, 0)
+
+    def as_dict(self) -> Dict[str, Any]:
+        status, start_time, end_time, duration, seq = self.state
+        return {"name": self.name, "window_id": self.window_id,
+                "status": status, "start_time": start_time, "end_time": end_time, "duration": duration,
+                "from_ver": self.from_ver, "to_ver": self.to_ver,
+                "expected_duration": self.expected_duration, "seq": seq}
+
+
 class UpgradeStateManager:
+    """
+    【修改】读者不阻塞写者的状态管理器
+
+    - 每个任务一个 __slots__ 状态槽（键见 task_key），写者替换其不可变 state 元组；
+    - 写者只在分配序号并替换 state 时持有一个 O(1) 的短锁，保证增量接口按序号不漏读，读者从不加锁；
+    - 任务表只在注册时以写时复制的方式整体替换，读者拿到引用后无锁遍历；
+    - 全量视图按序号缓存，状态未变化时直接复用。
+    """
     def __init__(self):
-        self._lock = Lock()  # 线程锁，防止多个任务同时写入数据造成冲突
-        self._tasks: Dict[str, Dict[str, Any]] = {} # 存储所有任务的状态
+        self._slots: Dict[str, _TaskSlot] = {}  # 写时复制，只在注册时整体替换
+        self._lock = Lock()  # 分配序号并发布状态的短锁
+        self._seq = 0  # 变更序号：每次状态变化加 1
+        self._changed = Condition()  # 有新变更时唤醒等待的推送流
+        self._view_cache = (-1, None)  # (序号, get_data_for_visualizer 的结果)
 
-    def register_task(self, task: dict):
-        """在任务开始前，从计划文件中注册任务的基本信息"""
-        name = task["name"]
+    def _publish(self, slot: _TaskSlot, status: str, start_time, end_time, duration: float):
+        """替换状态槽并分配序号：先写 state 再写 _seq，读到序号 S 的读者一定能看到 S 及之前的全部变更"""
         with self._lock:
-            # 只有当任务首次出现时才注册
-            if name not in self._tasks:
-                self._tasks[name] = {
-                    "status": "pending",  # 状态: pending -> running -> succeeded / failed
-                    "start_time": None,   # 实际开始升级的时间戳
-                    "end_time": None,     # 任务结束的时间戳
-                    "duration": 0.0,      # 任务实际耗时
-                    "from_ver": task.get("version", {}).get("from", "N/A"),
-                    "to_ver": task.get("version", {}).get("to", "N/A"),
-                    "expected_duration": task.get("timeline", {}).get("end", 0) - task.get("timeline", {}).get("start", 0)
-                }
-
-    def start_task(self, name: str):
-        """标记一个任务已开始执行"""
+            seq = self._seq + 1
+            slot.state = (status, start_time, end_time, duration, seq)
+            self._seq = seq
+        with self._changed:
+            self._changed.notify_all()
+
+    def register_tasks(self, tasks):
+        """批量注册任务，任务表只复制一次"""
         with self._lock:
-            if name in self._tasks:
-                self._tasks[name]["status"] = "running"
-                self._tasks[name]["start_time"] = time.time()
-                logging.info(f"[State Manager] 任务 '{name}' 状态更新为 running")
+            slots = dict(self._slots)
+            seq = self._seq
+            for task in tasks:
+                key = task_key(task)
+                # 只有当任务首次出现时才注册
+                if key in slots:
+                    continue
+                timeline = task.get("timeline", {})
+                slot = _TaskSlot(task["name"], task.get("window_id"),
+                                 task.get("version", {}).get("from", "N/A"),
+                                 task.get("version", {}).get("to", "N/A"),
+                                 timeline.get("end", 0) - timeline.get("start", 0))
+                seq += 1
+                slot.state = ("pending", None, None, 0.0, seq)
+                slots[key] = slot
+            self._slots = slots
+            self._seq = seq
+        with self._changed:
+            self._changed.notify_all()
+
+    def register_task(self, task: dict):
+        """在任务开始前，从计划文件中注册任务的基本信息"""
+        self.register_tasks([task])
 
-    def finish_task(self, name: str, success: bool, duration: float):
+    def start_task(self, key: str):
+        """标记一个任务已开始执行，key 为 task_key(task)"""
+        slot = self._slots.get(key)
+        if slot is None:
+            return
+        self._publish(slot, "running", time.time(), None, 0.0)
+        logging.info(f"[State Manager] 任务 '{key}' 状态更新为 running")
+
+    def finish_task(self, key: str, success: bool, duration: float):
         """标记一个任务已结束，并记录最终状态和耗时"""
-        with self._lock:
-            if name in self._tasks:
-                self._tasks[name]["status"] = "succeeded" if success else "failed"
-                self._tasks[name]["end_time"] = time.time()
-                self._tasks[name]["duration"] = duration
-                logging.info(f"[State Manager] 任务 '{name}' 状态更新为 {self._tasks[name]['status']}")
+        slot = self._slots.get(key)
+        if slot is None:
+            return
+        status = "succeeded" if success else "failed"
+        self._publish(slot, status, slot.state[1], time.time(), duration)
+        logging.info(f"[State Manager] 任务 '{key}' 状态更新为 {status}")
 
     def get_data_for_visualizer(self) -> Dict[str, Any]:
         """
         【核心翻译函数】
         将内部存储的状态，转换成您可视化程序需要的、与AppUpgrader完全兼容的格式。
+        各字典以 task_key 为键，另附 labels {键: 服务名} 供可视化程序作为行名。
+        无锁读取；序号未变化时返回缓存的结果（调用方不应修改它）。
         """
-        with self._lock:
-            # 初始化可视化程序需要的6个变量
-            upgrade_status = {}
-            upgrade_times = {}
-            start_times = {}
-            upgrade_durations = {}
-            available_versions = {}
-            upgrade_candidates = {}
-
-            # 遍历所有被管理状态的任务
-            for name, data in self._tasks.items():
-                # 1. 填充 upgrade_status
-                upgrade_status[name] = (data["status"] == "running")
-
-                # 2. 填充 upgrade_times (只有完成的任务才有)
-                if data["status"] in ["succeeded", "failed"]:
-                    upgrade_times[name] = data["duration"]
-
-                # 3. 填充 start_times (只有开始或完成的任务才有)
-                if data["start_time"]:
-                    start_times[name] = data["start_time"]
-                
-                # 4. 填充 upgrade_durations (预计时长)
-                upgrade_durations[name] = data["expected_duration"]
-                
-                # 5. 填充 available_versions (当前版本)
-                available_versions[name] = [data["from_ver"]]
-                
-                # 6. 填充 upgrade_candidates (目标版本)
-                upgrade_candidates[name] = data["to_ver"]
-
-            return {
-                "upgrade_status": upgrade_status,
-                "upgrade_times": upgrade_times,
-                "start_times": start_times,
-                "upgrade_durations": upgrade_durations,
-                "available_versions": available_versions,
-                "upgrade_candidates": upgrade_candidates,
-            }
+        seq = self._seq
+        cached_seq, cached = self._view_cache
+        if cached_seq == seq:
+            return cached
+
+        # 初始化可视化程序需要的6个变量
+        upgrade_status = {}
+        upgrade_times = {}
+        start_times = {}
+        upgrade_durations = {}
+        available_versions = {}
+        upgrade_candidates = {}
+        labels = {}
+
+        # 遍历所有被管理状态的任务
+        for key, slot in self._slots.items():
+            status, start_time, _, duration, _ = slot.state
+            # 1. 填充 upgrade_status
+            upgrade_status[key] = (status == "running")
+
+            # 2. 填充 upgrade_times (只有完成的任务才有)
+            if status in ["succeeded", "failed"]:
+                upgrade_times[key] = duration
+
+            # 3. 填充 start_times (只有开始或完成的任务才有)
+            if start_time:
+                start_times[key] = start_time
+
+            # 4. 填充 upgrade_durations (预计时长)
+            upgrade_durations[key] = slot.expected_duration
+
+            # 5. 填充 available_versions (当前版本)：与 AppUpgrader 相同，成功后前移到目标版本
+            available_versions[key] = [slot.to_ver if status == "succeeded" else slot.from_ver]
+
+            # 6. 填充 upgrade_candidates (目标版本)
+            upgrade_candidates[key] = slot.to_ver
+
+            # 7. 填充 labels (行名为服务名)
+            labels[key] = slot.name
+
+        data = {
+            "upgrade_status": upgrade_status,
+            "upgrade_times": upgrade_times,
+            "start_times": start_times,
+            "upgrade_durations": upgrade_durations,
+            "available_versions": available_versions,
+            "upgrade_candidates": upgrade_candidates,
+            "labels": labels,
+        }
+        self._view_cache = (seq, data)
+        return data
+
+    def get_changes(self, since: int = 0) -> Dict[str, Any]:
+        """
+        【新增】增量接口：返回序号大于 since 的任务的原始状态（无锁读取），以 task_key 为键
+
+        since 大于当前序号（例如服务端重启过）时返回全部任务，并标记 reset。
+        """
+        seq = self._seq
+        reset = since > seq
+        if reset:
+            since = 0
+        tasks = {key: slot.as_dict() for key, slot in self._slots.items() if slot.state[4] > since}
+        return {"seq": seq, "reset": reset, "tasks": tasks}
+
+    def wait_for_changes(self, since: int, timeout: float) -> Dict[str, Any]:
+        """阻塞到有序号大于 since 的变更或超时，供推送流使用"""
+        with self._changed:
+            self._changed.wait_for(lambda: self._seq != since, timeout)
+        return self.get_changes(since)
 
 # -------------------------------------------------------------------
 # 原有代码部分 (稍作修改以集成状态管理器)
@@ -121,154 +225,402 @@ def parse_duration(duration_str):
         return int(duration_str[:-1])
     return int(duration_str)
 
-# Helm 和 kubectl 的辅助函数保持不变
-def release_exists(namespace: str, release: str) -> bool: # ... (代码不变)
-    res = subprocess.run(["helm", "list", "-q", "-n", namespace], capture_output=True, text=True)
-    return res.returncode == 0 and release in res.stdout.splitlines()
-def ensure_pull_secret(namespace: str, secret_name: str = "cloudsim-docker"): # ... (代码不变)
-    patch = json.dumps({"imagePullSecrets": [{"name": secret_name}]})
-    subprocess.run([
-        "kubectl", "patch", "serviceaccount", "default", "-n", namespace, "-p", patch
-    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-def patch_deployment_image_pull(deploy_name: str, namespace: str, secret_name: str = "cloudsim-docker"): # ... (代码不变)
-    patch = json.dumps({
-        "spec": {"template": {"spec": {"imagePullSecrets": [{"name": secret_name}]}}}
-    })
-    subprocess.run([
-        "kubectl", "patch", "deployment", deploy_name, "-n", namespace, "-p", patch
-    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-def rollback_release(namespace: str, name: str, frm_ver: str): # ... (代码不变)
+# Helm 和 kubectl 的辅助函数：通过可替换的集群客户端执行（见 cluster.py），命令行 --cluster-backend 选择后端
+cluster_client: ClusterClient = SubprocessClusterClient()
+# 各阶段耗时的指标登记表（见 metrics.py），由 /metrics 输出
+metrics: MetricsRegistry = default_registry()
+# 学习到的用时/成功率模型（见 duration_model.py），为 None 时不记录
+duration_model: Optional[DurationModel] = None
+# 共享的就绪监视器（见 rollout_watch.py），为 None 时每个任务单独调用 rollout_status
+rollout_watcher: Optional[RolloutWatcher] = None
+# 时间窗预算看门狗（见 watchdog.py），为 None 时等待就绪直到时间窗结束
+watchdog: Optional[RolloutWatchdog] = None
+# 时间窗之间的预热流水线（见 warmup.py），为 None 时所有准备工作都在时间窗开始后进行
+warmup: Optional[WarmupPipeline] = None
+
+def set_cluster_client(client: ClusterClient, watch: bool = False):
+    global cluster_client, rollout_watcher
+    cluster_client = client
+    if rollout_watcher is not None:
+        rollout_watcher.stop()
+    source = client.deployment_source() if watch else None
+    rollout_watcher = RolloutWatcher(source) if source is not None else None
+
+def release_exists(namespace: str, release: str) -> bool:
+    return cluster_client.release_exists(namespace, release)
+def ensure_pull_secret(namespace: str, secret_name: str = "cloudsim-docker") -> bool:
+    return cluster_client.ensure_pull_secret(namespace, secret_name)
+def patch_deployment_image_pull(deploy_name: str, namespace: str, secret_name: str = "cloudsim-docker"):
+    cluster_client.patch_deployment_image_pull(deploy_name, namespace, secret_name)
+def rollback_release(namespace: str, name: str, frm_ver: str) -> bool:
+    """返回是否实际执行了回滚"""
     release = f"{name}-{frm_ver}"
     chart_path = os.path.join(os.getenv('CHART_ROOT', '/home/zuo/ServiceSim/src/chart/'), name, frm_ver)
     if not release_exists(namespace, release):
         logging.warning(f"Release {release} 不存在，跳过回滚")
-        return
+        return False
     logging.info(f"回滚 {name} 到版本 {frm_ver} (namespace={namespace})")
-    cmd = [
-        "helm", "upgrade", release, chart_path,
-        "--namespace", namespace, "--set", f"upgrade_path={frm_ver}-{frm_ver}", "--force"
-    ]
-    res = subprocess.run(cmd, capture_output=True, text=True)
-    if res.returncode != 0:
-        logging.error(f"回滚失败: {res.stderr.strip()}")
+    ok, err = cluster_client.helm_upgrade(release, chart_path, namespace,
+                                          {"upgrade_path": f"{frm_ver}-{frm_ver}"}, install=False)
+    if not ok:
+        logging.error(f"回滚失败: {err}")
     else:
         logging.info(f"回滚成功: {name} → {frm_ver}")
-def check_rollout(namespace: str, deploy_name: str, timeout: int) -> (bool, float): # ... (代码不变)
+    return True
+def _guarded_rollout(namespace: str, deploy_name: str, timeout: int, min_generation: Optional[int],
+                     budget: TaskBudget) -> (bool, str):
+    """分段等待就绪，每段之间由看门狗重新预测，预计来不及在回滚前完成时立即返回"""
+    deadline = time.time() + timeout
+    future = None
+    if rollout_watcher is not None and min_generation is not None:
+        future = rollout_watcher.wait_ready(namespace, deploy_name, min_generation)
+    while True:
+        step = min(watchdog.interval, deadline - time.time())
+        if budget.check() or step <= 0:
+            if future is not None:
+                rollout_watcher.discard(namespace, deploy_name, future)
+            return False, budget.reason or f"等待 deployment/{deploy_name} 就绪超时 ({timeout}s)"
+        if future is not None:
+            try:
+                return future.result(step), ""
+            except FutureTimeout:
+                continue
+        step_start = time.time()
+        ok, err = cluster_client.rollout_status(namespace, deploy_name, max(1, int(step)))
+        if ok:
+            return True, ""
+        if time.time() - step_start < step / 2:
+            return False, err  # 未等到超时就返回：是出错而不是尚未就绪
+def check_rollout(namespace: str, deploy_name: str, timeout: int, min_generation: Optional[int] = None,
+                  budget: Optional[TaskBudget] = None) -> (bool, float):
     logging.info(f"检查 Deployment/{deploy_name} 在命名空间 {namespace} 的就绪状态，时间窗剩余 {timeout}s")
-    cmd = [
-        "kubectl", "rollout", "status", f"deployment/{deploy_name}",
-        "-n", namespace, f"--timeout={timeout}s"
-    ]
     start = time.time()
-    res = subprocess.run(cmd, capture_output=True, text=True)
+    if budget is not None:
+        ok, err = _guarded_rollout(namespace, deploy_name, timeout, min_generation, budget)
+    elif rollout_watcher is not None and min_generation is not None:
+        ok, err = rollout_watcher.check(namespace, deploy_name, min_generation, timeout)
+    else:
+        ok, err = cluster_client.rollout_status(namespace, deploy_name, timeout)
     duration = time.time() - start
-    if res.returncode != 0:
-        logging.error(f"Deployment/{deploy_name} 就绪失败({duration:.2f}s): {res.stderr.strip()}")
+    if not ok:
+        logging.error(f"Deployment/{deploy_name} 就绪失败({duration:.2f}s): {err}")
         return False, duration
     logging.info(f"Deployment/{deploy_name} 已成功就绪 ({duration:.2f}s)")
     return True, duration
 
 
-# 【修改】第2步：修改执行逻辑，让它向状态管理器汇报
-def execute_task(task: dict, chart_root: str, window_start: datetime, window_end: datetime, state_manager: UpgradeStateManager):
-    # (函数前半部分逻辑不变)
+# 【修改】第2步：执行逻辑拆成“等待”和“执行”两部分，等待由 WindowExecutor 的定时堆完成，不占用线程
+def perform_task(task: dict, chart_root: str, window_end: datetime, state_manager: UpgradeStateManager):
+    """在工作线程中执行一个已到开始时间的升级任务，并向状态管理器汇报，返回是否在时间窗内就绪"""
     name = task.get("name")
     ver = task.get("version", {})
     frm_ver, to_ver = ver.get("from"), ver.get("to")
-    offset = task.get("timeline", {}).get("start", 0)
     ns = task.get("region", "default")
+    timeline = task.get("timeline", {})
     readiness_delay = timeline.get("end", 0) - timeline.get("start", 0)
 
-    now = datetime.now()
-    if now > window_end:
-        logging.info(f"当前时间 {now} 已不在时间窗 {window_start}~{window_end} 内, 跳过 {name}")
-        return
-    while datetime.now() < window_start:
-        logging.info(f"当前时间 {datetime.now()}，等待时间窗 {window_start} 开始...")
-        time.sleep(1)
-    if offset > 0:
-        logging.info(f"{name} 延迟 {offset}s 后开始升级")
-        time.sleep(offset)
-    
     # --- 新增汇报点 ---
-    state_manager.start_task(name)
+    key = task_key(task)
+    state_manager.start_task(key)
     task_start_time = time.time() # 记录任务实际开始时间点
     # ---
 
-    helm_start = time.time()
     release = f"{name}-{frm_ver}"
     chart_path = os.path.join(chart_root, name, to_ver)
-    # ... (helm upgrade, patch 等逻辑保持不变)
+    deploy_name = f"{name}-deployment"
+    # 升级前的 generation：只在客户端查不到升级后的 generation 时用来推算目标
+    generation = rollout_watcher.generation(ns, deploy_name) if rollout_watcher is not None else None
+    target = None  # 本次升级后的 generation，helm upgrade 返回后才确定
+    labels = {"service": name, "namespace": ns, "task": f"{name}:{frm_ver}->{to_ver}"}
+    chart_error = warmup.chart_error(task) if warmup is not None else None
+    if chart_error is not None:
+        # 预热阶段 helm template 已失败，helm upgrade 也必然失败，不占用时间窗
+        logging.error(f"{name} 的 chart 在预热阶段校验失败，跳过升级 {frm_ver} → {to_ver}: {chart_error}")
+        state_manager.finish_task(key, success=False, duration=0.0)
+        metrics.inc("upgrade_tasks_total", outcome="invalid", namespace=ns)
+        return False
+    budget = None
+    if watchdog is not None:
+        progress = None
+        if generation is not None:
+            progress = lambda: None if target is None else rollout_watcher.progress(ns, deploy_name, target)
+        budget = watchdog.budget(name, frm_ver, to_ver, readiness_delay, window_end.timestamp(), task_start_time, progress)
+        if budget.check():
+            # 开始前即可判定来不及：不发起升级，也就无需回滚
+            logging.warning(f"{budget.reason}，放弃升级 {frm_ver} → {to_ver}")
+            state_manager.finish_task(key, success=False, duration=0.0)
+            metrics.inc("upgrade_tasks_total", outcome="aborted", namespace=ns)
+            return False
     logging.info(f"{name} 开始升级 {frm_ver} → {to_ver} (namespace={ns})")
-    ensure_pull_secret(ns)
-    res = subprocess.run([
-        "helm", "upgrade", release, chart_path,
-        "--install", "--namespace", ns, "--create-namespace",
-        "--force", "--set", f"upgrade_path={frm_ver}-{to_ver}"
-    ], capture_output=True, text=True)
-    helm_duration = time.time() - helm_start
+    if warmup is None or not warmup.secret_ready(ns):  # 预热阶段已完成时跳过
+        with metrics.span("pull_secret", **labels) as span:
+            span["ok"] = ensure_pull_secret(ns)
+    with metrics.span("helm_upgrade", **labels) as span:
+        helm_start = time.time()
+        upgraded, err = cluster_client.helm_upgrade(release, chart_path, ns, {"upgrade_path": f"{frm_ver}-{to_ver}"})
+        helm_duration = time.time() - helm_start
+        span["ok"] = upgraded
     logging.info(f"Helm 升级耗时 {helm_duration:.2f}s for {name}")
 
-    deploy_name = f"{name}-deployment"
-    patch_deployment_image_pull(deploy_name, ns)
+    with metrics.span("image_patch", **labels):
+        patch_deployment_image_pull(deploy_name, ns)
 
-    logging.info(f"{name} 等待 {readiness_delay}s 后进行就绪检查")
-    time.sleep(readiness_delay)
+    if generation is not None and upgraded:
+        # spec 未变（如 helm upgrade --force 同一份配置）时 generation 不会递增，已滚动完成即就绪；
+        # 只等待“升级前 generation + 1”会一直等到时间窗结束，再把成功的升级回滚
+        target = cluster_client.deployment_generation(ns, deploy_name)
+        if target is None:
+            target = generation + 1
+
+    if generation is None:
+        # 没有就绪监视时保持原来的做法：等待预计时长后再检查，但不晚于最晚回滚时刻
+        delay = readiness_delay
+        if budget is not None:
+            delay = min(delay, max(budget.rollback_deadline - time.time(), 0.0))
+        logging.info(f"{name} 等待 {delay:.0f}s 后进行就绪检查")
+        with metrics.span("readiness_delay", **labels):
+            time.sleep(delay)
 
     ready = False
     rollout_dur = 0.0
-    if res.returncode == 0:
+    if upgraded:
         remaining = int((window_end - datetime.now()).total_seconds())
         if remaining > 0:
-            ready, rollout_dur = check_rollout(ns, deploy_name, remaining)
+            ready, rollout_dur = check_rollout(ns, deploy_name, remaining, target, budget)
+            metrics.record("rollout_check", rollout_dur, ready, **labels)
         else:
             logging.warning(f"已过时间窗 {window_end}, 跳过就绪检查 for {name}")
     else:
-        logging.error(f"{name} 升级失败: {res.stderr.strip()}")
+        logging.error(f"{name} 升级失败: {err}")
     
     # --- 新增汇报点 ---
     total_duration = time.time() - task_start_time # 计算总时长
-    state_manager.finish_task(name, success=ready, duration=total_duration)
+    state_manager.finish_task(key, success=ready, duration=total_duration)
     # ---
+    metrics.record("total", total_duration, ready, **labels)
+    if duration_model is not None:
+        # 只记录实测的升级与就绪耗时：轮询模式下的固定等待就是模型自己给出的预计时长，计入后分位数只会越学越大
+        duration_model.observe(name, frm_ver, to_ver, helm_duration + rollout_dur, ready)
+    aborted = budget is not None and budget.reason is not None
+    metrics.inc("upgrade_tasks_total", outcome="succeeded" if ready else "aborted" if aborted else "rolled_back",
+                namespace=ns)
 
     if not ready:
-        logging.warning(f"{name} 未能在时间窗内就绪 (总耗时 {total_duration:.2f}s), 执行回滚")
-        rollback_release(ns, name, frm_ver)
+        if aborted:
+            logging.warning(f"{budget.reason}，提前放弃并执行回滚 (已用时 {total_duration:.2f}s)")
+        else:
+            logging.warning(f"{name} 未能在时间窗内就绪 (总耗时 {total_duration:.2f}s), 执行回滚")
+        rollback_start = time.time()
+        with metrics.span("rollback", **labels):
+            rolled_back = rollback_release(ns, name, frm_ver)
+        if watchdog is not None and rolled_back:
+            watchdog.observe_rollback(name, time.time() - rollback_start)
     else:
         logging.info(f"{name} 在窗口内就绪 (总升级时长: {total_duration:.2f}s)")
+    return ready
+
+def execute_task(task: dict, chart_root: str, window_start: datetime, window_end: datetime, state_manager: UpgradeStateManager):
+    """在当前线程中等待到任务开始时间后执行（单独执行一个任务时使用）"""
+    name = task.get("name")
+    offset = task.get("timeline", {}).get("start", 0)
+    now = datetime.now()
+    if now > window_end:
+        logging.info(f"当前时间 {now} 已不在时间窗 {window_start}~{window_end} 内, 跳过 {name}")
+        return
+    labels = {"service": name, "namespace": task.get("region", "default")}
+    wait = (window_start - now).total_seconds()
+    if wait > 0:
+        logging.info(f"当前时间 {now}，等待时间窗 {window_start} 开始...")
+        with metrics.span("window_wait", **labels):
+            time.sleep(wait)
+    delay = (window_start + timedelta(seconds=offset) - datetime.now()).total_seconds()
+    if delay > 0:
+        logging.info(f"{name} 延迟 {delay:.0f}s 后开始升级")
+        with metrics.span("offset_sleep", **labels):
+            time.sleep(delay)
+    perform_task(task, chart_root, window_end, state_manager)
 
-# 【修改】将 state_manager 传递下去
-def run_window(window: dict, chart_root: str, state_manager: UpgradeStateManager):
+def chain_hops(tasks: List[dict]) -> List[List[dict]]:
+    """
+    把同一时间窗内同一服务首尾相接的多跳（上一跳的 to 等于下一跳的 from）连成链，按开始偏移排序
+
+    :return: [[第一跳, 第二跳, ...], ...]，单跳任务自成一条链
+    """
+    chains = []
+    tails = {}  # (服务, 命名空间, 版本) -> 以该版本结尾的链
+    for t in sorted(tasks, key=lambda t: t.get("timeline", {}).get("start", 0)):
+        name, ns, ver = t.get("name"), t.get("region", "default"), t.get("version", {})
+        chain = tails.pop((name, ns, ver.get("from")), None)
+        if chain is None:
+            chain = []
+            chains.append(chain)
+        chain.append(t)
+        tails[name, ns, ver.get("to")] = chain
+    return chains
+
+def window_bounds(window: dict) -> (datetime, datetime):
     ws = parse_time(window["window_start_time"])
     duration = parse_duration(window["window_time"])
     we = ws + timedelta(seconds=duration)
     if we < ws: we += timedelta(days=1)
-    
-    logging.info(f"时间窗 {window['window_id']} => 开始: {ws}, 结束: {we}, 时长: {duration}s")
-    
-    threads = []
-    for t in window.get("tasks", []):
-        # 将 state_manager 实例传递给每个任务线程
-        th = Thread(target=execute_task, args=(t, chart_root, ws, we, state_manager))
-        th.start()
-        threads.append(th)
-    for th in threads:
-        th.join()
-
-# 【修改】将 state_manager 传递下去
-def execute_schedule(schedule: dict, chart_root: str, state_manager: UpgradeStateManager):
-    # 【新增】在执行前，先将所有任务注册到状态管理器
-    for w in schedule.get("time_windows", []):
-        for t in w.get("tasks", []):
-            state_manager.register_task(t)
-            
-    threads = []
-    for w in schedule.get("time_windows", []):
-        th = Thread(target=run_window, args=(w, chart_root, state_manager))
-        th.start()
-        threads.append(th)
-    for th in threads:
-        th.join()
+    return ws, we
+
+class WindowExecutor:
+    def __init__(self,
+                 chart_root: str,
+                 state_manager: UpgradeStateManager,
+                 max_workers: int = 8,
+                 namespace_limits: Optional[Dict[str, int]] = None):
+        """
+        有界线程池执行器
+
+        时间窗和任务的开始时间都放在 engine.UpgradeEngine 的定时堆中，到点才释放；
+        到点的任务提交到 max_workers 个工作线程，命名空间达到并发上限时在该命名空间的队列中排队。
+        等待中的任务不占用线程，总线程数为 max_workers + 1。
+
+        :param chart_root: chart 根目录
+        :param state_manager: 状态管理器
+        :param max_workers: 工作线程数（同时进行的升级数上限）
+        :param namespace_limits: {命名空间: 并发上限}，未列出的命名空间只受 max_workers 限制
+        """
+        self.chart_root = chart_root
+        self.state_manager = state_manager
+        self.max_workers = max_workers
+        self.namespace_limits = namespace_limits or {}
+        self.engine = UpgradeEngine()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upgrade-worker")
+        self._lock = Lock()
+        self._all_done = Condition(self._lock)
+        self._outstanding = 0
+        self._running: Dict[str, int] = {}
+        self._queued: Dict[str, deque] = {}
+
+    def submit_schedule(self, schedule: dict) -> None:
+        """登记所有任务，并把每个时间窗的开始时间放入定时堆"""
+        windows = schedule.get("time_windows", [])
+        for w in windows:
+            for t in w.get("tasks", []):
+                t.setdefault("window_id", w.get("window_id"))  # 状态槽按时间窗区分同一服务的升级
+        self.state_manager.register_tasks(t for w in windows for t in w.get("tasks", []))
+        with self._lock:
+            self._outstanding += sum(len(w.get("tasks", [])) for w in windows)
+        submitted = datetime.now()
+        if rollout_watcher is not None:
+            for ns in {t.get("region", "default") for w in windows for t in w.get("tasks", [])}:
+                rollout_watcher.ensure_namespace(ns)
+        gap_start = submitted  # 第一个时间窗从现在开始预热，之后的时间窗从上一个时间窗结束开始
+        for w in sorted(windows, key=lambda w: window_bounds(w)[0]):
+            ws, we = window_bounds(w)
+            if warmup is not None and gap_start < ws:
+                self.engine.schedule(max(0.0, (gap_start - datetime.now()).total_seconds()), self._warm_window, w, ws)
+            self.engine.schedule(max(0.0, (ws - datetime.now()).total_seconds()), self._open_window, w, ws, we, submitted)
+            gap_start = max(gap_start, we)
+
+    def _warm_window(self, window: dict, ws: datetime) -> None:
+        """时间窗之间的间隔开始：在预热线程池中为下一个时间窗的任务做准备，到时间窗开始为止"""
+        tasks = window.get("tasks", [])
+        logging.info(f"时间窗 {window['window_id']} 开始预热 {len(tasks)} 个任务，距开始 {(ws - datetime.now()).total_seconds():.0f}s")
+        future = warmup.submit(tasks, ws.timestamp())
+        future.add_done_callback(lambda f, window_id=window['window_id']: self._warmed(f, window_id))
+
+    def _warmed(self, future, window_id) -> None:
+        if future.exception() is not None:
+            logging.error(f"时间窗 {window_id} 预热出错: {future.exception()}")
+        else:
+            logging.info(f"时间窗 {window_id} 预热结束: {future.result()}")
+
+    def _open_window(self, window: dict, ws: datetime, we: datetime, submitted: datetime) -> None:
+        """时间窗开始：按各任务的偏移把任务放入定时堆，同一服务串联的多跳作为一条链在第一跳的偏移处释放"""
+        tasks = window.get("tasks", [])
+        logging.info(f"时间窗 {window['window_id']} => 开始: {ws}, 结束: {we}, 时长: {(we - ws).total_seconds():.0f}s, 任务数: {len(tasks)}")
+        opened = datetime.now()
+        for chain in chain_hops(tasks):
+            t = chain[0]
+            start = ws + timedelta(seconds=t.get("timeline", {}).get("start", 0))
+            metrics.record("window_wait", max(0.0, (opened - submitted).total_seconds()),
+                           service=t.get("name"), namespace=t.get("region", "default"))
+            self.engine.schedule(max(0.0, (start - datetime.now()).total_seconds()), self._release, chain, we, opened)
+
+    def _release(self, chain: List[dict], we: datetime, opened: Optional[datetime] = None) -> None:
+        """链到达开始时间：命名空间未满则提交到线程池，否则排队"""
+        ns = chain[0].get("region", "default")
+        if opened is not None:
+            metrics.record("offset_sleep", (datetime.now() - opened).total_seconds(), service=chain[0].get("name"), namespace=ns)
+        with self._lock:
+            limit = self.namespace_limits.get(ns)
+            if limit is not None and self._running.get(ns, 0) >= limit:
+                self._queued.setdefault(ns, deque()).append((chain, we))
+                return
+            self._running[ns] = self._running.get(ns, 0) + 1
+        if not self._submit(chain, we, ns):
+            self._done(ns, len(chain))
+
+    def _submit(self, chain: List[dict], we: datetime, ns: str) -> bool:
+        """提交到线程池；时间窗已结束的链直接跳过，返回 False"""
+        if datetime.now() > we:
+            logging.info(f"当前时间已超出时间窗 {we}, 跳过 {chain[0].get('name')}")
+            return False
+        future = self.pool.submit(self._perform, chain, we, ns, time.perf_counter())
+        future.add_done_callback(lambda f, chain=chain, ns=ns: self._finished(f, chain, ns))
+        return True
+
+    def _perform(self, chain: List[dict], we: datetime, ns: str, submitted: float) -> None:
+        # 在命名空间队列或线程池中等待的时间
+        metrics.record("queue_wait", time.perf_counter() - submitted, service=chain[0].get("name"), namespace=ns)
+        # 多跳在同一个工作线程中依次执行，某一跳失败（已回滚）后其余跳的起点版本不存在，直接跳过
+        for k, task in enumerate(chain):
+            if not perform_task(task, self.chart_root, we, self.state_manager):
+                for skipped in chain[k + 1:]:
+                    ver = skipped.get("version", {})
+                    logging.warning(f"{skipped.get('name')} 前一跳失败, 跳过 {ver.get('from')} → {ver.get('to')}")
+                    metrics.inc("upgrade_tasks_total", outcome="skipped", namespace=ns)
+                return
+
+    def _finished(self, future, chain: List[dict], ns: str) -> None:
+        if future.exception() is not None:
+            logging.error(f"{chain[0].get('name')} 执行出错: {future.exception()}")
+        self._done(ns, len(chain))
+
+    def _done(self, ns: str, count: int = 1) -> None:
+        """一条链结束（或被跳过）：名额直接转给该命名空间排队中的下一条链"""
+        while True:
+            with self._lock:
+                self._outstanding -= count
+                queue = self._queued.get(ns)
+                if queue:
+                    chain, we = queue.popleft()
+                else:
+                    self._running[ns] -= 1
+                    chain = None
+                if self._outstanding == 0:
+                    self._all_done.notify_all()
+            if chain is None or self._submit(chain, we, ns):
+                return
+            count = len(chain)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """阻塞直到所有任务结束或被跳过"""
+        with self._lock:
+            return self._all_done.wait_for(lambda: self._outstanding == 0, timeout)
+
+    def shutdown(self) -> None:
+        self.engine.shutdown()
+        self.pool.shutdown(wait=True)
+
+# 【修改】按时间窗执行整个计划：不再每个时间窗、每个任务各开一个线程
+def execute_schedule(schedule: dict,
+                     chart_root: str,
+                     state_manager: UpgradeStateManager,
+                     max_workers: Optional[int] = None,
+                     namespace_limits: Optional[Dict[str, int]] = None):
+    """
+    :param max_workers: 工作线程数，默认取计划中的 parellel，没有时为 8
+    :param namespace_limits: {命名空间: 并发上限}
+    """
+    executor = WindowExecutor(chart_root, state_manager, max_workers or schedule.get("parellel", 8), namespace_limits)
+    executor.submit_schedule(schedule)
+    executor.wait()
+    executor.shutdown()
 
 # 日志设置函数保持不变
 def setup_logging(schedule_file: str): # ... (代码不变)
@@ -286,6 +638,53 @@ def setup_logging(schedule_file: str): # ... (代码不变)
         ]
     )
 
+# 【新增】API 服务：全量状态、?since= 增量和 Server-Sent Events 推送流
+def create_app(state_manager: UpgradeStateManager, registry: Optional[MetricsRegistry] = None) -> Flask:
+    app = Flask(__name__)
+
+    @app.route('/metrics')
+    def get_metrics():
+        # Prometheus 文本格式的各阶段耗时直方图
+        return Response((registry or metrics).render(), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/api/trace')
+    def get_trace():
+        # 最近的阶段追踪记录（JSONL）
+        lines = ''.join(json.dumps(e, ensure_ascii=False) + '\n' for e in (registry or metrics).trace())
+        return Response(lines, mimetype='application/x-ndjson')
+
+    @app.route('/api/upgrade_status')
+    def get_status():
+        # 带 ?since=<seq> 时只返回该序号之后变化的任务；不带参数时保持原来的全量格式
+        since = request.args.get('since', type=int)
+        if since is not None:
+            return jsonify(state_manager.get_changes(since))
+        # 这个API端点每次被请求时，都会调用状态管理器的翻译函数
+        data = state_manager.get_data_for_visualizer()
+        return jsonify(data)
+
+    @app.route('/api/upgrade_status/stream')
+    def stream_status():
+        # Server-Sent Events：连接后先推送 since 之后的全部变更，之后每有变更只推送变化的任务
+        since = request.args.get('since', type=int)
+        if since is None:
+            since = int(request.headers.get('Last-Event-ID', 0) or 0)
+
+        def events(since=since):
+            changes = state_manager.get_changes(since)
+            while True:
+                if changes["tasks"] or changes["reset"]:
+                    yield f"id: {changes['seq']}\nevent: delta\ndata: {json.dumps(changes, ensure_ascii=False)}\n\n"
+                else:
+                    yield ": keep-alive\n\n"  # 心跳，便于客户端发现断线
+                since = changes["seq"]
+                changes = state_manager.wait_for_changes(since, timeout=15)
+
+        return Response(events(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    return app
+
 # -------------------------------------------------------------------
 # 【修改】第3步：主程序，同时启动调度器和API服务器
 # -------------------------------------------------------------------
@@ -295,27 +694,58 @@ if __name__ == "__main__":
     parser.add_argument("--schedule", default="schedule3.json")
     parser.add_argument("--chart-root", default="/home/zuo/ServiceSim/src/chart/")
     parser.add_argument("--api-port", type=int, default=5001, help="API 服务器监听的端口")
+    parser.add_argument("--max-workers", type=int, default=None, help="同时进行的升级数上限，默认取计划中的 parellel")
+    parser.add_argument("--namespace-limit", action="append", default=[], metavar="NS=N",
+                        help="单个命名空间的并发上限，可重复指定")
+    parser.add_argument("--cluster-backend", default="auto", choices=["auto"] + list(CLUSTER_BACKENDS),
+                        help="集群客户端: kubernetes 为进程内 API 客户端, subprocess 为 helm/kubectl 子进程, fake 为本地模拟")
+    parser.add_argument("--cluster-cache-ttl", type=float, default=30.0,
+                        help="命名空间/pull secret/release/Deployment 查询结果的缓存秒数，0 表示不缓存")
+    parser.add_argument("--duration-model", default="duration_model.json",
+                        help="把每个任务在集群上的实际用时(秒)和结果计入该模型文件，供规划器使用，空字符串表示不记录；"
+                             "scheduler.py 的模拟用时另存于 duration_model_sim.json")
+    parser.add_argument("--trace-file", default=None, help="把每个阶段的耗时追加写入该 JSONL 文件")
+    parser.add_argument("--readiness", default="watch", choices=["watch", "poll"],
+                        help="watch: 所有任务共用每个命名空间一个 Deployment watch; poll: 每个任务等待预计时长后单独检查")
+    parser.add_argument("--no-warmup", action="store_true",
+                        help="关闭时间窗之间的预热（pull secret、chart 预渲染和镜像预拉取）")
+    parser.add_argument("--image-puller", default="auto", choices=["auto"] + list(PULLERS),
+                        help="预热阶段的镜像预拉取方式: kubectl 为每个镜像运行一个立即退出的 Pod, fake 为本地模拟, none 不预拉取; "
+                             "auto 在 fake 集群后端时为 fake，否则为 none")
+    parser.add_argument("--no-early-abort", action="store_true",
+                        help="关闭时间窗预算看门狗：等待就绪直到时间窗结束才回滚")
+    parser.add_argument("--rollback-margin", type=float, default=5.0,
+                        help="看门狗在回滚结束与时间窗结束之间保留的余量(秒)；该服务还没有实测回滚用时时，"
+                             "为预计完成时刻允许超出时间窗的秒数")
     args = parser.parse_args()
+    namespace_limits = {ns: int(n) for ns, n in (item.split("=", 1) for item in args.namespace_limit)}
     
     setup_logging(args.schedule)
+    if args.trace_file:
+        metrics = MetricsRegistry(trace_path=args.trace_file)
+    if args.duration_model:
+        duration_model = DurationModel(args.duration_model, unit="s")
+    if not args.no_early_abort:
+        watchdog = RolloutWatchdog(duration_model, margin=args.rollback_margin)
+    set_cluster_client(get_cluster_client(args.cluster_backend, args.cluster_cache_ttl), watch=args.readiness == "watch")
+    logging.info(f"集群后端: {cluster_client.name}, 就绪检查: {'watch' if rollout_watcher else 'poll'}")
+    if not args.no_warmup:
+        warmup = WarmupPipeline(cluster_client, args.chart_root, get_puller(args.image_puller, cluster_client),
+                                metrics=metrics)
     
     # 1. 创建一个全局共享的状态管理器实例
     state_manager = UpgradeStateManager()
 
     # 2. 创建 Flask app 和 API 端点
-    app = Flask(__name__)
-    @app.route('/api/upgrade_status')
-    def get_status():
-        # 这个API端点每次被请求时，都会调用状态管理器的翻译函数
-        data = state_manager.get_data_for_visualizer()
-        return jsonify(data)
+    app = create_app(state_manager)
 
     # 3. 将 Flask 服务器放在一个后台线程中运行
     def run_api_server():
         logging.info(f"API 服务器启动，监听在 http://0.0.0.0:{args.api_port}")
         # 使用 werkzeug 提供的服务器，并关闭其自身的日志，避免与主日志混淆
         from werkzeug.serving import run_simple
-        run_simple('0.0.0.0', args.api_port, app, log_startup=False)
+        # 推送流是长连接，需要多线程服务器
+        run_simple('0.0.0.0', args.api_port, app, log_startup=False, threaded=True)
 
     api_thread = Thread(target=run_api_server, daemon=True)
     api_thread.start()
@@ -327,9 +757,14 @@ if __name__ == "__main__":
             schedule_data = json.load(f)
         
         # 将状态管理器实例传入，开始执行！
-        execute_schedule(schedule_data.get("upgrade_schedule", {}), args.chart_root, state_manager)
+        execute_schedule(schedule_data.get("upgrade_schedule", {}), args.chart_root, state_manager,
+                         args.max_workers, namespace_limits)
+        if duration_model is not None:
+            duration_model.save()
         
         logging.info("所有调度任务已执行完毕。API 服务器将继续运行，按 Ctrl+C 退出。")
+        if isinstance(cluster_client, CachingClusterClient):
+            logging.info(f"集群缓存命中情况: {cluster_client.stats()}")
         # 让主线程保持存活，以便API可以继续服务
         while True:
             time.sleep(1)
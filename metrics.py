@@ -0,0 +1,179 @@
+# 升级各阶段的计时：按 服务/命名空间 统计直方图，输出 Prometheus 文本格式，并可导出 JSONL 追踪
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# 阶段耗时的桶上界(秒)，覆盖 kubectl patch 的几十毫秒到整个时间窗
+PHASE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+# 实际用时与计划用时之差(秒)，负数表示提前
+DEVIATION_BUCKETS = (-300, -60, -10, -1, 0, 1, 10, 60, 300)
+
+HELP = {
+    "upgrade_phase_seconds": "升级任务各阶段耗时",
+    "upgrade_duration_deviation_seconds": "实际升级用时与计划用时之差，负数表示提前",
+    "upgrade_tasks_total": "按结果统计的升级任务数",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)  # 非累积，输出时再累加
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self, trace_path: Optional[str] = None, trace_buffer: int = 10000):
+        """
+        线程安全的指标登记表
+
+        :param trace_path: 追加写入每个阶段追踪记录的 JSONL 文件，None 表示只保留在内存中
+        :param trace_buffer: 内存中保留的最近追踪记录数
+        """
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._buckets: Dict[str, Sequence[float]] = {"upgrade_duration_deviation_seconds": DEVIATION_BUCKETS}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._trace = deque(maxlen=trace_buffer)
+        self._trace_file = open(trace_path, 'a', encoding='utf-8') if trace_path else None
+
+    @staticmethod
+    def _labels(labels: dict) -> Labels:
+        return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """向直方图 name 记录一个观测值"""
+        key = self._labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram(self._buckets.get(name, PHASE_BUCKETS))
+            hist.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        key = self._labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def record(self, phase: str, seconds: float, ok: Optional[bool] = None, **labels) -> None:
+        """
+        记录一个已结束的阶段：计入 upgrade_phase_seconds 直方图并写入追踪
+
+        :param phase: 阶段名，如 helm_upgrade / rollout_check
+        :param ok: 阶段是否成功（不适用时为 None）
+        :param labels: service / namespace / task 等；task 只写入追踪，不作为直方图标签（避免标签基数过大）
+        """
+        task = labels.pop("task", None)
+        self.observe("upgrade_phase_seconds", seconds, phase=phase, **labels)
+        event = {"ts": time.time() - seconds, "phase": phase, "duration": round(seconds, 6), **labels}
+        if task is not None:
+            event["task"] = task
+        if ok is not None:
+            event["ok"] = ok
+        with self._lock:
+            self._trace.append(event)
+            if self._trace_file is not None:
+                self._trace_file.write(json.dumps(event, ensure_ascii=False) + '\n')
+                self._trace_file.flush()
+
+    @contextmanager
+    def span(self, phase: str, **labels) -> Iterator[dict]:
+        """
+        计时一个阶段::
+
+            with metrics.span("helm_upgrade", service=name, namespace=ns) as span:
+                ok, err = ...
+                span["ok"] = ok
+
+        :return: 可写入 ok 的字典
+        """
+        info = {}
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            self.record(phase, time.perf_counter() - start, info.get("ok"), **labels)
+
+    def trace(self) -> List[dict]:
+        """内存中保留的最近追踪记录"""
+        with self._lock:
+            return list(self._trace)
+
+    def export_trace(self, path: str) -> str:
+        """把内存中的追踪记录写成 JSONL 文件"""
+        events = self.trace()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(e, ensure_ascii=False) + '\n' for e in events))
+        return path
+
+    def render(self) -> str:
+        """Prometheus 文本格式 (text/plain; version=0.0.4)"""
+        def fmt(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = labels + extra
+            if not pairs:
+                return ""
+            escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, hist in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{fmt(labels, (('le', f'{bound:g}'),))} {cumulative}")
+                    lines.append(f"{name}_bucket{fmt(labels, (('le', '+Inf'),))} {hist.count}")
+                    lines.append(f"{name}_sum{fmt(labels)} {hist.sum:.6f}")
+                    lines.append(f"{name}_count{fmt(labels)} {hist.count}")
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{fmt(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def close(self) -> None:
+        with self._lock:
+            if self._trace_file is not None:
+                self._trace_file.close()
+                self._trace_file = None
+
+
+_default_registry: Optional[MetricsRegistry] = None
+_default_lock = threading.Lock()
+
+
+def default_registry() -> MetricsRegistry:
+    """进程内共享的指标登记表"""
+    global _default_registry
+    with _default_lock:
+        if _default_registry is None:
+            _default_registry = MetricsRegistry()
+        return _default_registry
+
+
+def set_default_registry(registry: MetricsRegistry) -> None:
+    global _default_registry
+    with _default_lock:
+        _default_registry = registry
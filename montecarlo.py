@@ -0,0 +1,129 @@
+# 并行蒙特卡洛评估：在多个 CPU 核上独立模拟同一策略/计划 N 次，并汇总分位数报告
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+from simulator import Simulator
+
+METRICS = ("completion_time", "windows_used", "upgrades", "rollbacks", "final_index")
+
+# 工作进程内的模拟器，由 _init_worker 创建一次后被该进程的所有任务复用
+_simulator: Optional[Simulator] = None
+_plan: Optional[List[List[dict]]] = None
+
+
+def _init_worker(data: dict, policy: dict, plan: Optional[List[List[dict]]]) -> None:
+    global _simulator, _plan
+    _simulator = Simulator(data, **policy)
+    _plan = plan
+
+
+def _run_chunk(seed_start: int, count: int) -> List[dict]:
+    results = []
+    for seed in range(seed_start, seed_start + count):
+        r = _simulator.run_plan(_plan, seed) if _plan is not None else _simulator.run(seed)
+        results.append({k: r[k] for k in METRICS})  # 不回传 final_versions，减少进程间传输
+    return results
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """线性插值分位数，q 取 0~100"""
+    ordered = sorted(values)
+    if not ordered:
+        return float('nan')
+    pos = (len(ordered) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def summarize(results: List[dict], quantiles: Sequence[float] = (50, 90, 99)) -> Dict[str, dict]:
+    """
+    汇总各指标的均值与分位数
+
+    completion_time 只统计在 T_max 内完成的运行，另给出完成率 finish_rate。
+    """
+    report = {}
+    for metric in METRICS:
+        values = [r[metric] for r in results if r[metric] is not None]
+        entry = {"mean": sum(values) / len(values) if values else float('nan')}
+        for q in quantiles:
+            entry[f"p{q:g}"] = percentile(values, q)
+        entry["min"] = min(values) if values else float('nan')
+        entry["max"] = max(values) if values else float('nan')
+        report[metric] = entry
+    report["finish_rate"] = sum(r["completion_time"] is not None for r in results) / len(results) if results else 0.0
+    return report
+
+
+def evaluate(data: dict,
+             runs: int,
+             policy: Optional[dict] = None,
+             plan: Optional[List[List[dict]]] = None,
+             workers: Optional[int] = None,
+             seed: int = 0,
+             chunks_per_worker: int = 4) -> Dict[str, dict]:
+    """
+    用进程池并行运行 runs 次独立模拟
+
+    :param data: 配置（即 data copy.json 的内容）
+    :param runs: 模拟次数
+    :param policy: Simulator 的参数，如 {"solver": "heuristic", "success_prob": 0.8, "duration_sigma": 0.2}
+    :param plan: 给定时评估该固定计划（HorizonPlanner.plan() 的输出），否则评估在线策略
+    :param workers: 进程数，默认 CPU 核数
+    :param seed: 第 i 次运行使用种子 seed + i，结果与进程数无关
+    :param chunks_per_worker: 每个进程分到的任务块数，用于负载均衡
+    :return: summarize() 的报告，另含 runs、workers、elapsed
+    """
+    policy = policy or {}
+    workers = workers or os.cpu_count() or 1
+    n_chunks = max(1, min(runs, workers * chunks_per_worker))
+    sizes = [runs // n_chunks + (i < runs % n_chunks) for i in range(n_chunks)]
+    starts = [seed + sum(sizes[:i]) for i in range(n_chunks)]
+
+    t0 = time.perf_counter()
+    results = []
+    if workers == 1:
+        _init_worker(data, policy, plan)
+        for start, size in zip(starts, sizes):
+            results.extend(_run_chunk(start, size))
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(data, policy, plan)) as pool:
+            for chunk in pool.map(_run_chunk, starts, sizes):
+                results.extend(chunk)
+    report = summarize(results)
+    report.update(runs=runs, workers=workers, elapsed=time.perf_counter() - t0)
+    return report
+
+
+def format_report(report: Dict[str, dict]) -> str:
+    lines = [f"{report['runs']} 次模拟, {report['workers']} 个进程, 用时 {report['elapsed']:.2f}s "
+             f"({report['runs'] / report['elapsed']:.0f} 次/秒), 完成率 {report['finish_rate']:.1%}"]
+    for metric in METRICS:
+        entry = report[metric]
+        lines.append(f"  {metric:<16}" + "  ".join(f"{k}={v:.2f}" for k, v in entry.items()))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="并行蒙特卡洛评估调度策略或固定计划")
+    parser.add_argument("--data", default="data copy.json")
+    parser.add_argument("--runs", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--solver", default="heuristic")
+    parser.add_argument("--success-prob", type=float, default=0.5)
+    parser.add_argument("--sigma", type=float, default=0.0)
+    parser.add_argument("--plan", action="store_true", help="评估 planner.py 生成的固定计划而非在线策略")
+    args = parser.parse_args()
+
+    with open(args.data, 'r') as f:
+        data = json.load(f)
+    plan = None
+    if args.plan:
+        from planner import HorizonPlanner
+        plan = HorizonPlanner(data).plan()
+    policy = {"solver": args.solver, "success_prob": args.success_prob, "duration_sigma": args.sigma}
+    print(format_report(evaluate(data, args.runs, policy, plan, args.workers, args.seed)))
@@ -1,10 +1,13 @@
-from gurobipy import Model, GRB, quicksum
+try:
+    from gurobipy import Model, GRB, quicksum
+except ImportError:  # 未安装 gurobipy 时仍可使用 cbc / heuristic 求解器
+    Model = GRB = quicksum = None
 import json
-import matplotlib.pyplot as plt
-from upgrader import AppUpgrader
-from visualizer import AppUpgradeVisualizer
-import time
 from copy import deepcopy
+from catalog import VersionCatalog
+from solvers import UpgradeProblem, get_solver
+from packing import pack_window, get_packer
+from result_cache import ResultCache, fingerprint, state_key, duration_bucket, floor_bucket
 
 # Load data
 with open('data copy.json', 'r') as f:
@@ -16,79 +19,322 @@ data1 = deepcopy(data)  # 使用 deepcopy 确保不会修改原始数据
 services = list(data['available_versions'].keys())
 available_versions = data1['available_versions']
 parellel = data['parellel']
+maxspan = data.get('maxspan', 2)  # 每次升级最多跨越的版本数
 
 incompatible_pairs = data['incompatible_pairs']
 upgrade_duration = data['upgrade_duration']
 
+# 编译后的版本目录：版本下标表与不兼容哈希索引
+catalog = VersionCatalog(data['available_versions'], incompatible_pairs)
+
 # 版本索引函数
 def version_index(s, v):
-    return available_versions[s].index(v)
+    return catalog.index(s, v)
+
+def catalog_for(pairs):
+    """传入的不兼容对与加载的数据不同时，重新编译目录"""
+    if pairs is incompatible_pairs:
+        return catalog
+    return VersionCatalog(data['available_versions'], pairs)
 
 # 升级函数，返回升级服务和目标版本，以及所有候选服务
-def optimize(available_versions, incompatible_pairs, upgrade_duration, rest_time):
+def optimize(available_versions, incompatible_pairs, upgrade_duration, rest_time, solver="auto", running=None):
+    """
+    :param solver: 求解器名称（gurobi / cbc / heuristic / auto）或 solvers.Solver 实例
+    :param running: 正在进行的升级 {服务: 目标版本}，这些服务占用的并行名额不再分配，新选的升级须与它们兼容
+    """
+    catalog = catalog_for(incompatible_pairs)
     current_versions = {s: available_versions[s][0] for s in services}  # Current version is the lowest
-    # 当前版本索引
-    current_idx = {s: version_index(s, current_versions[s]) for s in services}
-    m = Model("Next_Batch_Upgrade_Candidates")
-    # 决策变量：x[s, v] 表示是否选择将 s 升级到 v
-    x = {}
-    for s in services:
-        for v in available_versions[s]:
-            v_idx = version_index(s, v)
-            # 仅当升级时长小于 rest_time 且版本索引满足条件时，添加决策变量
-            if v_idx > current_idx[s] and v_idx <= current_idx[s] + 2 and upgrade_duration[s] < rest_time:
-                x[s, v] = m.addVar(vtype=GRB.BINARY, name=f"x_{s}_{v}")
-
-    # 辅助变量：表示服务 s 是否被选择升级
-    selected = {s: m.addVar(vtype=GRB.BINARY, name=f"selected_{s}") for s in services}
-
-    # 约束
-    # 1. 每个服务至多选择一个目标版本
-    for s in services:
-        possible_v = [v for v in available_versions[s] if version_index(s, v) > current_idx[s] and version_index(s, v) <= current_idx[s] + 2]
-        m.addConstr(quicksum(x[s, v] for v in possible_v if (s, v) in x) <= 1)
-        m.addConstr(selected[s] == quicksum(x[s, v] for v in possible_v if (s, v) in x))
-
-    # 2. 不兼容约束
-    for s1, v1, s2, v2 in incompatible_pairs:
-        # Post-upgrade compatibility: Target versions in the candidate set must not be incompatible
-        if (s1, v1) in x and (s2, v2) in x:
-            m.addConstr(x[s1, v1] + x[s2, v2] <= 1)
-        # Mixed state compatibility: Target version vs. current version of non-upgraded service
-        if (s1, v1) in x and s2 in services and v2 == current_versions[s2]:
-            m.addConstr(x[s1, v1] + selected[s2] <= 1)
-        if (s2, v2) in x and s1 in services and v1 == current_versions[s1]:
-            m.addConstr(x[s2, v2] + selected[s1] <= 1)
-        # Upgrade process compatibility: Current versions of selected services must be compatible
-        if v1 == current_versions[s1] and v2 == current_versions[s2]:
-            m.addConstr(selected[s1] + selected[s2] <= 1)
-
-    # 目标：最大化升级后版本索引的和
-    m.setObjective(quicksum(version_index(s, v) * x[s, v] for s in services for v in available_versions[s] if (s, v) in x), GRB.MAXIMIZE)
+    running = running or {}
+    problem = UpgradeProblem(catalog, current_versions, upgrade_duration, rest_time, maxspan, running)
+    if isinstance(solver, str):
+        solver = get_solver(solver)
+    result = solver.solve(problem)
 
-    m.optimize()
-
-
-    if m.status == GRB.OPTIMAL:
+    upgrade_candidates = {}
+    if result.status != "infeasible":
         print("候选升级服务及其目标版本（可任意选择组合）：")
-        upgrade_candidates = {}
-        for s in services:
-            for v in available_versions[s]:
-                if (s, v) in x and x[s, v].X > 0.5:
-                    upgrade_candidates[s] = v
-                    print(f"{s}: {current_versions[s]} -> {v}")
+        upgrade_candidates = result.candidates
+        for s, v in upgrade_candidates.items():
+            print(f"{s}: {current_versions[s]} -> {v}")
         if not upgrade_candidates:
             print("未找到可升级的候选服务")
+        if result.gap is not None and result.status != "optimal":
+            print(f"求解器 {result.backend}: 目标值 {result.objective}, 上界 {result.bound}, 最优性间隙 {result.gap:.2%}")
     else:
         print("未找到可行解")
 
-    # 获取候选升级服务
-    upgrade_candidates = {}
-    if m.status == GRB.OPTIMAL:
-        for s in services:
-            for v in available_versions[s]:
-                if (s, v) in x and x[s, v].X > 0.5:
+    # 选择升级时间最长的3个服务
+    free = max(0, min(parellel, len(available_versions)) - len(running))
+    return(sorted(upgrade_candidates.keys(), key=lambda s: upgrade_duration[s], reverse=True)[:free], upgrade_candidates)
+
+
+class SolverOptimizer:
+    """
+    与 IncrementalOptimizer 接口相同的无状态优化器，每轮通过 solvers 中的后端求解
+
+    :param solver: 求解器名称或 solvers.Solver 实例
+    """
+    def __init__(self, available_versions, incompatible_pairs, upgrade_duration, solver="auto"):
+        self.available_versions = available_versions
+        self.incompatible_pairs = incompatible_pairs
+        self.upgrade_duration = upgrade_duration
+        self.solver = get_solver(solver) if isinstance(solver, str) else solver
+
+    def optimize(self, rest_time, running=None):
+        return optimize(self.available_versions, self.incompatible_pairs, self.upgrade_duration, rest_time, self.solver,
+                        running)
+
+
+def optimize_packed(available_versions, incompatible_pairs, upgrade_duration, rest_time, solver="auto", lanes=parellel,
+                    running=None):
+    """
+    装箱模式：在 lanes 条通道上安排升级及其开始偏移，每条通道可顺序执行多个升级，尽量填满剩余时间
+
+    :param solver: 装箱求解器名称（gurobi / cbc / heuristic / auto）或 packing.Packer 实例
+    :param running: 正在进行的升级 {服务: 目标版本}，每个占用一条通道
+    :return: (按开始偏移排序的服务列表, {服务: 目标版本}, [{service, from, to, lane, start, end}, ...])
+    """
+    catalog = catalog_for(incompatible_pairs)
+    current_versions = {s: available_versions[s][0] for s in services}
+    running = running or {}
+    problem = UpgradeProblem(catalog, current_versions, upgrade_duration, rest_time, maxspan, running)
+    result = pack_window(problem, upgrade_duration, max(0, lanes - len(running)), rest_time, solver)
+    if result.tasks:
+        print(f"装箱结果（{result.backend}，通道占用率 {result.utilization:.0%}）：")
+        for t in result.tasks:
+            print(f"通道 {t['lane']} [{t['start']:.1f}, {t['end']:.1f}] {t['service']}: {t['from']} -> {t['to']}")
+    else:
+        print("未找到可升级的候选服务")
+    return [t["service"] for t in result.tasks], result.candidates, result.tasks
+
+
+class PackingOptimizer:
+    """
+    装箱模式的优化器，optimize() 的返回值与其他优化器相同，本轮各服务的开始偏移保存在 tasks 中
+
+    :param solver: 装箱求解器名称或 packing.Packer 实例
+    """
+    def __init__(self, available_versions, incompatible_pairs, upgrade_duration, solver="auto", lanes=parellel):
+        self.available_versions = available_versions
+        self.incompatible_pairs = incompatible_pairs
+        self.upgrade_duration = upgrade_duration
+        self.lanes = lanes
+        self.packer = get_packer(solver) if isinstance(solver, str) else solver
+        self.tasks = []
+
+    def optimize(self, rest_time, running=None):
+        selected, candidates, self.tasks = optimize_packed(self.available_versions, self.incompatible_pairs,
+                                                           self.upgrade_duration, rest_time, self.packer, self.lanes,
+                                                           running)
+        return selected, candidates
+
+
+class CachedOptimizer:
+    """
+    为任意优化器加上结果缓存，optimize() 的返回值不变
+
+    键为 问题指纹 + 当前版本向量 + 剩余时间桶。指纹在每次查询时按 incompatible_pairs 和 upgrade_duration
+    的当前内容计算（用时表可能在两轮之间被原地更新），参数变化后不会命中旧结果。
+    选择模式下剩余时间按用时阈值分桶，结果与直接求解完全相同；装箱模式下向下取整到 granularity，
+    并按桶的下界求解，保证缓存的结果在桶内任意剩余时间下都放得下。
+
+    :param inner: SolverOptimizer / IncrementalOptimizer / PackingOptimizer
+    :param cache: result_cache.ResultCache
+    :param granularity: 装箱模式的剩余时间桶宽
+    """
+    def __init__(self, inner, cache: ResultCache, granularity: float = 1.0):
+        self.inner = inner
+        self.cache = cache
+        self.granularity = granularity
+        self.tasks = []
+
+    def optimize(self, rest_time, running=None):
+        inner = self.inner
+        current = {s: vs[0] for s, vs in inner.available_versions.items()}
+        backend = getattr(getattr(inner, "solver", None) or getattr(inner, "packer", None), "name", None)
+        if isinstance(inner, PackingOptimizer):
+            bucket, rest_time = floor_bucket(rest_time, self.granularity)
+            lanes = inner.lanes
+        else:
+            bucket = duration_bucket(rest_time, inner.upgrade_duration)
+            lanes = getattr(inner, "parellel", parellel)
+        fp = fingerprint(inner.incompatible_pairs, inner.upgrade_duration, catalog_for(inner.incompatible_pairs).versions,
+                         optimizer=type(inner).__name__, backend=backend, lanes=lanes, span=maxspan)
+        if running:
+            bucket = f"{bucket}-{state_key(running)[:12]}"
+        key = ResultCache.key(fp, current, bucket)
+        cached = self.cache.get(key)
+        if cached is not None:
+            print("命中优化结果缓存：", ", ".join(f"{s} -> {v}" for s, v in cached["candidates"].items()) or "无候选")
+            self.tasks = [dict(t) for t in cached["tasks"]]
+            return list(cached["selected"]), dict(cached["candidates"])
+        selected, candidates = inner.optimize(rest_time, running)
+        self.tasks = getattr(inner, "tasks", [])
+        self.cache.put(key, {"selected": list(selected), "candidates": dict(candidates),
+                             "tasks": [dict(t) for t in self.tasks]})
+        return selected, candidates
+
+
+def make_optimizer(available_versions, incompatible_pairs, upgrade_duration, solver="auto", mode="select",
+                   cache: ResultCache = None):
+    """
+    按求解器选择优化器：Gurobi 可用时使用常驻增量模型，否则使用其他后端
+
+    :param solver: gurobi / cbc / heuristic / auto
+    :param mode: select 为每轮选出至多 parellel 个同时开始的升级；pack 为按通道装箱并给出开始偏移
+    :param cache: 给定时用 CachedOptimizer 包装，相同状态不再重复求解
+    """
+    if mode == "pack":
+        optimizer = PackingOptimizer(available_versions, incompatible_pairs, upgrade_duration, solver)
+    elif solver in ("gurobi", "auto") and Model is not None:
+        optimizer = IncrementalOptimizer(available_versions, incompatible_pairs, upgrade_duration)
+    else:
+        optimizer = SolverOptimizer(available_versions, incompatible_pairs, upgrade_duration, solver)
+    return CachedOptimizer(optimizer, cache) if cache is not None else optimizer
+
+
+class IncrementalOptimizer:
+    """
+    常驻的增量优化器：Gurobi 模型在多轮调度之间保持存活。
+
+    每轮只对当前版本发生变化的服务删除/重建其 x[s, v] 变量和相关不兼容约束，
+    rest_time 过滤通过变量上界实现，并用上一轮的解作为热启动。
+
+    :param available_versions: 各组件可用版本 {组件: [当前版本, ...]}（与 AppUpgrader 共享同一个字典）
+    :param incompatible_pairs: 不兼容版本对 [[s1, v1, s2, v2], ...]
+    :param upgrade_duration: 各组件升级所需时间
+    :param parellel: 每批最多并行升级的组件数
+    :param catalog: 编译后的版本目录，默认由加载的数据和 incompatible_pairs 生成
+    """
+    def __init__(self, available_versions, incompatible_pairs, upgrade_duration, parellel=parellel, catalog=None):
+        if Model is None:
+            raise ImportError("IncrementalOptimizer 需要 gurobipy")
+        self.available_versions = available_versions
+        self.catalog = catalog or catalog_for(incompatible_pairs)
+        self.incompatible_pairs = incompatible_pairs
+        self.upgrade_duration = upgrade_duration
+        self.parellel = parellel
+        self.services = list(available_versions.keys())
+
+        # 每个服务参与的不兼容对下标，增量更新时只需处理这些对
+        self.pairs_of = {s: [] for s in self.services}
+        for i, (s1, v1, s2, v2) in enumerate(incompatible_pairs):
+            if s1 in self.pairs_of:
+                self.pairs_of[s1].append(i)
+            if s2 in self.pairs_of and s2 != s1:
+                self.pairs_of[s2].append(i)
+
+        self.m = Model("Next_Batch_Upgrade_Candidates")
+        self.m.ModelSense = GRB.MAXIMIZE
+        self.current_versions = {}
+        self.x = {}
+        self.x_of = {s: [] for s in self.services}       # 服务 -> 其 x 变量键
+        self.service_constrs = {s: [] for s in self.services}
+        self.pair_constrs = {}                             # 不兼容对下标 -> 约束列表
+        self.last_solution = {}                            # (s, v) -> 上一轮取值
+        self.selected = {s: self.m.addVar(vtype=GRB.BINARY, name=f"selected_{s}") for s in self.services}
+
+        for s in self.services:
+            self._add_service(s)
+        for i in range(len(incompatible_pairs)):
+            self._add_pair(i)
+
+    def _add_service(self, s):
+        """为服务 s 按其当前版本添加决策变量和约束 1"""
+        self.current_versions[s] = self.available_versions[s][0]
+        # 目标系数为跨越的版本数（即截断后版本列表中的下标），与原模型相同
+        current_idx = self.catalog.index(s, self.current_versions[s])
+        for v, v_idx in self.catalog.candidates(s, self.current_versions[s], maxspan):
+            self.x[s, v] = self.m.addVar(vtype=GRB.BINARY, obj=v_idx - current_idx, name=f"x_{s}_{v}")
+            self.x_of[s].append((s, v))
+        xs = [self.x[k] for k in self.x_of[s]]
+        self.service_constrs[s] = [
+            self.m.addConstr(quicksum(xs) <= 1),
+            self.m.addConstr(self.selected[s] == quicksum(xs)),
+        ]
+
+    def _remove_service(self, s):
+        """删除服务 s 的决策变量和约束 1"""
+        for c in self.service_constrs[s]:
+            self.m.remove(c)
+        self.service_constrs[s] = []
+        for k in self.x_of[s]:
+            self.m.remove(self.x.pop(k))
+            self.last_solution.pop(k, None)
+        self.x_of[s] = []
+
+    def _add_pair(self, i):
+        """按当前版本为第 i 个不兼容对添加约束 2"""
+        s1, v1, s2, v2 = self.incompatible_pairs[i]
+        x, selected, current_versions = self.x, self.selected, self.current_versions
+        constrs = []
+        if (s1, v1) in x and (s2, v2) in x:
+            constrs.append(self.m.addConstr(x[s1, v1] + x[s2, v2] <= 1))
+        if (s1, v1) in x and s2 in selected and v2 == current_versions[s2]:
+            constrs.append(self.m.addConstr(x[s1, v1] + selected[s2] <= 1))
+        if (s2, v2) in x and s1 in selected and v1 == current_versions[s1]:
+            constrs.append(self.m.addConstr(x[s2, v2] + selected[s1] <= 1))
+        if s1 in selected and s2 in selected and v1 == current_versions[s1] and v2 == current_versions[s2]:
+            constrs.append(self.m.addConstr(selected[s1] + selected[s2] <= 1))
+        self.pair_constrs[i] = constrs
+
+    def _remove_pair(self, i):
+        for c in self.pair_constrs.pop(i, []):
+            self.m.remove(c)
+
+    def sync(self):
+        """
+        将模型与 available_versions 同步，仅重建当前版本发生变化的服务
+
+        :return: 被重建的服务列表
+        """
+        changed = [s for s in self.services if self.available_versions[s][0] != self.current_versions[s]]
+        if not changed:
+            return changed
+        pairs = sorted({i for s in changed for i in self.pairs_of[s]})
+        for i in pairs:
+            self._remove_pair(i)
+        for s in changed:
+            self._remove_service(s)
+            self._add_service(s)
+        for i in pairs:
+            self._add_pair(i)
+        return changed
+
+    def optimize(self, rest_time, running=None):
+        """
+        求解下一批升级候选，返回值与 optimize() 相同
+
+        :param rest_time: 当前时间窗剩余时间
+        :param running: 正在进行的升级 {服务: 目标版本}
+        :return: (按升级时长选出的至多 parellel 个服务, {服务: 目标版本})
+        """
+        self.sync()
+        self.m.update()
+        running = running or {}
+        in_flight = {r: (self.current_versions[r], t) for r, t in running.items()}
+        for (s, v), var in self.x.items():
+            # 升级时长不小于剩余时间、正在升级或与进行中的升级不兼容的候选项通过上界置 0 排除，避免增删变量
+            allowed = (self.upgrade_duration[s] < rest_time and s not in in_flight
+                       and not (in_flight and self.catalog.clashes(s, self.current_versions[s], v, in_flight)))
+            var.UB = 1.0 if allowed else 0.0
+            # 热启动：沿用上一轮的解，新加入的变量从 0 开始
+            var.Start = self.last_solution.get((s, v), 0.0) if var.UB > 0 else 0.0
+        self.m.optimize()
+
+        upgrade_candidates = {}
+        if self.m.status == GRB.OPTIMAL:
+            self.last_solution = {k: var.X for k, var in self.x.items()}
+            print("候选升级服务及其目标版本（可任意选择组合）：")
+            for (s, v), value in self.last_solution.items():
+                if value > 0.5:
                     upgrade_candidates[s] = v
+                    print(f"{s}: {self.current_versions[s]} -> {v}")
+            if not upgrade_candidates:
+                print("未找到可升级的候选服务")
+        else:
+            print("未找到可行解")
 
-    # 选择升级时间最长的3个服务
-    return(sorted(upgrade_candidates.keys(), key=lambda s: upgrade_duration[s], reverse=True)[:min(parellel, len(available_versions))], upgrade_candidates)
\ No newline at end of file
+        free = max(0, min(self.parellel, len(self.available_versions)) - len(running))
+        return(sorted(upgrade_candidates.keys(), key=lambda s: self.upgrade_duration[s], reverse=True)[:free], upgrade_candidates)
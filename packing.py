@@ -0,0 +1,306 @@
+# 时间窗装箱：在 parellel 条并行通道上安排升级及其窗内开始偏移，每条通道可顺序执行多个升级，尽量填满时间窗
+import math
+import time
+from typing import Dict, List, Optional
+from solvers import UpgradeProblem
+
+
+class PackingProblem:
+    def __init__(self,
+                 problem: UpgradeProblem,
+                 upgrade_duration: Dict[str, float],
+                 lanes: int,
+                 capacity: float):
+        """
+        带通道容量的升级选择问题
+
+        在 UpgradeProblem 的冲突图上选择独立集（每个服务至多一个目标版本），并把选中的升级分配到
+        lanes 条通道上，每条通道内顺序执行、总时长不超过 capacity。目标为版本前进的总跳数
+        （即升级后版本索引之和），相同时优先占用更多窗内时间。
+
+        :param problem: 候选项与冲突边
+        :param upgrade_duration: 各服务升级所需时间
+        :param lanes: 并行通道数（parellel）
+        :param capacity: 每条通道可用时间（时间窗剩余时间）
+        """
+        self.problem = problem
+        self.lanes = lanes
+        self.capacity = capacity
+        current = problem.current_versions
+        catalog = problem.catalog
+        self.durations = [upgrade_duration[s] for s, _ in problem.items]
+        self.gains = [catalog.index(s, v) - catalog.index(s, current[s]) for s, v in problem.items]
+        # 填充度只用于打破平局：总时长带来的加分小于 1 跳
+        self.fill_weight = 1.0 / (1.0 + sum(self.durations))
+
+    def value(self, i: int) -> float:
+        return self.gains[i] + self.fill_weight * self.durations[i]
+
+    def trivial_bound(self) -> float:
+        """不考虑冲突和通道容量的上界：每个服务取收益最大的候选项"""
+        best = [max(self.gains[i] for i in idx) for idx in self.problem.groups.values()]
+        return float(sum(best))
+
+
+class PackingResult:
+    def __init__(self, backend: str, status: str, tasks: List[dict], objective: float,
+                 bound: Optional[float], capacity: float, lanes: int, solve_time: float):
+        """
+        装箱结果
+
+        :param tasks: [{service, from, to, lane, start, end}, ...]，与 planner.HorizonPlanner.plan() 中的任务格式相同
+        :param objective: 版本前进的总跳数
+        """
+        self.backend = backend
+        self.status = status
+        self.tasks = tasks
+        self.objective = objective
+        self.bound = bound
+        self.capacity = capacity
+        self.lanes = lanes
+        self.solve_time = solve_time
+
+    @property
+    def candidates(self) -> Dict[str, str]:
+        return {t["service"]: t["to"] for t in self.tasks}
+
+    @property
+    def utilization(self) -> float:
+        """通道时间占用率"""
+        total = self.capacity * self.lanes
+        return sum(t["end"] - t["start"] for t in self.tasks) / total if total > 0 else 0.0
+
+    @property
+    def makespan(self) -> float:
+        return max((t["end"] for t in self.tasks), default=0.0)
+
+    def __repr__(self):
+        return (f"PackingResult({self.backend}, {self.status}, obj={self.objective}, bound={self.bound}, "
+                f"tasks={len(self.tasks)}, util={self.utilization:.1%}, {self.solve_time * 1e3:.3f}ms)")
+
+
+class Packer:
+    """装箱求解器接口"""
+    name = "base"
+
+    def pack(self, problem: PackingProblem) -> PackingResult:
+        raise NotImplementedError
+
+    def _result(self, problem: PackingProblem, status: str, assignment: Dict[int, int],
+                bound: Optional[float], start: float) -> PackingResult:
+        """assignment: {候选项: 通道}；通道内按时长从长到短依次排开"""
+        items = problem.problem.items
+        current = problem.problem.current_versions
+        tasks = []
+        for lane in range(problem.lanes):
+            offset = 0.0
+            for i in sorted((i for i, l in assignment.items() if l == lane), key=lambda i: -problem.durations[i]):
+                s, v = items[i]
+                tasks.append({"service": s, "from": current[s], "to": v, "lane": lane,
+                              "start": offset, "end": offset + problem.durations[i]})
+                offset += problem.durations[i]
+        tasks.sort(key=lambda t: (t["start"], t["lane"]))
+        objective = sum(problem.gains[i] for i in assignment)
+        return PackingResult(self.name, status, tasks, objective, bound, problem.capacity, problem.lanes,
+                             time.perf_counter() - start)
+
+
+class GurobiPacker(Packer):
+    name = "gurobi"
+
+    def __init__(self, output_flag: int = 0):
+        from gurobipy import Model  # noqa: F401 需要 gurobipy 及许可证
+        self.output_flag = output_flag
+
+    def pack(self, problem):
+        from gurobipy import Model, GRB, quicksum
+        start = time.perf_counter()
+        p, L = problem.problem, range(problem.lanes)
+        m = Model("Window_Packing")
+        m.Params.OutputFlag = self.output_flag
+        x = {(i, l): m.addVar(vtype=GRB.BINARY, obj=problem.value(i)) for i in range(len(p.items)) for l in L}
+        for idx in p.groups.values():
+            m.addConstr(quicksum(x[i, l] for i in idx for l in L) <= 1)
+        for i, j in p.edges():
+            m.addConstr(quicksum(x[i, l] + x[j, l] for l in L) <= 1)
+        for l in L:
+            m.addConstr(quicksum(problem.durations[i] * x[i, l] for i in range(len(p.items))) <= problem.capacity)
+        m.ModelSense = GRB.MAXIMIZE
+        m.optimize()
+        if m.status != GRB.OPTIMAL:
+            return self._result(problem, "infeasible", {}, None, start)
+        assignment = {i: l for (i, l), var in x.items() if var.X > 0.5}
+        # ObjBound 含填充度加分，而目标值只计跳数：跳数为整数且填充度加分总和小于 1，向下取整即为跳数的上界
+        return self._result(problem, "optimal", assignment, float(math.floor(m.ObjBound + 1e-6)), start)
+
+
+class PulpPacker(Packer):
+    name = "cbc"
+
+    def __init__(self, msg: bool = False):
+        import pulp  # noqa: F401
+        self.msg = msg
+
+    def pack(self, problem):
+        import pulp
+        start = time.perf_counter()
+        p, L = problem.problem, range(problem.lanes)
+        if not p.items:
+            return self._result(problem, "optimal", {}, 0.0, start)
+        m = pulp.LpProblem("Window_Packing", pulp.LpMaximize)
+        x = {(i, l): pulp.LpVariable(f"x_{i}_{l}", cat=pulp.LpBinary) for i in range(len(p.items)) for l in L}
+        m += pulp.lpSum(problem.value(i) * var for (i, _), var in x.items())
+        for idx in p.groups.values():
+            m += pulp.lpSum(x[i, l] for i in idx for l in L) <= 1
+        for i, j in p.edges():
+            m += pulp.lpSum(x[i, l] + x[j, l] for l in L) <= 1
+        for l in L:
+            m += pulp.lpSum(problem.durations[i] * x[i, l] for i in range(len(p.items))) <= problem.capacity
+        m.solve(pulp.PULP_CBC_CMD(msg=self.msg))
+        if pulp.LpStatus[m.status] != "Optimal":
+            return self._result(problem, "infeasible", {}, None, start)
+        assignment = {i: l for (i, l), var in x.items() if (var.value() or 0) > 0.5}
+        return self._result(problem, "optimal", assignment, problem.trivial_bound(), start)
+
+
+class HeuristicPacker(Packer):
+    """
+    无需求解器的贪心 + 局部搜索
+
+    先按 收益/时长 从高到低依次加入（每次按最长优先重排全部通道），再反复尝试把一个未选候选项换入：
+    移除与它冲突的已选项和同服务的其他版本，仍放不下时按收益密度从低到高移除已选项腾出空间，
+    再补入还能放下的候选项，总价值提高即接受。
+    """
+    name = "heuristic"
+
+    def __init__(self, max_rounds: int = 50):
+        self.max_rounds = max_rounds
+
+    @staticmethod
+    def _fit(problem: PackingProblem, items: List[int]) -> Optional[Dict[int, int]]:
+        """最长优先 + best fit 把 items 放入各通道，放不下时返回 None"""
+        loads = [0.0] * problem.lanes
+        assignment = {}
+        for i in sorted(items, key=lambda i: -problem.durations[i]):
+            d = problem.durations[i]
+            fitting = [l for l in range(problem.lanes) if loads[l] + d <= problem.capacity + 1e-9]
+            if not fitting:
+                return None
+            lane = max(fitting, key=lambda l: loads[l])
+            loads[lane] += d
+            assignment[i] = lane
+        return assignment
+
+    def _value(self, problem, chosen) -> float:
+        return sum(problem.value(i) for i in chosen)
+
+    def pack(self, problem):
+        start = time.perf_counter()
+        p = problem.problem
+        n = len(p.items)
+        group = {i: s for s, idx in p.groups.items() for i in idx}
+        order = sorted(range(n), key=lambda i: (-problem.gains[i] / max(problem.durations[i], 1e-9),
+                                                -problem.durations[i]))
+
+        def blocking(i, chosen):
+            return {j for j in chosen if j in p.adjacency[i] or (group[j] == group[i] and j != i)}
+
+        def fill(chosen, assignment):
+            """把还能放下且不冲突的候选项依次加入"""
+            for i in order:
+                if i in chosen or blocking(i, chosen) or problem.gains[i] <= 0:
+                    continue
+                trial = self._fit(problem, list(chosen) + [i])
+                if trial is not None:
+                    chosen.add(i)
+                    assignment = trial
+            return chosen, assignment
+
+        chosen, assignment = fill(set(), {})
+        for _ in range(self.max_rounds):
+            best_value, best = self._value(problem, chosen), None
+            for i in order:
+                if i in chosen or problem.gains[i] <= 0:
+                    continue
+                base = chosen - blocking(i, chosen)
+                trial = self._fit(problem, list(base) + [i])
+                evict = set()
+                # 放不下时，按收益密度从低到高继续移除已选项，直到放下或价值不再可能提高
+                for j in sorted(base, key=lambda j: problem.value(j) / max(problem.durations[j], 1e-9)):
+                    if trial is not None:
+                        break
+                    evict.add(j)
+                    if self._value(problem, base - evict) + problem.value(i) <= best_value:
+                        break
+                    trial = self._fit(problem, list(base - evict) + [i])
+                if trial is None:
+                    continue
+                candidate, candidate_assignment = fill(base - evict | {i}, trial)
+                value = self._value(problem, candidate)
+                if value > best_value + 1e-12:
+                    best_value, best = value, (candidate, candidate_assignment)
+            if best is None:
+                break
+            chosen, assignment = best
+        return self._result(problem, "feasible", assignment, problem.trivial_bound(), start)
+
+
+PACKERS = {
+    "gurobi": GurobiPacker,
+    "cbc": PulpPacker,
+    "heuristic": HeuristicPacker,
+}
+
+
+def get_packer(name: str = "auto", **kwargs) -> Packer:
+    """
+    按名称创建装箱求解器；auto 表示依次尝试 gurobi、cbc，均不可用时使用启发式
+
+    :param name: gurobi / cbc / heuristic / auto
+    """
+    if name != "auto":
+        return PACKERS[name](**kwargs)
+    for backend in ("gurobi", "cbc"):
+        try:
+            return PACKERS[backend]()
+        except ImportError:
+            continue
+    return HeuristicPacker(**kwargs)
+
+
+def pack_window(problem: UpgradeProblem,
+                upgrade_duration: Dict[str, float],
+                lanes: int,
+                capacity: float,
+                packer="auto") -> PackingResult:
+    """
+    对一个时间窗（或其剩余部分）求解装箱
+
+    :param packer: 装箱求解器名称或 Packer 实例
+    """
+    if isinstance(packer, str):
+        packer = get_packer(packer)
+    return packer.pack(PackingProblem(problem, upgrade_duration, lanes, capacity))
+
+
+def _ceil(x: float) -> int:
+    # 消除浮点误差（如 0.1 * 3600 = 360.00000000000006）后再向上取整
+    return math.ceil(round(x, 6))
+
+
+def task_entries(tasks: List[dict], regions: Optional[Dict[str, str]] = None, time_unit: float = 1) -> List[dict]:
+    """
+    转换为 getpod.py 的 execute_task 读取的任务格式
+
+    :param tasks: [{service, from, to, start, end}, ...]
+    :param time_unit: 一个时间单位对应的秒数
+
+    开始和结束时刻都向上取整到秒：截断会让任务比规划的用时更短，向上取整则保持同一通道内的任务首尾相接、互不重叠
+    """
+    regions = regions or {}
+    return [{
+        "name": t["service"],
+        "region": regions.get(t["service"], "default"),
+        "version": {"from": t["from"], "to": t["to"]},
+        "timeline": {"start": _ceil(t["start"] * time_unit), "end": _ceil(t["end"] * time_unit)},
+    } for t in tasks]
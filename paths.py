@@ -0,0 +1,110 @@
+# 升级路径：每个服务一张版本 DAG，边为允许的单次升级（跳）及其用时，规划器据此在一个时间窗内串联多跳
+from typing import Dict, Iterator, List, Optional, Tuple
+from catalog import VersionCatalog
+
+Path = Tuple[str, ...]  # (原版本, 中间版本..., 目标版本)
+
+
+class UpgradePaths:
+    def __init__(self,
+                 catalog: VersionCatalog,
+                 upgrade_duration: Dict[str, float],
+                 hops: Optional[Dict[str, list]] = None,
+                 span: int = 2):
+        """
+        各服务的升级路径 DAG
+
+        :param catalog: 编译后的版本目录
+        :param upgrade_duration: 各服务单跳的默认用时
+        :param hops: 配置中的 upgrade_paths {服务: [[原版本, 目标版本, 用时], ...]}，用时可省略（取默认用时）；
+                     列出的服务只允许这些跳，未列出的服务允许向后至多 span 个版本的跳
+        :param span: 默认跳的最大跨度（即 maxspan）
+        """
+        self.catalog = catalog
+        self.upgrade_duration = upgrade_duration
+        # 服务 -> 原版本 -> {目标版本: 用时}
+        self.edges: Dict[str, Dict[str, Dict[str, float]]] = {}
+        hops = hops or {}
+        for s, versions in catalog.versions.items():
+            out = self.edges[s] = {v: {} for v in versions}
+            if s in hops:
+                for hop in hops[s]:
+                    frm, to = hop[0], hop[1]
+                    if catalog.index(s, to) <= catalog.index(s, frm):
+                        raise ValueError(f"{s} 的升级路径 {frm} -> {to} 不是向后升级")
+                    out[frm][to] = float(hop[2]) if len(hop) > 2 else upgrade_duration[s]
+            else:
+                for v in versions:
+                    for to, _ in catalog.candidates(s, v, span):
+                        out[v][to] = upgrade_duration[s]
+
+    @classmethod
+    def from_data(cls, data: dict, catalog: Optional[VersionCatalog] = None) -> "UpgradePaths":
+        """由配置（data copy.json 的内容）生成，使用 upgrade_paths、upgrade_duration 和 maxspan"""
+        catalog = catalog or VersionCatalog(data["available_versions"], data.get("incompatible_pairs", []))
+        return cls(catalog, data["upgrade_duration"], data.get("upgrade_paths"), data.get("maxspan", 2))
+
+    def hops(self, service: str, version: str) -> Dict[str, float]:
+        """从 version 出发的所有跳 {目标版本: 用时}"""
+        return self.edges[service].get(version, {})
+
+    def duration(self, service: str, frm: str, to: str) -> Optional[float]:
+        """单跳用时，不允许该跳时为 None"""
+        return self.hops(service, frm).get(to)
+
+    def walk(self, service: str, frm: str, budget: float, max_hops: Optional[int] = None) -> Iterator[Tuple[Path, float]]:
+        """
+        枚举从 frm 出发、总用时不超过 budget 的所有路径（至少一跳）
+
+        :param max_hops: 路径最多包含的跳数，None 表示不限
+        :return: (路径, 总用时) 迭代器
+        """
+        stack = [((frm,), 0.0)]
+        while stack:
+            path, used = stack.pop()
+            if max_hops is not None and len(path) > max_hops:
+                continue
+            for to, d in self.hops(service, path[-1]).items():
+                if used + d <= budget:
+                    yield path + (to,), used + d
+                    stack.append((path + (to,), used + d))
+
+    def shortest(self, service: str, frm: str, to: Optional[str] = None) -> Optional[Tuple[Path, float]]:
+        """
+        用时最短的路径（DAG 上按版本顺序松弛）
+
+        :param to: 目标版本，默认为最新版本
+        :return: (路径, 总用时)，不可达时为 None
+        """
+        versions = self.catalog.versions[service]
+        to = to or versions[-1]
+        best: Dict[str, Tuple[float, Path]] = {frm: (0.0, (frm,))}
+        for v in versions[self.catalog.index(service, frm):]:
+            if v not in best:
+                continue
+            used, path = best[v]
+            for nxt, d in self.hops(service, v).items():
+                if nxt not in best or used + d < best[nxt][0]:
+                    best[nxt] = (used + d, path + (nxt,))
+        if to not in best:
+            return None
+        used, path = best[to]
+        return path, used
+
+    def apply_model(self, model, scale: float = 1.0) -> None:
+        """
+        用 duration_model.DurationModel 中学习到的各跳用时替换配置值（按模型的层级回退，服务完全没有样本时保持不变）
+
+        :param scale: 一个配置时间单位对应的秒数
+        """
+        for s, out in self.edges.items():
+            for frm, targets in out.items():
+                for to, d in targets.items():
+                    est = model.estimate(s, None, frm, to)
+                    if est is not None:
+                        targets[to] = est / scale
+
+    def to_dict(self) -> Dict[str, List[list]]:
+        """配置中 upgrade_paths 的格式"""
+        return {s: [[frm, to, d] for frm, targets in out.items() for to, d in targets.items()]
+                for s, out in self.edges.items()}
@@ -0,0 +1,205 @@
+# 全局时间窗规划器：在整个 T_max 内为每个 (服务, 版本跳) 分配时间窗和窗内偏移
+import json
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple, Optional
+from catalog import VersionCatalog
+from packing import task_entries
+from paths import Path, UpgradePaths
+
+
+# 窗内任务排序规则：数值越大越先排
+PRIORITY_RULES = {
+    # 剩余总工作量（到最新版本的最短路径用时）优先，先启动最长的升级链
+    "remaining": lambda p, s: p.remaining_work(s),
+    # 单跳时长优先（LPT）
+    "duration": lambda p, s: p.upgrade_duration[s],
+    # 涉及不兼容约束多的服务优先，尽早解开耦合
+    "conflicts": lambda p, s: len(p.catalog.conflicts_of(s, p.state[s])),
+}
+
+
+class HorizonPlanner:
+    def __init__(self,
+                 data: dict,
+                 catalog: Optional[VersionCatalog] = None,
+                 regions: Optional[Dict[str, str]] = None,
+                 time_unit: int = 3600,
+                 paths: Optional[UpgradePaths] = None,
+                 max_hops: Optional[int] = None):
+        """
+        多时间窗全局规划器
+
+        :param data: 配置（即 data copy.json 的内容），使用 T_max、window_length、gap_length、maxspan、parellel
+        :param catalog: 编译后的版本目录，默认由 data 生成
+        :param regions: 各服务所在命名空间 {服务: namespace}，缺省为 default
+        :param time_unit: 配置中一个时间单位对应的秒数，用于生成执行计划
+        :param paths: 升级路径 DAG，默认由 data 中的 upgrade_paths（未配置时按 maxspan）生成
+        :param max_hops: 同一服务在一个时间窗内最多串联的跳数，None 表示只受通道剩余时间限制
+        """
+        self.T_max = data["T_max"]
+        self.window_length = data["window_length"]
+        self.gap_length = data["gap_length"]
+        self.maxspan = data.get("maxspan", 2)
+        self.parellel = data["parellel"]
+        self.upgrade_duration = data["upgrade_duration"]
+        self.catalog = catalog or VersionCatalog(data["available_versions"], data.get("incompatible_pairs", []))
+        self.paths = paths or UpgradePaths(self.catalog, self.upgrade_duration, data.get("upgrade_paths"), self.maxspan)
+        self.max_hops = max_hops
+        self.initial_versions = {s: vs[0] for s, vs in data["available_versions"].items()}
+        self.regions = regions or {}
+        self.time_unit = time_unit
+        self.state: Dict[str, str] = dict(self.initial_versions)
+
+    def windows(self) -> List[Tuple[float, float]]:
+        """T_max 内所有时间窗 [(开始, 结束), ...]"""
+        result = []
+        start = 0
+        while start + self.window_length <= self.T_max:
+            result.append((start, start + self.window_length))
+            start += self.window_length + self.gap_length
+        return result
+
+    def latest_index(self, s: str) -> int:
+        return len(self.catalog.versions[s]) - 1
+
+    def remaining_work(self, s: str) -> float:
+        """从当前版本到最新版本的最短路径用时"""
+        best = self.paths.shortest(s, self.state[s])
+        return best[1] if best is not None else 0.0
+
+    def _compatible(self, s: str, path: Path, touched: Dict[str, Path]) -> bool:
+        """
+        混合状态兼容检查
+
+        窗内各升级的先后顺序不定，因此 s 路径上的每个版本（当前、中间、目标）须与本窗其他升级服务
+        路径上的每个版本两两兼容，中间和目标版本还须与本窗不升级的服务的当前版本兼容。
+        """
+        for v in path:
+            for s2, v2 in self.catalog.conflicts_of(s, v):
+                if s2 == s:
+                    continue
+                if s2 in touched:
+                    if v2 in touched[s2]:
+                        return False
+                elif v != self.state[s] and self.state[s2] == v2:
+                    return False
+        return True
+
+    def _pick_path(self, s: str, budget: float, touched: Dict[str, Path]) -> Optional[Path]:
+        """通道剩余时间内可串联到达的最高版本，相同时取用时最短的路径；每个中间状态都须兼容"""
+        best, best_key = None, None
+        for path, used in self.paths.walk(s, self.state[s], budget, self.max_hops):
+            key = (self.catalog.index(s, path[-1]), -used, -len(path))
+            if (best_key is None or key > best_key) and self._compatible(s, path, touched):
+                best, best_key = path, key
+        return best
+
+    def _plan_with(self, rule) -> List[List[dict]]:
+        self.state = dict(self.initial_versions)
+        plan = []
+        for w_start, w_end in self.windows():
+            lanes = [0] * self.parellel  # 各并行通道的窗内已占用时间
+            touched: Dict[str, Path] = {}
+            tasks = []
+            pending = [s for s in self.catalog.services
+                       if self.catalog.index(s, self.state[s]) < self.latest_index(s)]
+            for s in sorted(pending, key=lambda s: rule(self, s), reverse=True):
+                lane = min(range(self.parellel), key=lambda i: lanes[i])
+                path = self._pick_path(s, self.window_length - lanes[lane], touched)
+                if path is None:
+                    continue
+                touched[s] = path
+                # 同一服务的多跳在同一通道上首尾相接
+                for frm, to in zip(path, path[1:]):
+                    duration = self.paths.duration(s, frm, to)
+                    tasks.append({"service": s, "from": frm, "to": to, "lane": lane,
+                                  "start": lanes[lane], "end": lanes[lane] + duration})
+                    lanes[lane] += duration
+            if not tasks:
+                # 状态不再变化，后续时间窗也无法推进
+                break
+            for s, path in touched.items():
+                self.state[s] = path[-1]
+            plan.append(tasks)
+        return plan
+
+    def score(self, plan: List[List[dict]]) -> Tuple[int, int, float]:
+        """(未到达最新版本的跳数, 使用的时间窗数, 最后一窗的完成时间)，越小越好"""
+        final = dict(self.initial_versions)
+        for tasks in plan:
+            for t in tasks:
+                final[t["service"]] = t["to"]
+        left = sum(self.latest_index(s) - self.catalog.index(s, v) for s, v in final.items())
+        makespan = max((t["end"] for t in plan[-1]), default=0) if plan else 0
+        return left, len(plan), makespan
+
+    def plan(self) -> List[List[dict]]:
+        """
+        在所有排序规则下规划整个时间范围，返回最优方案
+
+        :return: 每个时间窗的任务列表 [[{service, from, to, lane, start, end}, ...], ...]
+        """
+        best = None
+        for rule in PRIORITY_RULES.values():
+            candidate = self._plan_with(rule)
+            if best is None or self.score(candidate) < self.score(best):
+                best = candidate
+        self.state = dict(self.initial_versions)
+        return best
+
+    def to_schedule(self, plan: List[List[dict]], start: datetime) -> dict:
+        """
+        转换为 getpod.py 的 execute_schedule 使用的 upgrade_schedule JSON
+
+        :param plan: plan() 的返回值
+        :param start: 第一个时间窗的开始时间
+        """
+        unit = self.time_unit
+        time_windows = []
+        for k, ((w_start, _), tasks) in enumerate(zip(self.windows(), plan)):
+            time_windows.append({
+                "window_id": k + 1,
+                "window_start_time": (start + timedelta(seconds=w_start * unit)).strftime("%Y.%m.%d.%H:%M"),
+                "window_time": f"{int(self.window_length * unit)}s",
+                "tasks": task_entries(tasks, self.regions, unit),
+            })
+        # parellel 随计划下发：execute_schedule 按它确定工作线程数，与规划时的通道数一致
+        return {"upgrade_schedule": {"parellel": self.parellel, "time_windows": time_windows}}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="在 T_max 内规划所有时间窗的升级任务并输出执行计划")
+    parser.add_argument("--data", default="data copy.json")
+    parser.add_argument("--out", default="schedule.json")
+    parser.add_argument("--start", help="第一个时间窗开始时间，格式 YYYY.MM.DD.HH:MM，默认下一个整点")
+    parser.add_argument("--time-unit", type=int, default=3600, help="配置中一个时间单位对应的秒数")
+    parser.add_argument("--duration-model", help="使用该模型文件（getpod 记录的集群用时，单位秒）中学习到的用时分位数代替配置中的固定用时")
+    parser.add_argument("--quantile", type=float, default=0.9, help="与 --duration-model 一起使用的分位数")
+    parser.add_argument("--max-hops", type=int, help="同一服务在一个时间窗内最多串联的跳数，默认不限")
+    args = parser.parse_args()
+
+    with open(args.data, 'r') as f:
+        data = json.load(f)
+    paths = UpgradePaths.from_data(data)
+    if args.duration_model:
+        from duration_model import DurationModel
+        model = DurationModel(args.duration_model, args.quantile, unit="s")
+        current = {s: vs[0] for s, vs in data["available_versions"].items()}
+        data["upgrade_duration"] = model.durations(data["upgrade_duration"], current, scale=args.time_unit)
+        paths.apply_model(model, args.time_unit)
+    if args.start:
+        start = datetime.strptime(args.start, "%Y.%m.%d.%H:%M")
+    else:
+        start = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+
+    planner = HorizonPlanner(data, paths.catalog, time_unit=args.time_unit, paths=paths, max_hops=args.max_hops)
+    plan = planner.plan()
+    for k, tasks in enumerate(plan):
+        print(f"时间窗 {k + 1}: " + ", ".join(f"{t['service']} {t['from']}->{t['to']} [{t['start']}, {t['end']}]" for t in tasks))
+    left, used, _ = planner.score(plan)
+    print(f"共使用 {used} 个时间窗" + ("，所有服务均已升级到最新版本" if left == 0 else f"，仍有 {left} 个版本未升级"))
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(planner.to_schedule(plan, start), f, ensure_ascii=False, indent=4)
+    print(f"执行计划已写入 {args.out}")
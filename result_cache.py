@@ -0,0 +1,163 @@
+# 优化结果缓存：以 当前版本向量 + 分桶后的剩余时间 为键的 LRU/TTL 缓存，可选的磁盘层供多次运行共享
+import os
+import json
+import math
+import time
+import bisect
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+def _digest(obj) -> str:
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def fingerprint(incompatible_pairs: Iterable, upgrade_duration: Dict[str, float],
+                versions: Optional[Dict[str, List[str]]] = None, **extra) -> str:
+    """
+    问题参数的指纹：不兼容对（与顺序无关）、升级用时、各服务的版本列表以及求解器/模式/跨度等其他参数，
+    任一变化即得到新指纹，旧指纹下的缓存结果不会再被命中
+
+    :param versions: 版本目录中各服务的完整版本列表（新增版本后候选集和权重都会变化）
+    :param extra: 影响结果的其他参数，如 solver、mode、lanes、span
+    """
+    pairs = sorted(tuple(p) for p in incompatible_pairs)
+    durations = sorted(upgrade_duration.items())
+    catalog = sorted((s, list(vs)) for s, vs in (versions or {}).items())
+    return _digest([pairs, durations, catalog, sorted((k, str(v)) for k, v in extra.items())])
+
+
+def state_key(current_versions: Dict[str, str]) -> str:
+    """当前版本向量的规范哈希（与服务顺序无关）"""
+    return _digest(sorted(current_versions.items()))
+
+
+def duration_bucket(rest_time: float, upgrade_duration: Dict[str, float]) -> int:
+    """
+    选择模式下的剩余时间分桶：候选集只取决于哪些服务的用时小于 rest_time，
+    因此以 rest_time 在所有用时中的位置作为桶号，同一桶内的结果完全相同
+    """
+    return bisect.bisect_left(sorted(upgrade_duration.values()), rest_time)
+
+
+def floor_bucket(rest_time: float, granularity: float) -> Tuple[int, float]:
+    """
+    装箱模式下的剩余时间分桶：向下取整到 granularity 的整数倍
+
+    :return: (桶号, 桶的下界)；按下界求解的结果在桶内任意剩余时间下都可行
+    """
+    k = math.floor(rest_time / granularity + 1e-9)
+    return k, k * granularity
+
+
+class ResultCache:
+    def __init__(self,
+                 max_entries: int = 4096,
+                 ttl: Optional[float] = None,
+                 path: Optional[str] = None,
+                 clock=time.time):
+        """
+        有界的优化结果缓存
+
+        内存层按最近使用顺序淘汰，超过 max_entries 时移除最久未用的条目；给定 path 时未命中内存层的查询
+        再查磁盘层（每个键一个 JSON 文件，原子写入），多个进程或多次运行可共享已求解的结果。
+
+        :param max_entries: 内存层最多保留的条目数
+        :param ttl: 条目有效期(秒)，None 表示不过期
+        :param path: 磁盘层目录，None 表示只用内存
+        :param clock: 时钟函数（墙上时间，磁盘层条目跨进程比较）
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[object, float]]" = OrderedDict()  # 键 -> (值, 写入时间)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(fp: str, current_versions: Dict[str, str], bucket) -> str:
+        """由问题指纹、当前版本向量和剩余时间桶组成的缓存键"""
+        return f"{fp[:16]}-{state_key(current_versions)[:24]}-{bucket}"
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl is not None and self.clock() - stored_at > self.ttl
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key + '.json')
+
+    def _remember(self, key: str, value, stored_at: float) -> None:
+        """写入内存层并按 LRU 淘汰（调用方持有锁）"""
+        self._entries[key] = (value, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: str):
+        """命中时返回缓存的值，否则返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[1]):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+                self.expirations += 1
+        if self.path:
+            try:
+                with open(self._file(key), encoding='utf-8') as f:
+                    stored = json.load(f)
+            except (OSError, ValueError):
+                stored = None
+            if stored is not None and not self._expired(stored["stored_at"]):
+                with self._lock:
+                    self._remember(key, stored["value"], stored["stored_at"])
+                    self.disk_hits += 1
+                return stored["value"]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value) -> None:
+        """value 须可 JSON 序列化（使用磁盘层时）"""
+        now = self.clock()
+        with self._lock:
+            self._remember(key, value, now)
+        if self.path:
+            fd, tmp = tempfile.mkstemp(prefix='.result-cache-', dir=self.path)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({"stored_at": now, "value": value}, f, ensure_ascii=False)
+                os.replace(tmp, self._file(key))
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+
+    def invalidate(self, disk: bool = False) -> None:
+        """清空内存层，disk 为 True 时同时删除磁盘层的所有条目"""
+        with self._lock:
+            self._entries.clear()
+        if disk and self.path:
+            for name in os.listdir(self.path):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(self.path, name))
+
+    def stats(self) -> Dict[str, float]:
+        """命中/未命中次数和命中率（磁盘层命中也计为命中）"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                    "evictions": self.evictions, "expirations": self.expirations, "entries": len(self._entries),
+                    "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0}
@@ -0,0 +1,285 @@
+# 共享的 Deployment 就绪监视：每个命名空间一个 watch 流，所有等待就绪的任务共用，状态满足时立即完成对应 Future
+import queue
+import logging
+import threading
+import subprocess
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# 事件: (类型, 状态)。类型为 ADDED / MODIFIED / DELETED，或 SYNCED 表示初始列表已全部送达（状态为 None）
+Event = Tuple[str, Optional[dict]]
+
+STATUS_FIELDS = ("generation", "observed_generation", "replicas", "status_replicas",
+                 "updated_replicas", "available_replicas")
+
+
+def rolled_out(status: dict) -> bool:
+    """与 kubectl rollout status 相同的判定：控制器已观察到最新的 spec，且所有副本都已更新并可用"""
+    if status.get("observed_generation", 0) < status.get("generation", 0):
+        return False
+    updated = status.get("updated_replicas", 0)
+    return (updated >= status.get("replicas", 1)
+            and status.get("status_replicas", 0) <= updated
+            and status.get("available_replicas", 0) >= updated)
+
+
+class DeploymentSource:
+    """Deployment 状态事件源"""
+    def stream(self, namespace: str, stop: threading.Event) -> Iterator[Event]:
+        """先送出现有 Deployment（ADDED）和一个 SYNCED，之后送出变化；stop 置位后应尽快结束"""
+        raise NotImplementedError
+
+
+class KubernetesDeploymentSource(DeploymentSource):
+    def __init__(self, apps_api, watch_timeout: int = 300):
+        """
+        基于 kubernetes 包的 list + watch
+
+        :param apps_api: kubernetes.client.AppsV1Api（与 cluster.KubernetesClusterClient 共用连接池）
+        :param watch_timeout: 单次 watch 请求的服务端超时，到期后从上次的 resourceVersion 继续
+        """
+        self.apps = apps_api
+        self.watch_timeout = watch_timeout
+
+    @staticmethod
+    def _status(deploy) -> dict:
+        spec, status = deploy.spec, deploy.status
+        return {
+            "name": deploy.metadata.name,
+            "generation": deploy.metadata.generation or 0,
+            "observed_generation": status.observed_generation or 0,
+            "replicas": spec.replicas if spec.replicas is not None else 1,
+            "status_replicas": status.replicas or 0,
+            "updated_replicas": status.updated_replicas or 0,
+            "available_replicas": status.available_replicas or 0,
+        }
+
+    def stream(self, namespace, stop):
+        from kubernetes import watch
+        listing = self.apps.list_namespaced_deployment(namespace)
+        for deploy in listing.items:
+            yield "ADDED", self._status(deploy)
+        yield "SYNCED", None
+        version = listing.metadata.resource_version
+        while not stop.is_set():
+            w = watch.Watch()
+            for event in w.stream(self.apps.list_namespaced_deployment, namespace,
+                                  resource_version=version, timeout_seconds=self.watch_timeout):
+                version = event["object"].metadata.resource_version
+                yield event["type"], self._status(event["object"])
+                if stop.is_set():
+                    w.stop()
+                    break
+
+
+class KubectlDeploymentSource(DeploymentSource):
+    """子进程后端使用：每个命名空间一个长期运行的 kubectl get -w，而不是每个任务一个 kubectl rollout status"""
+    # 每个 Deployment 一行，字段顺序与 STATUS_FIELDS 一致，缺失的字段输出为空
+    TEMPLATE = ('{range .items[*]}{.metadata.name} {.metadata.generation} {.status.observedGeneration} '
+                '{.spec.replicas} {.status.replicas} {.status.updatedReplicas} {.status.availableReplicas}{"\\n"}{end}')
+    WATCH_TEMPLATE = ('{.metadata.name} {.metadata.generation} {.status.observedGeneration} '
+                      '{.spec.replicas} {.status.replicas} {.status.updatedReplicas} {.status.availableReplicas}{"\\n"}')
+
+    @staticmethod
+    def _parse(line: str) -> Optional[dict]:
+        parts = line.split(" ")
+        if len(parts) != 7 or not parts[0]:
+            return None
+        status = {"name": parts[0]}
+        for field, value in zip(STATUS_FIELDS, parts[1:]):
+            status[field] = int(value) if value else 0
+        if not parts[3]:
+            status["replicas"] = 1
+        return status
+
+    def stream(self, namespace, stop):
+        res = subprocess.run(["kubectl", "get", "deployments", "-n", namespace, "-o", f"jsonpath={self.TEMPLATE}"],
+                             capture_output=True, text=True)
+        if res.returncode != 0:
+            raise RuntimeError(res.stderr.strip())
+        for line in res.stdout.splitlines():
+            status = self._parse(line)
+            if status:
+                yield "ADDED", status
+        yield "SYNCED", None
+        proc = subprocess.Popen(["kubectl", "get", "deployments", "-n", namespace, "--watch-only",
+                                 "-o", f"jsonpath={self.WATCH_TEMPLATE}"],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        try:
+            for line in proc.stdout:
+                status = self._parse(line.rstrip("\n"))
+                if status:
+                    yield "MODIFIED", status
+                if stop.is_set():
+                    break
+        finally:
+            proc.kill()
+            proc.wait()
+
+
+class FakeDeploymentSource(DeploymentSource):
+    """本地模拟的事件流：update() 修改状态并向所有正在 watch 该命名空间的流推送事件"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.deployments: Dict[Tuple[str, str], dict] = {}
+        self._subscribers: Dict[str, List[queue.Queue]] = {}
+
+    def update(self, namespace: str, name: str, **fields) -> dict:
+        with self._lock:
+            key = (namespace, name)
+            kind = "MODIFIED" if key in self.deployments else "ADDED"
+            status = dict(self.deployments.get(key, {"name": name, "replicas": 1}), **fields)
+            self.deployments[key] = status
+            for q in self._subscribers.get(namespace, []):
+                q.put((kind, dict(status)))
+            return status
+
+    def delete(self, namespace: str, name: str) -> None:
+        with self._lock:
+            status = self.deployments.pop((namespace, name), None)
+            if status is not None:
+                for q in self._subscribers.get(namespace, []):
+                    q.put(("DELETED", dict(status)))
+
+    def stream(self, namespace, stop):
+        q = queue.Queue()
+        with self._lock:
+            initial = [dict(s) for (ns, _), s in self.deployments.items() if ns == namespace]
+            self._subscribers.setdefault(namespace, []).append(q)
+        try:
+            for status in initial:
+                yield "ADDED", status
+            yield "SYNCED", None
+            while not stop.is_set():
+                try:
+                    yield q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+        finally:
+            with self._lock:
+                self._subscribers[namespace].remove(q)
+
+
+class RolloutWatcher:
+    def __init__(self, source: DeploymentSource, namespaces=(), reconnect_delay: float = 1.0):
+        """
+        所有任务共用的就绪监视器：每个命名空间只有一个 watch 线程，等待中的任务只持有 Future，不占线程
+
+        :param source: 事件源
+        :param namespaces: 预先开始 watch 的命名空间（其余在第一次用到时开始）
+        :param reconnect_delay: watch 流中断后的重连间隔(秒)
+        """
+        self.source = source
+        self.reconnect_delay = reconnect_delay
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._states: Dict[Tuple[str, str], dict] = {}
+        self._waiters: Dict[Tuple[str, str], List[Tuple[int, Future]]] = {}
+        self._synced: Dict[str, threading.Event] = {}
+        self._threads: Dict[str, threading.Thread] = {}
+        for ns in namespaces:
+            self.ensure_namespace(ns)
+
+    def ensure_namespace(self, namespace: str) -> threading.Event:
+        """开始 watch 命名空间（已在 watch 时不做任何事）"""
+        with self._lock:
+            if namespace not in self._threads:
+                self._synced[namespace] = threading.Event()
+                th = threading.Thread(target=self._run, args=(namespace,), name=f"rollout-watch-{namespace}", daemon=True)
+                self._threads[namespace] = th
+                th.start()
+            return self._synced[namespace]
+
+    def _run(self, namespace: str) -> None:
+        while not self._stop.is_set():
+            try:
+                for kind, status in self.source.stream(namespace, self._stop):
+                    if kind == "SYNCED":
+                        self._synced[namespace].set()
+                    else:
+                        self._on_event(namespace, kind, status)
+            except Exception as e:
+                logging.warning(f"命名空间 {namespace} 的 Deployment watch 中断: {e}，{self.reconnect_delay}s 后重连")
+            self._stop.wait(self.reconnect_delay)
+
+    def _on_event(self, namespace: str, kind: str, status: dict) -> None:
+        key = (namespace, status["name"])
+        ready = []
+        with self._lock:
+            if kind == "DELETED":
+                self._states.pop(key, None)
+                return
+            self._states[key] = status
+            waiters = self._waiters.get(key)
+            if waiters and rolled_out(status):
+                generation = status.get("generation", 0)
+                ready = [f for target, f in waiters if generation >= target]
+                self._waiters[key] = [(target, f) for target, f in waiters if generation < target]
+        for future in ready:
+            future.set_result(True)
+
+    def generation(self, namespace: str, name: str, sync_timeout: float = 5.0) -> int:
+        """
+        当前已知的 Deployment generation（不存在时为 0）；watch 缓存可能落后于 API server，
+        升级后等待的目标应取 ClusterClient.deployment_generation 的结果
+        """
+        self.ensure_namespace(namespace).wait(sync_timeout)
+        with self._lock:
+            return self._states.get((namespace, name), {}).get("generation", 0)
+
+    def progress(self, namespace: str, name: str, min_generation: int = 0) -> Optional[float]:
+        """
+        本次升级的滚动进度：已更新且可用的副本占期望副本数的比例，控制器尚未观察到新 generation 时为 0，
+        未知的 Deployment 为 None
+        """
+        with self._lock:
+            status = self._states.get((namespace, name))
+        if status is None:
+            return None
+        if (status.get("generation", 0) < min_generation
+                or status.get("observed_generation", 0) < status.get("generation", 0)):
+            return 0.0
+        replicas = max(status.get("replicas", 1), 1)
+        done = min(status.get("updated_replicas", 0), status.get("available_replicas", 0))
+        return min(done / replicas, 1.0)
+
+    def wait_ready(self, namespace: str, name: str, min_generation: int = 0) -> Future:
+        """
+        :param min_generation: 本次升级后的 generation；spec 未变时等于升级前的值，已滚动完成即就绪
+        :return: generation 不小于 min_generation 且滚动完成时以 True 完成的 Future
+        """
+        self.ensure_namespace(namespace)
+        future = Future()
+        key = (namespace, name)
+        with self._lock:
+            status = self._states.get(key)
+            if status is not None and status.get("generation", 0) >= min_generation and rolled_out(status):
+                future.set_result(True)
+            else:
+                self._waiters.setdefault(key, []).append((min_generation, future))
+        return future
+
+    def check(self, namespace: str, name: str, min_generation: int, timeout: float) -> Tuple[bool, str]:
+        """等待就绪，最多 timeout 秒；接口与 ClusterClient.rollout_status 相同"""
+        future = self.wait_ready(namespace, name, min_generation)
+        try:
+            return future.result(timeout), ""
+        except FutureTimeout:
+            self.discard(namespace, name, future)
+            return False, f"等待 deployment/{name} 就绪超时 ({timeout}s)"
+
+    def discard(self, namespace: str, name: str, future: Future) -> None:
+        with self._lock:
+            waiters = self._waiters.get((namespace, name), [])
+            self._waiters[namespace, name] = [(a, f) for a, f in waiters if f is not future]
+        future.cancel()
+
+    def waiting(self) -> int:
+        """正在等待就绪的任务数"""
+        with self._lock:
+            return sum(len(w) for w in self._waiters.values())
+
+    def stop(self) -> None:
+        self._stop.set()
+        for th in list(self._threads.values()):
+            th.join(timeout=2)
@@ -1,15 +1,19 @@
 # sjx可运行版本
 # 目前是不连续显示的时间窗
-from gurobipy import Model, GRB, quicksum
 import json
 import matplotlib.pyplot as plt
 from upgrader import AppUpgrader
 from visualizer import AppUpgradeVisualizer
 import time
+from threading import Thread
 from controller import goon
 from copy import deepcopy
+from state_store import default_store
+from metrics import default_registry
+from duration_model import DurationModel
+from result_cache import ResultCache
 # Load data
-from optimizer import optimize
+from optimizer import make_optimizer, catalog
 with open('data copy.json', 'r') as f:
     data = json.load(f)
 
@@ -19,6 +23,14 @@ data1 = deepcopy(data)  # 使用 deepcopy 确保不会修改原始数据
 services = list(data['available_versions'].keys())
 available_versions = data1['available_versions']
 
+# 配置 resume 为 true 时，从状态存储（data.json 快照 + WAL）恢复上次运行的版本状态；
+# 否则以配置中的版本重新开始，丢弃上次运行留下的快照和 WAL
+store = default_store()
+if data.get('resume', False):
+    available_versions.update({s: v for s, v in store.available_versions.items() if s in available_versions})
+else:
+    store.reset(available_versions)
+
 incompatible_pairs = data['incompatible_pairs']
 upgrade_duration = data['upgrade_duration']
 
@@ -27,6 +39,24 @@ upgrade_duration = data['upgrade_duration']
 
 
 total_time = 20
+
+# 学习到的用时模型：优化器按 duration_quantile（默认 p90）的实际用时筛选候选，样本不足时使用配置中的固定值。
+# 这里记录的是本地模拟的用时，与 getpod 在集群上记录的真实用时分开存放（单位不同的模型文件会被拒绝载入）
+duration_model = DurationModel(data.get('duration_model', 'duration_model_sim.json'), data.get('duration_quantile', 0.9),
+                               unit="sim")
+planned_duration = dict(upgrade_duration)  # 传给优化器的用时表，每次优化前按模型原地更新
+
+# 优化器：Gurobi 可用时为常驻增量模型，否则按配置中的 solver 选择 cbc / heuristic 后端
+# mode 为 pack 时按通道装箱：每条通道在窗内顺序执行多个升级，各升级在优化器给出的偏移处开始
+mode = data.get('mode', 'select')
+# 配置 result_cache 时缓存优化结果（如 {"max_entries": 4096, "ttl": 86400, "path": ".result-cache"}），
+# 升级失败后版本状态不变，下一轮直接复用上次的解
+cache_conf = data.get('result_cache')
+result_cache = ResultCache(**cache_conf) if isinstance(cache_conf, dict) else ResultCache() if cache_conf else None
+optimizer = make_optimizer(available_versions, incompatible_pairs, planned_duration, data.get('solver', 'auto'), mode,
+                           result_cache)
+# backfill 为 true 时（选择模式）任一升级完成即为空出的并行名额重新求解，不再等整批中最慢的升级结束
+backfill = data.get('backfill', False) and mode != 'pack'
  
 while available_versions:
     # 初始化时间窗的开始时间
@@ -52,30 +82,52 @@ while available_versions:
         rest_time = total_time - (current_time - start_time)  # 计算当前时间窗的剩余时间
 
         # 调用优化器选择升级服务
-        selected_services, upgrade_candidates = optimize(available_versions, incompatible_pairs, upgrade_duration, rest_time)
+        planned_duration.update(duration_model.durations(upgrade_duration, {s: v[0] for s, v in available_versions.items()}))
+        selected_services, upgrade_candidates = optimizer.optimize(rest_time)
         if not selected_services:
             print("没有可升级组件")
             break
 
         # 创建 AppUpgrader
         upgrade_durations = {s: upgrade_duration[s] for s in selected_services}
-        upgrader = AppUpgrader(upgrade_durations, available_versions, upgrade_candidates)
+        upgrader = AppUpgrader(upgrade_durations, available_versions, upgrade_candidates, catalog, store=store,
+                               metrics=default_registry(), duration_model=duration_model)
 
         # 调用可视化函数，传递 start_time
         services = list(available_versions.keys())  # 所有组件作为纵轴
         visualizer = AppUpgradeVisualizer(upgrader, services, total_time, start_time)
 #—————————————————————————————————————————————————————————————————————————————————————————————————————
-        # 启动升级
-        for key in selected_services:
-            upgrade = upgrader.create_upgrade_function(key)
-            upgrade()
+        # 启动升级：装箱模式下按各自的开始偏移延后启动
+        starts = []
+        worker = None
+        if backfill:
+            first = [(selected_services, upgrade_candidates)]
+
+            def plan(rest, running):
+                if first:  # 第一批已在上面求解
+                    return first.pop()
+                planned_duration.update(duration_model.durations(upgrade_duration, {s: v[0] for s, v in available_versions.items()}))
+                return optimizer.optimize(rest, running)
+
+            worker = Thread(target=upgrader.backfill, args=(plan, start_time + total_time, upgrade_duration, data['parellel']),
+                            daemon=True)
+            worker.start()
+        elif mode == 'pack':
+            for task in optimizer.tasks:
+                starts.append(upgrader.engine.schedule(task['start'], upgrader.create_upgrade_function(task['service'])))
+        else:
+            for key in selected_services:
+                upgrade = upgrader.create_upgrade_function(key)
+                upgrade()
 
         visualizer.animate()
 #—————————————————————————————————————————————————————————————————————————————————————————————————————
-        # 等待所有升级完成
-        while any(upgrader.get_upgrade_status().values()):
-            time.sleep(0.1)
-            current_time = time.time()  # 更新当前时间
+        # 等待所有升级完成：最后一个升级完成时立即唤醒（装箱模式先等待所有延后的升级都已启动，补位模式等待到窗内不再有新升级）
+        if worker is not None:
+            worker.join()
+        upgrader.engine.await_all(starts)
+        upgrader.await_all()
+        duration_model.save()
 
         # 更新当前时间
         current_time = time.time()
@@ -88,4 +140,6 @@ while available_versions:
 
         print("更新后的 available_versions:", available_versions)
 
+    if result_cache is not None:
+        print("优化结果缓存:", result_cache.stats())
     print("进入下一个时间窗")
\ No newline at end of file
@@ -0,0 +1,346 @@
+# 离散事件模拟：用虚拟时钟驱动 优化器 + AppUpgrader + 时间窗循环，不等待真实时间、不需要交互和绘图
+import json
+import math
+import time
+import heapq
+import random
+import argparse
+import itertools
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Iterable, Union
+from catalog import VersionCatalog
+from solvers import UpgradeProblem, Solver, get_solver
+from packing import Packer, pack_window, get_packer
+from result_cache import ResultCache, fingerprint, state_key, duration_bucket, floor_bucket
+from state_store import NullStateStore
+from upgrader import AppUpgrader
+
+
+class VirtualClock:
+    """虚拟时钟，调用即返回当前模拟时间"""
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class SimulatedEngine:
+    def __init__(self, clock: VirtualClock):
+        """
+        与 engine.UpgradeEngine 接口相同的离散事件引擎：事件只在等待时按到期顺序执行，并推进虚拟时钟
+
+        :param clock: 虚拟时钟
+        """
+        self.clock = clock
+        self._heap = []
+        self._seq = itertools.count()
+
+    def schedule(self, delay: float, fn, *args) -> Future:
+        future = Future()
+        heapq.heappush(self._heap, (self.clock.now + delay, next(self._seq), fn, args, future))
+        return future
+
+    def step(self) -> Optional[Future]:
+        """执行最早的一个事件"""
+        if not self._heap:
+            return None
+        when, _, fn, args, future = heapq.heappop(self._heap)
+        self.clock.now = max(self.clock.now, when)
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def inflight(self) -> List[Future]:
+        return [item[-1] for item in self._heap]
+
+    def as_completed(self, futures: Optional[Iterable[Future]] = None, timeout: Optional[float] = None):
+        waiting = set(futures if futures is not None else self.inflight())
+        for future in list(waiting):
+            if future.done():
+                waiting.discard(future)
+                yield future
+        while waiting and self._heap:
+            future = self.step()
+            if future in waiting:
+                waiting.discard(future)
+                yield future
+
+    def await_all(self, futures: Optional[Iterable[Future]] = None, timeout: Optional[float] = None) -> bool:
+        for _ in self.as_completed(futures):
+            pass
+        return True
+
+
+class Simulator:
+    def __init__(self,
+                 data: dict,
+                 solver: Union[str, Solver] = "heuristic",
+                 success_prob: Union[float, Dict[str, float]] = 0.5,
+                 duration_sigma: float = 0.0,
+                 catalog: Optional[VersionCatalog] = None,
+                 mode: str = "select",
+                 packer: Union[str, Packer] = "heuristic",
+                 cache: Optional[ResultCache] = None,
+                 granularity: float = 1.0,
+                 backfill: bool = False):
+        """
+        无界面的模拟调度器
+
+        :param data: 配置（即 data copy.json 的内容）
+        :param solver: 求解器名称或实例，默认启发式
+        :param success_prob: 升级成功概率，可按服务指定 {服务: 概率}，默认 0.5（与 random.randint(0, 1) 一致）
+        :param duration_sigma: 实际用时的对数正态扰动 σ，实际用时 = 名义用时 × exp(N(0, σ²))，0 表示确定
+        :param catalog: 编译后的版本目录，默认由 data 生成
+        :param mode: select 为每批至多 parellel 个升级同时开始；pack 为按通道装箱，各升级在给定偏移处开始
+        :param packer: pack 模式使用的装箱求解器名称或实例
+        :param cache: 求解结果缓存，多次运行中反复出现的版本状态不再重复求解
+        :param granularity: pack 模式下缓存的剩余时间桶宽（按桶下界求解）
+        :param backfill: select 模式下任一升级完成即为空出的名额重新求解（AppUpgrader.backfill）
+        """
+        self.data = data
+        self.T_max = data["T_max"]
+        self.window_length = data["window_length"]
+        self.gap_length = data["gap_length"]
+        self.parellel = data["parellel"]
+        self.maxspan = data.get("maxspan", 2)
+        self.upgrade_duration = data["upgrade_duration"]
+        self.catalog = catalog or VersionCatalog(data["available_versions"], data.get("incompatible_pairs", []))
+        self.solver = get_solver(solver) if isinstance(solver, str) else solver
+        self.mode = mode
+        self.packer = get_packer(packer) if isinstance(packer, str) else packer
+        self.cache = cache
+        self.granularity = granularity
+        self.backfill = backfill
+        self.success_prob = success_prob
+        self.duration_sigma = duration_sigma
+        self.store = NullStateStore()
+
+    def _prob(self, component: str) -> float:
+        if isinstance(self.success_prob, dict):
+            return self.success_prob.get(component, 0.5)
+        return self.success_prob
+
+    def _done(self, available_versions: Dict[str, List[str]]) -> bool:
+        return all(len(versions) == 1 for versions in available_versions.values())
+
+    def _cache_key(self, current, bucket, backend) -> str:
+        fp = fingerprint(self.catalog.incompatible_pairs, self.upgrade_duration, self.catalog.versions,
+                         mode=self.mode, backend=backend, lanes=self.parellel, span=self.maxspan, backfill=self.backfill)
+        return ResultCache.key(fp, current, bucket)
+
+    def _select(self, available_versions, rest_time, running=None):
+        """
+        与 optimize 相同的选择：求解候选后取升级时间最长的 parellel 个服务
+
+        :param running: 正在进行的升级 {服务: 目标版本}，只为剩余的名额选择
+        """
+        current = {s: versions[0] for s, versions in available_versions.items()}
+        running = running or {}
+        key = None
+        if self.cache is not None:
+            bucket = duration_bucket(rest_time, self.upgrade_duration)
+            if running:
+                bucket = f"{bucket}-{state_key(running)[:12]}"
+            key = self._cache_key(current, bucket, self.solver.name)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return list(cached["selected"]), dict(cached["candidates"])
+        result = self.solver.solve(UpgradeProblem(self.catalog, current, self.upgrade_duration, rest_time, self.maxspan,
+                                                  running))
+        candidates = result.candidates
+        selected = sorted(candidates, key=lambda s: self.upgrade_duration[s], reverse=True)[:self.parellel - len(running)]
+        if key is not None:
+            self.cache.put(key, {"selected": selected, "candidates": candidates})
+        return selected, candidates
+
+    def _pack(self, available_versions, rest_time):
+        """装箱模式的选择：[{service, from, to, lane, start, end}, ...]"""
+        current = {s: versions[0] for s, versions in available_versions.items()}
+        key = None
+        if self.cache is not None:
+            bucket, rest_time = floor_bucket(rest_time, self.granularity)
+            key = self._cache_key(current, bucket, self.packer.name)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return [dict(t) for t in cached]
+        problem = UpgradeProblem(self.catalog, current, self.upgrade_duration, rest_time, self.maxspan)
+        tasks = pack_window(problem, self.upgrade_duration, self.parellel, rest_time, self.packer).tasks
+        if key is not None:
+            self.cache.put(key, [dict(t) for t in tasks])
+        return tasks
+
+    def run(self, seed: Optional[int] = None) -> dict:
+        """
+        模拟整个 T_max
+
+        :param seed: 随机种子，相同种子结果可复现
+        :return: {completion_time, windows_used, upgrades, rollbacks, final_versions, final_index}
+        """
+        rng = random.Random(seed)
+        clock = VirtualClock()
+        engine = SimulatedEngine(clock)
+        available_versions = {s: list(vs) for s, vs in self.data["available_versions"].items()}
+        stats = {"upgrades": 0, "rollbacks": 0}
+        completion_time = None
+        windows_used = 0
+        window_start = 0.0
+
+        while window_start + self.window_length <= self.T_max and not self._done(available_versions):
+            window_end = window_start + self.window_length
+            clock.now = window_start
+            used = False
+
+            def success_fn(component, original, target, window_end=window_end):
+                # 超出时间窗视为未就绪并回滚
+                ok = clock.now <= window_end and rng.random() < self._prob(component)
+                stats["upgrades"] += 1
+                stats["rollbacks"] += not ok
+                return ok
+
+            def duration_fn(component):
+                nominal = self.upgrade_duration[component]
+                if self.duration_sigma <= 0:
+                    return nominal
+                return nominal * math.exp(rng.gauss(0.0, self.duration_sigma))
+
+            backfill = self.backfill and self.mode != "pack"
+            if backfill:
+                # 补位模式：任一升级完成即为空出的名额重新求解
+                upgrader = AppUpgrader({}, available_versions, {}, self.catalog, engine=engine, store=self.store,
+                                       clock=clock, success_fn=success_fn, duration_fn=duration_fn, verbose=False)
+                used = upgrader.backfill(lambda rest, running: self._select(available_versions, rest, running),
+                                         window_end, self.upgrade_duration, self.parellel) > 0
+                if self._done(available_versions):
+                    completion_time = clock.now
+
+            # 窗内循环：与 scheduler.py 相同，一批升级全部结束后再选下一批
+            while not backfill and clock.now < window_end:
+                rest_time = window_end - clock.now
+                if self.mode == "pack":
+                    tasks = self._pack(available_versions, rest_time)
+                    selected, candidates = [t["service"] for t in tasks], {t["service"]: t["to"] for t in tasks}
+                else:
+                    tasks = None
+                    selected, candidates = self._select(available_versions, rest_time)
+                if not selected:
+                    break
+                used = True
+                upgrader = AppUpgrader({s: self.upgrade_duration[s] for s in selected}, available_versions,
+                                       candidates, self.catalog, engine=engine, store=self.store,
+                                       clock=clock, success_fn=success_fn, duration_fn=duration_fn, verbose=False)
+                if tasks is not None:
+                    starts = [engine.schedule(t["start"], upgrader.create_upgrade_function(t["service"])) for t in tasks]
+                    engine.await_all(starts)
+                else:
+                    for component in selected:
+                        upgrader.create_upgrade_function(component)()
+                upgrader.await_all()
+                if self._done(available_versions):
+                    completion_time = clock.now
+                    break
+
+            windows_used += used
+            window_start += self.window_length + self.gap_length
+
+        return {
+            "completion_time": completion_time,
+            "windows_used": windows_used,
+            "upgrades": stats["upgrades"],
+            "rollbacks": stats["rollbacks"],
+            "final_versions": {s: vs[0] for s, vs in available_versions.items()},
+            "final_index": sum(self.catalog.index(s, vs[0]) for s, vs in available_versions.items()),
+        }
+
+    def run_plan(self, plan: List[List[dict]], seed: Optional[int] = None) -> dict:
+        """
+        按固定计划（planner.HorizonPlanner.plan() 的输出）模拟执行
+
+        每个任务在窗内偏移处开始（同一服务串联的多跳在上一跳结束后开始），用时按 duration_sigma 扰动；
+        超出时间窗或判定失败即回滚，该服务后续依赖此版本的任务被跳过。
+
+        :return: 与 run() 相同的指标
+        """
+        rng = random.Random(seed)
+        versions = {s: vs[0] for s, vs in self.data["available_versions"].items()}
+        latest = {s: vs[-1] for s, vs in self.data["available_versions"].items()}
+        upgrades = rollbacks = windows_used = 0
+        completion_time = None
+        window_start = 0.0
+        for tasks in plan:
+            used = False
+            last_end = 0.0
+            ready_at = {}  # 同一服务串联的下一跳在上一跳实际结束后才开始
+            for t in sorted(tasks, key=lambda t: t["start"]):
+                s = t["service"]
+                if versions[s] != t["from"]:
+                    continue  # 前序跳失败，计划中的起点版本不存在
+                used = True
+                upgrades += 1
+                duration = t["end"] - t["start"]  # 计划中的单跳用时（多跳串联时各跳用时可不同）
+                if self.duration_sigma > 0:
+                    duration *= math.exp(rng.gauss(0.0, self.duration_sigma))
+                end = max(t["start"], ready_at.get(s, 0.0)) + duration
+                ready_at[s] = end
+                if end <= self.window_length and rng.random() < self._prob(s):
+                    versions[s] = t["to"]
+                    last_end = max(last_end, end)
+                else:
+                    rollbacks += 1
+            if completion_time is None and versions == latest:
+                completion_time = window_start + last_end
+            windows_used += used
+            window_start += self.window_length + self.gap_length
+        return {
+            "completion_time": completion_time,
+            "windows_used": windows_used,
+            "upgrades": upgrades,
+            "rollbacks": rollbacks,
+            "final_versions": versions,
+            "final_index": sum(self.catalog.index(s, v) for s, v in versions.items()),
+        }
+
+    def run_many(self, n: int, seed: int = 0) -> List[dict]:
+        """以 seed, seed+1, ... 连续运行 n 次"""
+        return [self.run(seed + i) for i in range(n)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="用虚拟时钟快速模拟整个 T_max 的调度")
+    parser.add_argument("--data", default="data copy.json")
+    parser.add_argument("--runs", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--solver", default="heuristic")
+    parser.add_argument("--mode", choices=["select", "pack"], default="select",
+                        help="pack 为按 parellel 条通道装箱，每条通道在窗内顺序执行多个升级")
+    parser.add_argument("--backfill", action="store_true", help="任一升级完成即为空出的并行名额重新求解")
+    parser.add_argument("--success-prob", type=float, default=0.5)
+    parser.add_argument("--sigma", type=float, default=0.0, help="实际用时的对数正态扰动 σ")
+    parser.add_argument("--duration-model", help="使用该模型文件中学习到的各服务成功率代替 --success-prob")
+    parser.add_argument("--no-cache", action="store_true", help="不缓存求解结果")
+    parser.add_argument("--cache-dir", help="求解结果的磁盘缓存目录，多次运行共享")
+    args = parser.parse_args()
+
+    with open(args.data, 'r') as f:
+        data = json.load(f)
+    success_prob = args.success_prob
+    if args.duration_model:
+        from duration_model import DurationModel
+        success_prob = DurationModel(args.duration_model, unit=None).success_probs(data["available_versions"])
+    cache = None if args.no_cache else ResultCache(path=args.cache_dir)
+    simulator = Simulator(data, args.solver, success_prob, args.sigma, mode=args.mode, cache=cache,
+                          backfill=args.backfill)
+    t0 = time.perf_counter()
+    results = simulator.run_many(args.runs, args.seed)
+    elapsed = time.perf_counter() - t0
+    finished = [r["completion_time"] for r in results if r["completion_time"] is not None]
+    print(f"{args.runs} 次模拟用时 {elapsed:.2f}s ({args.runs / elapsed:.0f} 次/秒)")
+    print(f"全部升级到最新版本: {len(finished)}/{args.runs}")
+    print(f"平均使用时间窗: {sum(r['windows_used'] for r in results) / args.runs:.2f}, "
+          f"平均回滚: {sum(r['rollbacks'] for r in results) / args.runs:.2f}")
+    if cache is not None:
+        stats = cache.stats()
+        print(f"求解结果缓存命中率: {stats['hit_rate']:.1%} ({stats['hits'] + stats['disk_hits']}/"
+              f"{stats['hits'] + stats['disk_hits'] + stats['misses']})")
@@ -0,0 +1,384 @@
+# 升级候选选择问题的求解器接口：Gurobi MILP、PuLP/CBC MILP 与无需求解器的启发式
+import time
+from typing import Dict, List, Tuple, Optional, Set
+from catalog import VersionCatalog
+
+
+class UpgradeProblem:
+    def __init__(self,
+                 catalog: VersionCatalog,
+                 current_versions: Dict[str, str],
+                 upgrade_duration: Dict[str, float],
+                 rest_time: float,
+                 span: int = 2,
+                 running: Optional[Dict[str, str]] = None):
+        """
+        单步升级候选选择问题（与 optimize 的数学模型等价）
+
+        候选项 (s, v) 的权重为升级跨越的版本数（与原模型中截断后版本列表的下标相同），每个服务至多选择一个候选项；
+        optimize 中三类不兼容约束（升级后/混合状态/升级过程）都被展开为候选项之间的冲突边，
+        问题即为带服务分组的最大权独立集。
+
+        :param catalog: 编译后的版本目录
+        :param current_versions: 各服务当前版本
+        :param upgrade_duration: 各服务升级所需时间
+        :param rest_time: 当前时间窗剩余时间，升级时长不小于它的服务不参与
+        :param span: 每次升级最多跨越的版本数
+        :param running: 正在进行的升级 {服务: 目标版本}（原版本取 current_versions），这些服务不参与，
+                        与它们在任一混合状态下不兼容的候选项也被排除
+        """
+        self.catalog = catalog
+        self.current_versions = current_versions
+        in_flight = {r: (current_versions[r], t) for r, t in (running or {}).items()}
+        self.items: List[Tuple[str, str]] = []
+        self.weights: List[float] = []
+        self.groups: Dict[str, List[int]] = {}
+        for s, current in current_versions.items():
+            if upgrade_duration[s] < rest_time and s not in in_flight:
+                current_idx = catalog.index(s, current)
+                for v, v_idx in catalog.candidates(s, current, span):
+                    if in_flight and catalog.clashes(s, current, v, in_flight):
+                        continue
+                    self.groups.setdefault(s, []).append(len(self.items))
+                    self.items.append((s, v))
+                    self.weights.append(v_idx - current_idx)
+        self.index = {k: i for i, k in enumerate(self.items)}
+        self.adjacency: List[Set[int]] = [set() for _ in self.items]
+
+        def link(a, b):
+            if a != b:
+                self.adjacency[a].add(b)
+                self.adjacency[b].add(a)
+
+        for i, (s1, v1) in enumerate(self.items):
+            for s2, v2 in catalog.conflicts_of(s1, v1):
+                # 升级后兼容：两个目标版本不兼容
+                if (s2, v2) in self.index:
+                    link(i, self.index[s2, v2])
+                # 混合状态兼容：x[s1, v1] + selected[s2] <= 1
+                if s2 != s1 and current_versions.get(s2) == v2:
+                    for j in self.groups.get(s2, []):
+                        link(i, j)
+        # 升级过程兼容：selected[s1] + selected[s2] <= 1
+        for s1 in self.groups:
+            for s2, v2 in catalog.conflicts_of(s1, current_versions[s1]):
+                if s2 != s1 and s2 in self.groups and current_versions[s2] == v2:
+                    for i in self.groups[s1]:
+                        for j in self.groups[s2]:
+                            link(i, j)
+
+    def edges(self) -> List[Tuple[int, int]]:
+        return [(i, j) for i, adj in enumerate(self.adjacency) for j in adj if i < j]
+
+    def group_of(self, i: int) -> str:
+        return self.items[i][0]
+
+    def trivial_bound(self) -> float:
+        """不依赖 LP 的上界：每个服务取权重最大的候选项"""
+        return sum(max(self.weights[i] for i in idx) for idx in self.groups.values())
+
+    def components(self) -> List[List[str]]:
+        """
+        冲突图的连通分量：由冲突边相连的服务归为一组，不同分量之间没有任何约束，可分别求解
+
+        :return: [[服务, ...], ...]，按分量大小从大到小排列
+        """
+        parent = {s: s for s in self.groups}
+
+        def find(s):
+            while parent[s] != s:
+                parent[s] = parent[parent[s]]
+                s = parent[s]
+            return s
+
+        for i, j in self.edges():
+            a, b = find(self.group_of(i)), find(self.group_of(j))
+            if a != b:
+                parent[a] = b
+        comps: Dict[str, List[str]] = {}
+        for s in self.groups:
+            comps.setdefault(find(s), []).append(s)
+        return sorted(comps.values(), key=lambda c: -sum(len(self.groups[s]) for s in c))
+
+    def subproblem(self, services: List[str]) -> "UpgradeProblem":
+        """
+        只包含 services 的子问题（候选项重新编号），services 应为一个或多个完整的连通分量
+
+        子问题不携带版本目录（catalog 为 None），只用于求解，可以低成本地发送到其他进程。
+        """
+        sub = UpgradeProblem.__new__(UpgradeProblem)
+        sub.catalog = None
+        sub.current_versions = {s: self.current_versions[s] for s in services}
+        old = [i for s in services for i in self.groups[s]]
+        remap = {i: k for k, i in enumerate(old)}
+        sub.items = [self.items[i] for i in old]
+        sub.weights = [self.weights[i] for i in old]
+        sub.groups = {s: [remap[i] for i in self.groups[s]] for s in services}
+        sub.index = {k: i for i, k in enumerate(sub.items)}
+        sub.adjacency = [{remap[j] for j in self.adjacency[i] if j in remap} for i in old]
+        return sub
+
+
+class SolverResult:
+    def __init__(self, backend: str, status: str, candidates: Dict[str, str],
+                 objective: float, bound: Optional[float], solve_time: float):
+        """
+        求解结果
+
+        :param backend: 求解器名称
+        :param status: optimal / feasible / infeasible
+        :param candidates: {服务: 目标版本}
+        :param objective: 目标值（版本索引之和）
+        :param bound: 目标值上界（LP 界或平凡界），未知时为 None
+        :param solve_time: 求解耗时(秒)
+        """
+        self.backend = backend
+        self.status = status
+        self.candidates = candidates
+        self.objective = objective
+        self.bound = bound
+        self.solve_time = solve_time
+
+    @property
+    def gap(self) -> Optional[float]:
+        """相对上界的最优性间隙"""
+        if self.bound is None:
+            return None
+        if self.bound <= 0:
+            return 0.0
+        return max(0.0, (self.bound - self.objective) / self.bound)
+
+    def __repr__(self):
+        gap = "N/A" if self.gap is None else f"{self.gap:.2%}"
+        return (f"SolverResult({self.backend}, {self.status}, obj={self.objective}, "
+                f"bound={self.bound}, gap={gap}, {self.solve_time * 1e3:.3f}ms)")
+
+
+class Solver:
+    """求解器接口"""
+    name = "base"
+
+    def solve(self, problem: UpgradeProblem) -> SolverResult:
+        raise NotImplementedError
+
+    def _result(self, problem, status, chosen, bound, start):
+        candidates = {problem.items[i][0]: problem.items[i][1] for i in chosen}
+        objective = sum(problem.weights[i] for i in chosen)
+        return SolverResult(self.name, status, candidates, objective, bound, time.perf_counter() - start)
+
+
+class GurobiSolver(Solver):
+    """原 optimize 使用的 Gurobi MILP"""
+    name = "gurobi"
+
+    def __init__(self, output_flag: int = 1):
+        from gurobipy import Model  # noqa: F401 需要 gurobipy 及许可证
+        self.output_flag = output_flag
+
+    def solve(self, problem):
+        from gurobipy import Model, GRB, quicksum
+        start = time.perf_counter()
+        m = Model("Next_Batch_Upgrade_Candidates")
+        m.Params.OutputFlag = self.output_flag
+        x = [m.addVar(vtype=GRB.BINARY, obj=w, name=f"x_{s}_{v}")
+             for (s, v), w in zip(problem.items, problem.weights)]
+        for idx in problem.groups.values():
+            m.addConstr(quicksum(x[i] for i in idx) <= 1)
+        for i, j in problem.edges():
+            m.addConstr(x[i] + x[j] <= 1)
+        m.ModelSense = GRB.MAXIMIZE
+        m.optimize()
+        if m.status != GRB.OPTIMAL:
+            return self._result(problem, "infeasible", [], None, start)
+        chosen = [i for i, var in enumerate(x) if var.X > 0.5]
+        return self._result(problem, "optimal", chosen, m.ObjBound, start)
+
+
+class PulpSolver(Solver):
+    """开源 MILP：PuLP + CBC"""
+    name = "cbc"
+
+    def __init__(self, msg: bool = False):
+        import pulp  # noqa: F401
+        self.msg = msg
+
+    def _model(self, problem, cat):
+        import pulp
+        m = pulp.LpProblem("Next_Batch_Upgrade_Candidates", pulp.LpMaximize)
+        x = [pulp.LpVariable(f"x_{i}", 0, 1, cat=cat) for i in range(len(problem.items))]
+        m += pulp.lpSum(w * var for w, var in zip(problem.weights, x))
+        for idx in problem.groups.values():
+            m += pulp.lpSum(x[i] for i in idx) <= 1
+        for i, j in problem.edges():
+            m += x[i] + x[j] <= 1
+        return m, x
+
+    def lp_bound(self, problem) -> float:
+        """LP 松弛上界"""
+        import pulp
+        if not problem.items:
+            return 0.0
+        m, _ = self._model(problem, pulp.LpContinuous)
+        m.solve(pulp.PULP_CBC_CMD(msg=self.msg))
+        return pulp.value(m.objective) or 0.0
+
+    def solve(self, problem):
+        import pulp
+        start = time.perf_counter()
+        if not problem.items:
+            return self._result(problem, "optimal", [], 0.0, start)
+        m, x = self._model(problem, pulp.LpBinary)
+        m.solve(pulp.PULP_CBC_CMD(msg=self.msg))
+        if pulp.LpStatus[m.status] != "Optimal":
+            return self._result(problem, "infeasible", [], None, start)
+        chosen = [i for i, var in enumerate(x) if (var.value() or 0) > 0.5]
+        return self._result(problem, "optimal", chosen, pulp.value(m.objective), start)
+
+
+class HeuristicSolver(Solver):
+    """
+    无需求解器的贪心 + 局部搜索
+
+    先按 权重/(1+冲突度) 贪心选择，再反复尝试用一个未选候选项替换与它冲突的已选候选项
+    （包括同服务的其他版本），直到不再改进。没有冲突边时贪心解即最优。
+    """
+    name = "heuristic"
+
+    def __init__(self, max_rounds: int = 20, bound_solver: Optional[Solver] = None):
+        """
+        :param max_rounds: 局部搜索最大轮数
+        :param bound_solver: 可选，提供 lp_bound() 的求解器，用于计算 LP 上界与最优性间隙
+        """
+        self.max_rounds = max_rounds
+        self.bound_solver = bound_solver
+
+    def solve(self, problem):
+        start = time.perf_counter()
+        weights, adjacency = problem.weights, problem.adjacency
+        order = sorted(range(len(problem.items)),
+                       key=lambda i: weights[i] / (1 + len(adjacency[i])), reverse=True)
+        chosen: Set[int] = set()
+        taken: Dict[str, int] = {}
+        for i in order:
+            s = problem.group_of(i)
+            if s not in taken and not (adjacency[i] & chosen):
+                chosen.add(i)
+                taken[s] = i
+
+        for _ in range(self.max_rounds):
+            improved = False
+            for i in order:
+                if i in chosen:
+                    continue
+                s = problem.group_of(i)
+                blocking = adjacency[i] & chosen
+                if s in taken:
+                    blocking = blocking | {taken[s]}
+                if weights[i] > sum(weights[j] for j in blocking):
+                    for j in blocking:
+                        chosen.discard(j)
+                        del taken[problem.group_of(j)]
+                    chosen.add(i)
+                    taken[s] = i
+                    improved = True
+            if not improved:
+                break
+
+        if not any(adjacency):
+            return self._result(problem, "optimal", chosen, problem.trivial_bound(), start)
+        bound = problem.trivial_bound()
+        if self.bound_solver is not None:
+            bound = min(bound, self.bound_solver.lp_bound(problem))
+        return self._result(problem, "feasible", chosen, bound, start)
+
+
+def _solve_component(solver: Solver, problem: UpgradeProblem) -> SolverResult:
+    """进程池中执行的子问题求解（模块级函数以便序列化）"""
+    return solver.solve(problem)
+
+
+class DecomposingSolver(Solver):
+    """
+    按冲突图连通分量分解求解
+
+    没有冲突边的单个服务直接取权重最大的候选项（闭式解）；其余分量分别交给 inner 求解，
+    候选项数不少于 parallel_threshold 的分量在进程池中并行求解，较小的分量在当前进程内求解
+    （进程间传递的开销大于求解本身）。目标函数按服务可加、分量之间没有约束，合并后的解与整体求解等价；
+    parellel 上限仍由调用方（optimize 按升级时长取前 parellel 个）在合并后的候选集上施加。
+    求解时间随最大的耦合分量而不是整个目录增长。
+    """
+    name = "decompose"
+
+    def __init__(self, inner="auto", workers: Optional[int] = None, parallel_threshold: int = 200):
+        """
+        :param inner: 各分量使用的求解器名称或实例
+        :param workers: 进程池大小，默认为 CPU 数；0 表示全部在当前进程内求解
+        :param parallel_threshold: 送入进程池的分量的最小候选项数
+        """
+        self.inner = get_solver(inner) if isinstance(inner, str) else inner
+        self.name = f"decompose+{self.inner.name}"
+        self.workers = workers
+        self.parallel_threshold = parallel_threshold
+        self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def solve(self, problem):
+        start = time.perf_counter()
+        closed: List[int] = []
+        small, large = [], []
+        for comp in problem.components():
+            idx = problem.groups[comp[0]]
+            if len(comp) == 1 and not any(problem.adjacency[i] for i in idx):
+                closed.append(max(idx, key=lambda i: problem.weights[i]))
+            else:
+                sub = problem.subproblem(comp)
+                (large if len(sub.items) >= self.parallel_threshold else small).append(sub)
+        if self.workers == 0 or len(large) < 2:
+            small, large = small + large, []
+
+        futures = [self._executor().submit(_solve_component, self.inner, sub) for sub in large]
+        results = [self.inner.solve(sub) for sub in small] + [f.result() for f in futures]
+        if any(r.status == "infeasible" for r in results):
+            return self._result(problem, "infeasible", [], None, start)
+        chosen = closed + [problem.index[k] for r in results for k in r.candidates.items()]
+        status = "optimal" if all(r.status == "optimal" for r in results) else "feasible"
+        bound = None
+        if all(r.bound is not None for r in results):
+            bound = sum(r.bound for r in results) + sum(problem.weights[i] for i in closed)
+        return self._result(problem, status, chosen, bound, start)
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+SOLVERS = {
+    "gurobi": GurobiSolver,
+    "cbc": PulpSolver,
+    "heuristic": HeuristicSolver,
+    "decompose": DecomposingSolver,
+}
+
+
+def get_solver(name: str = "auto", **kwargs) -> Solver:
+    """
+    按名称创建求解器；auto 表示依次尝试 gurobi、cbc，均不可用时使用启发式
+
+    :param name: gurobi / cbc / heuristic / decompose / auto，decompose:<后端> 表示按连通分量分解后用该后端求解
+    """
+    if name.startswith("decompose:"):
+        return DecomposingSolver(name.split(":", 1)[1], **kwargs)
+    if name != "auto":
+        return SOLVERS[name](**kwargs)
+    for backend in ("gurobi", "cbc"):
+        try:
+            return SOLVERS[backend]()
+        except ImportError:
+            continue
+    return HeuristicSolver(**kwargs)
@@ -0,0 +1,216 @@
+# 升级状态持久化：追加写的预写日志（WAL）+ 定期原子快照，由后台线程批量刷盘
+import os
+import json
+import time
+import atexit
+import tempfile
+import threading
+from typing import Dict, List, Tuple, Optional
+
+
+class VersionStateStore:
+    def __init__(self,
+                 snapshot_path: str = 'data.json',
+                 wal_path: Optional[str] = None,
+                 flush_interval: float = 0.5,
+                 compact_every: int = 1,
+                 fsync: bool = False):
+        """
+        版本状态存储
+
+        每次版本迁移只追加一行到 WAL 并唤醒后台线程批量写入；
+        WAL 累计 compact_every 条后写一次压缩快照（临时文件 + rename，原子替换）并清空 WAL。
+        默认每批迁移落盘后都写快照，data.json 始终反映已提交的升级。
+
+        :param snapshot_path: 快照文件路径
+        :param wal_path: WAL 路径，默认为 snapshot_path + '.wal'
+        :param flush_interval: 后台批量刷盘间隔(秒)
+        :param compact_every: WAL 条数达到该值时压缩为快照，1 表示每批迁移后都写快照
+        :param fsync: 刷盘后是否 fsync
+        """
+        self.snapshot_path = snapshot_path
+        self.wal_path = wal_path or snapshot_path + '.wal'
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self._lock = threading.Lock()        # 保护内存状态与待写队列
+        self._io_lock = threading.Lock()     # 串行化文件写入
+        self._pending: List[dict] = []
+        self._wake = threading.Event()
+        self._closed = False
+        self.available_versions, self.version_history, self.seq = self.recover()
+        self._wal_entries = self._count_wal()
+        self._thread = threading.Thread(target=self._run, name="VersionStateStore", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---------------- 写入 ----------------
+
+    def seed(self, available_versions: Dict[str, List[str]]) -> None:
+        """登记尚未被存储跟踪的组件（不写 WAL，下次快照时一并写入）"""
+        with self._lock:
+            for component, versions in available_versions.items():
+                self.available_versions.setdefault(component, list(versions))
+
+    def reset(self, available_versions: Dict[str, List[str]]) -> None:
+        """
+        丢弃上次运行恢复出的状态，以 available_versions 重新开始（不续跑时使用）：
+        清空待写队列和版本历史，写入新快照并截断 WAL
+        """
+        with self._io_lock:
+            with self._lock:
+                self._pending = []
+                self.available_versions = {c: list(v) for c, v in available_versions.items()}
+                self.version_history = {}
+            self._compact()
+
+    def record(self, component: str, original: str, target: str, versions: List[str]) -> int:
+        """
+        记录一次成功的版本迁移，立即返回，由后台线程批量落盘
+
+        :param versions: 迁移后该组件的可用版本列表
+        :return: 该迁移的序号
+        """
+        with self._lock:
+            self.seq += 1
+            entry = {"seq": self.seq, "component": component, "from": original, "to": target,
+                     "versions": list(versions), "ts": time.time()}
+            self._apply(entry)
+            self._pending.append(entry)
+        self._wake.set()
+        return entry["seq"]
+
+    def _apply(self, entry: dict) -> None:
+        self.available_versions[entry["component"]] = list(entry["versions"])
+        self.version_history.setdefault(entry["component"], []).append((entry["from"], entry["to"]))
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        """将待写迁移追加到 WAL，必要时压缩为快照"""
+        with self._io_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if batch:
+                with open(self.wal_path, 'a', encoding='utf-8') as f:
+                    f.write(''.join(json.dumps(e, ensure_ascii=False) + '\n' for e in batch))
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+                self._wal_entries += len(batch)
+            if self._wal_entries >= self.compact_every:
+                self._compact()
+
+    def _compact(self) -> None:
+        """原子写入快照后截断 WAL（调用方持有 _io_lock）"""
+        with self._lock:
+            state = {
+                "seq": self.seq,
+                "available_versions": {c: list(v) for c, v in self.available_versions.items()},
+                "version_history": {c: list(h) for c, h in self.version_history.items()},
+            }
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        fd, tmp = tempfile.mkstemp(prefix='.snapshot-', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=4)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            os.replace(tmp, self.snapshot_path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        # 快照已包含 WAL 中的全部迁移，恢复时序号不大于快照的记录会被跳过
+        open(self.wal_path, 'w').close()
+        self._wal_entries = 0
+
+    def snapshot(self) -> None:
+        """立即刷盘并写入快照"""
+        self.flush()
+        with self._io_lock:
+            self._compact()
+
+    def close(self) -> None:
+        """停止后台线程并写入最终快照"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.snapshot()
+
+    # ---------------- 恢复 ----------------
+
+    def _count_wal(self) -> int:
+        if not os.path.exists(self.wal_path):
+            return 0
+        with open(self.wal_path, encoding='utf-8') as f:
+            return sum(1 for line in f if line.strip())
+
+    def recover(self) -> Tuple[Dict[str, List[str]], Dict[str, List[Tuple[str, str]]], int]:
+        """
+        从快照和 WAL 恢复状态
+
+        :return: (available_versions, version_history, 最新序号)
+        """
+        available_versions, version_history, seq = {}, {}, 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                state = json.load(f)
+            if "available_versions" in state:
+                available_versions = state["available_versions"]
+                version_history = {c: [tuple(p) for p in h] for c, h in state.get("version_history", {}).items()}
+                seq = state.get("seq", 0)
+            else:
+                # 旧格式：data.json 只保存 available_versions
+                available_versions = state
+        if os.path.exists(self.wal_path):
+            with open(self.wal_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # 崩溃时写了一半的最后一行
+                    if entry["seq"] <= seq:
+                        continue
+                    available_versions[entry["component"]] = entry["versions"]
+                    version_history.setdefault(entry["component"], []).append((entry["from"], entry["to"]))
+                    seq = entry["seq"]
+        return available_versions, version_history, seq
+
+
+class NullStateStore:
+    """不落盘的存储，AppUpgrader 未指定存储时使用，也用于模拟和测试"""
+    def seed(self, available_versions: Dict[str, List[str]]) -> None:
+        pass
+
+    def reset(self, available_versions: Dict[str, List[str]]) -> None:
+        pass
+
+    def record(self, component: str, original: str, target: str, versions: List[str]) -> int:
+        return 0
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+_default_store: Optional[VersionStateStore] = None
+_default_lock = threading.Lock()
+
+
+def default_store() -> VersionStateStore:
+    """进程内共享的存储，快照写入当前目录的 data.json（首次调用时创建后台写线程），由调度器显式使用"""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = VersionStateStore()
+        return _default_store
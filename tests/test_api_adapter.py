@@ -0,0 +1,94 @@
+import os
+import importlib.util
+from importlib.machinery import SourceFileLoader
+
+import matplotlib
+matplotlib.use("Agg")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_api():
+    # api 脚本没有 .py 后缀，按源文件加载
+    loader = SourceFileLoader("api_visualizer", os.path.join(ROOT, "api"))
+    spec = importlib.util.spec_from_loader(loader.name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+api = load_api()
+
+
+def task(status="running", frm="v1", to="v2"):
+    return {"status": status, "duration": 3.0, "start_time": 100.0, "expected_duration": 5.0,
+            "from_ver": frm, "to_ver": to}
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return dict(self.payload)
+
+
+class FakeSession:
+    def __init__(self, server):
+        self.server = server
+        self.requests = []
+
+    def get(self, url, params=None, timeout=None):
+        self.requests.append(params["since"])
+        return FakeResponse(self.server(params["since"]))
+
+
+def test_older_delta_does_not_move_seq_backwards():
+    adapter = api.ApiUpgraderAdapter("http://test", stream=False)
+    adapter._apply({"seq": 5, "tasks": {"a": task("succeeded")}})
+    adapter._apply({"seq": 3, "tasks": {"a": task("running")}})
+    assert adapter._seq == 5
+    assert adapter.get_upgrade_status() == {"a": False}
+    assert adapter.get_upgrade_times() == {"a": 3.0}
+
+
+def test_reset_is_accepted_with_lower_seq():
+    adapter = api.ApiUpgraderAdapter("http://test", stream=False)
+    adapter._apply({"seq": 9, "tasks": {"a": task(), "b": task()}})
+    adapter._apply({"seq": 2, "reset": True, "tasks": {"c": task()}})
+    assert adapter._seq == 2
+    assert set(adapter.get_upgrade_status()) == {"c"}
+
+
+def test_restarted_server_triggers_full_resync():
+    adapter = api.ApiUpgraderAdapter("http://test", stream=False)
+    adapter._apply({"seq": 9, "tasks": {"a": task(), "b": task()}})
+    # 重启后的服务端序号更小，推送流送来未带 reset 的增量
+    adapter._pending.append({"seq": 1, "tasks": {"c": task()}})
+    adapter._stream_ok = True
+    adapter._session = FakeSession(lambda since: {"seq": 1, "tasks": {"c": task(), "d": task()}})
+    assert adapter.fetch_data()
+    assert adapter._session.requests == [0]
+    assert adapter._seq == 1
+    assert adapter.services == ["c", "d"]
+
+
+def test_poll_uses_current_seq():
+    adapter = api.ApiUpgraderAdapter("http://test", stream=False)
+    adapter._session = FakeSession(lambda since: {"seq": since + 1, "tasks": {"a": task("succeeded")}})
+    assert adapter.fetch_data()
+    assert adapter.fetch_data()
+    assert adapter._session.requests == [0, 1]
+    assert adapter._seq == 2
+
+
+def test_tasks_are_kept_per_slot_with_service_labels():
+    adapter = api.ApiUpgraderAdapter("http://test", stream=False)
+    hop1 = dict(task("succeeded", "1", "2"), name="nova")
+    hop2 = dict(task("running", "2", "3"), name="nova")
+    adapter._apply({"seq": 2, "tasks": {"1:nova:1->2": hop1, "1:nova:2->3": hop2}})
+    assert adapter.available_versions == {"1:nova:1->2": ["2"], "1:nova:2->3": ["2"]}
+    assert adapter.labels == {"1:nova:1->2": "nova", "1:nova:2->3": "nova"}
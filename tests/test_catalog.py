@@ -0,0 +1,34 @@
+from catalog import VersionCatalog
+from solvers import UpgradeProblem, get_solver
+
+VERSIONS = {"A": ["1", "2", "3", "4", "5"], "B": ["1", "2", "3"]}
+
+
+def test_index_and_candidates():
+    catalog = VersionCatalog(VERSIONS)
+    assert catalog.index("A", "4") == 3
+    assert catalog.candidates("A", "3") == [("4", 3), ("5", 4)]
+    assert catalog.candidates("A", "5") == []
+    assert catalog.offset("A", ["3", "4", "5"], "5") == 2
+
+
+def test_conflicts_are_symmetric():
+    catalog = VersionCatalog(VERSIONS, [["A", "4", "B", "2"]])
+    assert not catalog.compatible("A", "4", "B", "2")
+    assert not catalog.compatible("B", "2", "A", "4")
+    assert catalog.compatible("A", "3", "B", "2")
+
+
+def test_weight_is_hops_gained():
+    # 目标系数为跨越的版本数，与已升级到多高无关
+    catalog = VersionCatalog(VERSIONS)
+    problem = UpgradeProblem(catalog, {"A": "3", "B": "1"}, {"A": 1, "B": 1}, rest_time=10)
+    assert dict(zip(problem.items, problem.weights)) == {("A", "4"): 1, ("A", "5"): 2, ("B", "2"): 1, ("B", "3"): 2}
+
+
+def test_conflict_prefers_more_hops_not_higher_index():
+    # A 3->4 与 B 1->3 冲突：B 跨两个版本，应选 B，而不是下标更大的 A
+    catalog = VersionCatalog({"A": ["1", "2", "3", "4"], "B": ["1", "2", "3"]}, [["A", "4", "B", "3"], ["A", "4", "B", "2"]])
+    problem = UpgradeProblem(catalog, {"A": "3", "B": "1"}, {"A": 1, "B": 1}, rest_time=10)
+    for backend in ("heuristic", "decompose:heuristic"):
+        assert get_solver(backend).solve(problem).candidates == {"B": "3"}
@@ -0,0 +1,68 @@
+from cluster import CachingClusterClient, FakeClusterClient
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_client(**kwargs):
+    clock = Clock()
+    inner = FakeClusterClient(**kwargs)
+    return CachingClusterClient(inner, ttl=10, clock=clock), inner, clock
+
+
+def count(inner, name):
+    return sum(1 for c in inner.calls if c[0] == name)
+
+
+def test_entries_expire_after_ttl():
+    client, inner, clock = make_client()
+    assert not client.namespace_exists("ns")
+    inner.namespaces.add("ns")
+    clock.now = 9.9
+    assert not client.namespace_exists("ns")  # 仍在有效期内，不重新查询
+    clock.now = 10.0
+    assert client.namespace_exists("ns")
+    assert count(inner, "namespace_exists") == 2
+    assert client.stats()["namespace"] == {"hits": 1, "misses": 2}
+
+
+def test_helm_upgrade_updates_and_invalidates_entries():
+    client, inner, clock = make_client(fail_upgrades=["heat-1"])
+    assert client.list_releases("ns") == [] and not client.namespace_exists("ns")
+    assert client.helm_upgrade("nova-1", "/charts/nova/2", "ns", {})[0]
+    # 成功的升级直接更新缓存：命名空间已创建，release 已加入列表
+    assert client.namespace_exists("ns") and client.release_exists("ns", "nova-1")
+    assert count(inner, "namespace_exists") == 1 and count(inner, "list_releases") == 1
+    # 失败的升级作废该命名空间的全部条目
+    assert not client.helm_upgrade("heat-1", "/charts/heat/2", "ns", {})[0]
+    assert client.release_exists("ns", "nova-1")
+    assert count(inner, "list_releases") == 2
+
+
+def test_deployment_lookup_refetches_only_negative_results_after_write():
+    client, inner, clock = make_client()
+    assert client.list_deployments("ns") == []
+    assert not client.deployment_exists("ns", "nova-deployment")  # 没有写操作，负结果可信
+    assert count(inner, "list_deployments") == 1
+    client.helm_upgrade("nova-1", "/charts/nova/2", "ns", {})
+    assert client.deployment_exists("ns", "nova-deployment")  # 写操作后负结果重新查询
+    assert count(inner, "list_deployments") == 2
+    assert client.deployment_exists("ns", "nova-deployment")
+    assert not client.deployment_exists("ns", "glance-deployment")  # 重新查询后清除了写标记
+    assert count(inner, "list_deployments") == 2
+    assert client.stats()["deployments"] == {"hits": 3, "misses": 2}
+
+
+def test_pull_secret_is_patched_once_per_namespace():
+    client, inner, clock = make_client()
+    assert not client.ensure_pull_secret("ns", "secret")  # 命名空间不存在
+    inner.namespaces.add("ns")
+    client.invalidate("ns")
+    assert client.ensure_pull_secret("ns", "secret") and client.ensure_pull_secret("ns", "secret")
+    assert count(inner, "ensure_pull_secret") == 1
+    assert client.stats()["pull_secret"] == {"hits": 1, "misses": 2}
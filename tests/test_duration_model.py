@@ -0,0 +1,75 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import getpod
+from cluster import FakeClusterClient
+from duration_model import DurationModel, QuantileSketch
+
+
+def test_sketch_quantiles_within_relative_error():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(3, 1) for _ in range(5000)]
+    sketch = QuantileSketch(alpha=0.01)
+    for v in values:
+        sketch.add(v)
+    ordered = sorted(values)
+    for q in (0.1, 0.5, 0.9, 0.99):
+        exact = ordered[int(q * (len(ordered) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= 0.011 * exact
+    assert sketch.quantile(0) == pytest.approx(min(values), rel=0.011)
+    assert sketch.quantile(1) == pytest.approx(max(values), rel=0.011)
+
+
+def test_sketch_merge_and_roundtrip():
+    a, b = QuantileSketch(), QuantileSketch()
+    for v in range(1, 51):
+        a.add(v)
+    for v in range(51, 101):
+        b.add(v)
+    a.merge(b)
+    restored = QuantileSketch.from_dict(a.to_dict())
+    assert restored.count == 100
+    assert restored.quantile(0.5) == pytest.approx(50, rel=0.02)
+    assert QuantileSketch().quantile(0.5) is None
+
+
+def test_estimate_falls_back_through_levels():
+    model = DurationModel(None, min_samples=3)
+    for d in (10, 11, 12):
+        model.observe("a", "v1", "v2", d, True)
+    model.observe("a", "v1", "v3", 100, True)
+    model.observe("a", "v1", "v3", 5, False)  # 失败的用时不计入分布
+    assert model.estimate("a", None, "v1", "v2", q=0.5) == pytest.approx(11, rel=0.02)
+    # 该版本跳只有 1 个样本，退回从 v1 出发的全部跳
+    assert model.estimate("a", None, "v1", "v3", q=1.0) == pytest.approx(100, rel=0.02)
+    assert model.estimate("b", 7.0) == 7.0
+    assert model.durations({"a": 1.0, "b": 2.0}, {"a": "v1"}, q=0.5, scale=10) == {
+        "a": pytest.approx(1.1, rel=0.02), "b": 2.0}
+
+
+def test_save_load_keeps_unit_and_rejects_mismatch(tmp_path):
+    path = str(tmp_path / "model.json")
+    model = DurationModel(path, unit="sim")
+    for d in (1, 2, 3, 4, 5):
+        model.observe("a", "v1", "v2", d, True)
+    model.save()
+    assert DurationModel(path, unit="sim").estimate("a", q=0.5) == pytest.approx(3, rel=0.02)
+    assert DurationModel(path, unit=None).unit == "sim"
+    with pytest.raises(ValueError):
+        DurationModel(path, unit="s")
+
+
+def test_poll_mode_does_not_learn_its_own_readiness_delay(monkeypatch):
+    monkeypatch.setattr(getpod, "cluster_client", getpod.cluster_client)
+    monkeypatch.setattr(getpod, "rollout_watcher", None)
+    model = DurationModel(path=None)
+    monkeypatch.setattr(getpod, "duration_model", model)
+    getpod.set_cluster_client(FakeClusterClient())
+    # 轮询模式先固定等待计划时长(0.3s)再检查就绪，这段等待不是升级本身的用时
+    task = {"name": "nova", "region": "ns", "version": {"from": "1", "to": "2"}, "timeline": {"start": 0, "end": 0.3}}
+    manager = getpod.UpgradeStateManager()
+    manager.register_tasks([task])
+    assert getpod.perform_task(task, "/charts", datetime.now() + timedelta(seconds=5), manager)
+    assert model.hops["nova", "1", "2"].durations.quantile(1.0) < 0.3
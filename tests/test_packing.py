@@ -0,0 +1,56 @@
+import random
+
+from catalog import VersionCatalog
+from solvers import UpgradeProblem
+from packing import HeuristicPacker, PackingProblem, pack_window, task_entries
+
+
+def random_packing(rng, n_services=8, lanes=3, capacity=10.0):
+    versions = {f"s{i}": [str(v) for v in range(rng.randint(2, 4))] for i in range(n_services)}
+    pairs = []
+    for _ in range(6):
+        s1, s2 = rng.sample(sorted(versions), 2)
+        pairs.append([s1, rng.choice(versions[s1]), s2, rng.choice(versions[s2])])
+    durations = {s: round(rng.uniform(0.5, 6.0), 2) for s in versions}
+    current = {s: vs[0] for s, vs in versions.items()}
+    problem = UpgradeProblem(VersionCatalog(versions, pairs), current, durations, rest_time=capacity)
+    return PackingProblem(problem, durations, lanes, capacity)
+
+
+def test_heuristic_lanes_stay_within_capacity_and_conflict_free():
+    rng = random.Random(3)
+    for _ in range(30):
+        packing = random_packing(rng)
+        result = HeuristicPacker().pack(packing)
+        lanes = {}
+        for t in result.tasks:
+            lanes.setdefault(t["lane"], []).append(t)
+        for tasks in lanes.values():
+            tasks.sort(key=lambda t: t["start"])
+            assert tasks[-1]["end"] <= packing.capacity + 1e-9
+            for a, b in zip(tasks, tasks[1:]):
+                assert a["end"] <= b["start"] + 1e-9
+        chosen = [packing.problem.index[t["service"], t["to"]] for t in result.tasks]
+        assert len({t["service"] for t in result.tasks}) == len(chosen)
+        assert all(j not in packing.problem.adjacency[i] for i in chosen for j in chosen)
+        assert result.objective == sum(packing.gains[i] for i in chosen)
+        assert result.objective <= result.bound
+
+
+def test_objective_counts_hops_gained():
+    catalog = VersionCatalog({"A": ["1", "2", "3"], "B": ["1", "2"]})
+    problem = UpgradeProblem(catalog, {"A": "1", "B": "1"}, {"A": 2, "B": 2}, rest_time=4)
+    result = pack_window(problem, {"A": 2, "B": 2}, lanes=1, capacity=4, packer="heuristic")
+    assert result.candidates == {"A": "3", "B": "2"}
+    assert result.objective == 3
+    assert result.makespan == 4
+
+
+def test_task_entries_round_up_and_keep_lanes_sequential():
+    tasks = [{"service": "a", "from": "1", "to": "2", "start": 0.0, "end": 0.25},
+             {"service": "b", "from": "1", "to": "2", "start": 0.25, "end": 0.6},
+             {"service": "c", "from": "1", "to": "2", "start": 0.0, "end": 0.1}]
+    entries = task_entries(tasks, {"a": "ns-a"}, time_unit=10)
+    assert [e["timeline"] for e in entries] == [{"start": 0, "end": 3}, {"start": 3, "end": 6}, {"start": 0, "end": 1}]
+    assert entries[0]["region"] == "ns-a" and entries[1]["region"] == "default"
+    assert entries[0]["version"] == {"from": "1", "to": "2"}
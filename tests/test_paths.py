@@ -0,0 +1,40 @@
+import pytest
+
+from catalog import VersionCatalog
+from paths import UpgradePaths
+
+VERSIONS = {"A": ["1", "2", "3", "4"], "B": ["1", "2", "3"]}
+
+
+def make_paths(hops=None, span=2):
+    return UpgradePaths(VersionCatalog(VERSIONS), {"A": 2, "B": 1}, hops, span)
+
+
+def test_default_hops_respect_span():
+    paths = make_paths(span=2)
+    assert paths.hops("A", "1") == {"2": 2.0, "3": 2.0}
+    assert paths.duration("A", "1", "4") is None
+    assert paths.hops("A", "4") == {}
+
+
+def test_explicit_hops_replace_defaults():
+    paths = make_paths({"A": [["1", "3", 5], ["3", "4"]]})
+    assert paths.hops("A", "1") == {"3": 5.0}
+    assert paths.duration("A", "3", "4") == 2.0
+    assert paths.hops("A", "2") == {}
+    with pytest.raises(ValueError):
+        make_paths({"A": [["3", "2"]]})
+
+
+def test_walk_enumerates_paths_within_budget():
+    paths = make_paths(span=1)
+    walked = dict(paths.walk("A", "1", budget=4))
+    assert walked == {("1", "2"): 2.0, ("1", "2", "3"): 4.0}
+    assert dict(paths.walk("A", "1", budget=10, max_hops=1)) == {("1", "2"): 2.0}
+
+
+def test_shortest_prefers_cheaper_chain():
+    paths = make_paths({"A": [["1", "4", 10], ["1", "2", 1], ["2", "4", 3]]})
+    assert paths.shortest("A", "1") == (("1", "2", "4"), 4.0)
+    assert paths.shortest("A", "2", "3") is None
+    assert make_paths().to_dict()["B"] == [["1", "2", 1], ["1", "3", 1], ["2", "3", 1]]
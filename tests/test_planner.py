@@ -0,0 +1,29 @@
+import json
+import os
+from datetime import datetime
+
+import getpod
+from getpod import UpgradeStateManager, WindowExecutor, execute_schedule
+from planner import HorizonPlanner
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_executor_pool_matches_planned_lanes(monkeypatch):
+    with open(os.path.join(ROOT, "data copy.json")) as f:
+        data = json.load(f)
+    data["parellel"] = 5
+    planner = HorizonPlanner(data, time_unit=10)
+    schedule = planner.to_schedule(planner.plan(), datetime(2099, 1, 1))["upgrade_schedule"]
+    assert schedule["parellel"] == 5
+
+    executors = []
+
+    class RecordingExecutor(WindowExecutor):
+        def submit_schedule(self, schedule):
+            executors.append(self)  # 时间窗都在将来，只检查线程池
+
+    monkeypatch.setattr(getpod, "WindowExecutor", RecordingExecutor)
+    execute_schedule(schedule, "/charts", UpgradeStateManager())
+    execute_schedule(schedule, "/charts", UpgradeStateManager(), max_workers=2)
+    assert [e.pool._max_workers for e in executors] == [5, 2]
@@ -0,0 +1,36 @@
+from result_cache import ResultCache, duration_bucket, fingerprint, floor_bucket, state_key
+
+PAIRS = [["A", "2", "B", "1"], ["A", "3", "B", "2"]]
+DURATIONS = {"A": 3, "B": 5}
+VERSIONS = {"A": ["1", "2", "3"], "B": ["1", "2"]}
+
+
+def test_fingerprint_ignores_order_but_tracks_every_input():
+    base = fingerprint(PAIRS, DURATIONS, VERSIONS, span=2)
+    assert base == fingerprint(list(reversed(PAIRS)), {"B": 5, "A": 3}, {"B": ["1", "2"], "A": ["1", "2", "3"]}, span=2)
+    assert base != fingerprint(PAIRS[:1], DURATIONS, VERSIONS, span=2)
+    assert base != fingerprint(PAIRS, {"A": 3, "B": 6}, VERSIONS, span=2)
+    # 目录中新增版本或调整跨度后，同一版本向量下的候选集不同，不能命中旧结果
+    assert base != fingerprint(PAIRS, DURATIONS, dict(VERSIONS, B=["1", "2", "3"]), span=2)
+    assert base != fingerprint(PAIRS, DURATIONS, VERSIONS, span=3)
+
+
+def test_buckets():
+    assert state_key({"A": "1", "B": "2"}) == state_key({"B": "2", "A": "1"})
+    assert duration_bucket(4, DURATIONS) == duration_bucket(4.9, DURATIONS) != duration_bucket(5.1, DURATIONS)
+    assert floor_bucket(7.5, 2.0) == (3, 6.0)
+
+
+def test_lru_ttl_and_disk_layer(tmp_path):
+    now = [0.0]
+    cache = ResultCache(max_entries=2, ttl=10, path=str(tmp_path), clock=lambda: now[0])
+    keys = [ResultCache.key("fp", {"A": v}, 0) for v in "123"]
+    for i, k in enumerate(keys):
+        cache.put(k, {"value": i})
+    assert cache.evictions == 1
+    # 内存层已淘汰的条目仍可从磁盘层读回
+    assert cache.get(keys[0]) == {"value": 0} and cache.disk_hits == 1
+    shared = ResultCache(path=str(tmp_path), clock=lambda: now[0])
+    assert shared.get(keys[2]) == {"value": 2}
+    now[0] = 11.0
+    assert cache.get(keys[1]) is None
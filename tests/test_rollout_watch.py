@@ -0,0 +1,46 @@
+import time
+from datetime import datetime, timedelta
+
+import getpod
+from cluster import FakeClusterClient
+from getpod import UpgradeStateManager, perform_task
+from rollout_watch import FakeDeploymentSource, RolloutWatcher
+
+
+def test_wait_ready_targets_post_upgrade_generation():
+    source = FakeDeploymentSource()
+    source.update("ns", "nova-deployment", generation=3, observed_generation=3, replicas=1, status_replicas=1,
+                  updated_replicas=1, available_replicas=1)
+    watcher = RolloutWatcher(source, namespaces=["ns"])
+    try:
+        assert watcher.generation("ns", "nova-deployment") == 3
+        # spec 未变：目标 generation 就是当前值，已滚动完成即就绪
+        assert watcher.wait_ready("ns", "nova-deployment", 3).result(1)
+        pending = watcher.wait_ready("ns", "nova-deployment", 4)
+        assert watcher.progress("ns", "nova-deployment", 4) == 0.0
+        source.update("ns", "nova-deployment", generation=4, observed_generation=4, available_replicas=0)
+        assert not pending.done()
+        source.update("ns", "nova-deployment", available_replicas=1)
+        assert pending.result(1)
+    finally:
+        watcher.stop()
+
+
+def test_unchanged_spec_upgrade_is_not_rolled_back(monkeypatch):
+    monkeypatch.setattr(getpod, "cluster_client", getpod.cluster_client)
+    monkeypatch.setattr(getpod, "rollout_watcher", None)
+    client = FakeClusterClient(static_releases=["nova-1"])
+    getpod.set_cluster_client(client, watch=True)
+    task = {"name": "nova", "region": "ns", "version": {"from": "1", "to": "2"}}
+    manager = UpgradeStateManager()
+    manager.register_tasks([task])
+    try:
+        assert perform_task(task, "/charts", datetime.now() + timedelta(seconds=5), manager)
+        # 第二次升级渲染出相同的 spec，generation 不变
+        start = time.time()
+        assert perform_task(task, "/charts", datetime.now() + timedelta(seconds=5), manager)
+        assert time.time() - start < 2
+        assert client.deployment_generation("ns", "nova-deployment") == 1
+        assert sum(1 for c in client.calls if c[0] == "helm_upgrade") == 2  # 没有回滚
+    finally:
+        getpod.rollout_watcher.stop()
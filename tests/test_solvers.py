@@ -0,0 +1,81 @@
+import importlib
+import itertools
+import os
+import random
+import sys
+import time
+
+from catalog import VersionCatalog
+from solvers import DecomposingSolver, Solver, UpgradeProblem, get_solver
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def random_problem(rng, n_services=6, n_pairs=8):
+    versions = {f"s{i}": [str(v) for v in range(rng.randint(2, 5))] for i in range(n_services)}
+    pairs = []
+    for _ in range(n_pairs):
+        s1, s2 = rng.sample(sorted(versions), 2)
+        pairs.append([s1, rng.choice(versions[s1]), s2, rng.choice(versions[s2])])
+    catalog = VersionCatalog(versions, pairs)
+    current = {s: vs[0] for s, vs in versions.items()}
+    return UpgradeProblem(catalog, current, {s: 1 for s in versions}, rest_time=10)
+
+
+def best_choice(problem):
+    choices = [[None] + idx for idx in problem.groups.values()]
+    best, best_weight = [], 0
+    for combo in itertools.product(*choices):
+        chosen = [i for i in combo if i is not None]
+        weight = sum(problem.weights[i] for i in chosen)
+        if weight > best_weight and all(j not in problem.adjacency[i] for i in chosen for j in chosen):
+            best, best_weight = chosen, weight
+    return best
+
+
+def brute_force(problem):
+    return sum(problem.weights[i] for i in best_choice(problem))
+
+
+class ExactSolver(Solver):
+    """穷举求解，作为分解求解的精确内层"""
+    name = "exact"
+
+    def solve(self, problem):
+        return self._result(problem, "optimal", best_choice(problem), None, time.perf_counter())
+
+
+def feasible(problem, candidates):
+    chosen = [problem.index[s, v] for s, v in candidates.items()]
+    return all(j not in problem.adjacency[i] for i in chosen for j in chosen)
+
+
+def test_heuristic_is_feasible_and_close_to_optimal():
+    rng = random.Random(7)
+    for _ in range(30):
+        problem = random_problem(rng)
+        result = get_solver("heuristic").solve(problem)
+        assert feasible(problem, result.candidates)
+        assert result.objective <= brute_force(problem) <= problem.trivial_bound()
+
+
+def test_decomposition_matches_brute_force():
+    rng = random.Random(11)
+    for _ in range(20):
+        problem = random_problem(rng, n_services=5, n_pairs=4)
+        # 内层精确时，按分量分别求解再合并的结果必须与整体穷举的最优值相同
+        result = DecomposingSolver(ExactSolver(), workers=0).solve(problem)
+        assert feasible(problem, result.candidates)
+        assert result.objective == brute_force(problem)
+        assert sum(problem.weights[problem.index[k]] for k in result.candidates.items()) == result.objective
+
+
+def test_solver_path_imports_without_gurobipy(monkeypatch):
+    # 调度器/优化器的无求解器路径不应依赖 gurobipy
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setitem(sys.modules, "gurobipy", None)
+    for name in ("solvers", "optimizer"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+        importlib.import_module(name)
+    with open(os.path.join(ROOT, "scheduler.py"), encoding="utf-8") as f:
+        assert "from gurobipy" not in f.read()
@@ -0,0 +1,98 @@
+import threading
+
+from getpod import UpgradeStateManager, task_key
+
+
+def make_tasks(n):
+    return [{"name": f"svc{i}", "window_id": 1, "version": {"from": "v1", "to": "v2"}, "timeline": {"start": 0, "end": 10}}
+            for i in range(n)]
+
+
+def test_concurrent_writers_get_unique_ordered_seqs():
+    manager = UpgradeStateManager()
+    tasks = make_tasks(64)
+    manager.register_tasks(tasks)
+    base = manager.get_changes()["seq"]
+
+    def run(name):
+        manager.start_task(name)
+        manager.finish_task(name, True, 1.0)
+
+    threads = [threading.Thread(target=run, args=(task_key(t),)) for t in tasks]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+
+    changes = manager.get_changes(base)
+    assert changes["seq"] == base + 2 * len(tasks)
+    seqs = [t["seq"] for t in changes["tasks"].values()]
+    assert len(set(seqs)) == len(seqs)
+    assert all(t["status"] == "succeeded" for t in changes["tasks"].values())
+
+
+def test_incremental_reader_never_misses_a_change():
+    manager = UpgradeStateManager()
+    tasks = make_tasks(32)
+    manager.register_tasks(tasks)
+    seen = {}
+    done = threading.Event()
+
+    def reader():
+        since = 0
+        while not done.is_set() or since < manager.get_changes()["seq"]:
+            changes = manager.get_changes(since)
+            for name, task in changes["tasks"].items():
+                seen[name] = task["status"]
+            since = changes["seq"]
+
+    th = threading.Thread(target=reader)
+    th.start()
+    writers = [threading.Thread(target=lambda n=task_key(t): (manager.start_task(n), manager.finish_task(n, False, 2.0)))
+               for t in tasks]
+    for w in writers:
+        w.start()
+    for w in writers:
+        w.join()
+    done.set()
+    th.join()
+    assert seen == {task_key(t): "failed" for t in tasks}
+
+
+def test_since_ahead_of_server_resets():
+    manager = UpgradeStateManager()
+    manager.register_tasks(make_tasks(2))
+    changes = manager.get_changes(100)
+    assert changes["reset"] and {t["name"] for t in changes["tasks"].values()} == {"svc0", "svc1"}
+
+
+def test_chained_hops_and_repeated_windows_get_their_own_slots():
+    from getpod import WindowExecutor
+    hop = lambda frm, to, start: {"name": "nova", "region": "ns", "version": {"from": frm, "to": to},
+                                  "timeline": {"start": start, "end": start + 10}}
+    schedule = {"time_windows": [
+        {"window_id": 1, "window_start_time": "2099.01.01.00:00", "window_time": "60s",
+         "tasks": [hop("1", "2", 0), hop("2", "3", 10)]},
+        {"window_id": 2, "window_start_time": "2099.01.02.00:00", "window_time": "60s",
+         "tasks": [hop("1", "2", 0)]},  # 上一窗失败后重试同一跳
+    ]}
+    manager = UpgradeStateManager()
+    executor = WindowExecutor("/charts", manager, max_workers=1)
+    try:
+        executor.submit_schedule(schedule)
+    finally:
+        executor.shutdown()
+    tasks = [t for w in schedule["time_windows"] for t in w["tasks"]]
+    keys = [task_key(t) for t in tasks]
+    assert keys == ["1:nova:1->2", "1:nova:2->3", "2:nova:1->2"]
+
+    manager.start_task(keys[0])
+    manager.finish_task(keys[0], True, 9.0)
+    manager.start_task(keys[1])
+    data = manager.get_data_for_visualizer()
+    assert data["upgrade_times"] == {keys[0]: 9.0}
+    assert data["upgrade_status"] == {keys[0]: False, keys[1]: True, keys[2]: False}
+    assert data["available_versions"][keys[0]] == ["2"] and data["upgrade_candidates"][keys[1]] == "3"
+    assert set(data["labels"].values()) == {"nova"}
+    changes = manager.get_changes()["tasks"]
+    assert changes[keys[2]]["status"] == "pending" and changes[keys[2]]["window_id"] == 2
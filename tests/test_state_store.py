@@ -0,0 +1,68 @@
+import json
+import os
+
+from state_store import NullStateStore, VersionStateStore
+from upgrader import AppUpgrader
+
+VERSIONS = {"Keystone": ["1.0", "1.2", "1.3"], "Nova": ["2.0", "2.1"]}
+
+
+def make_store(tmp_path, **kwargs):
+    return VersionStateStore(str(tmp_path / "data.json"), flush_interval=60, **kwargs)
+
+
+def read_snapshot(tmp_path):
+    with open(tmp_path / "data.json", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_snapshot_after_each_committed_upgrade(tmp_path):
+    store = make_store(tmp_path)
+    store.reset(VERSIONS)
+    store.record("Keystone", "1.0", "1.2", ["1.2", "1.3"])
+    store.flush()
+    assert read_snapshot(tmp_path)["available_versions"]["Keystone"] == ["1.2", "1.3"]
+    assert os.path.getsize(tmp_path / "data.json.wal") == 0
+    store.close()
+
+
+def test_recover_replays_wal_and_ignores_torn_line(tmp_path):
+    crashed = make_store(tmp_path, compact_every=1000)
+    crashed.seed(VERSIONS)
+    crashed.record("Keystone", "1.0", "1.2", ["1.2", "1.3"])
+    crashed.record("Keystone", "1.2", "1.3", ["1.3"])
+    crashed.flush()
+    with open(tmp_path / "data.json.wal", "a", encoding="utf-8") as f:
+        f.write('{"seq": 3, "component": "Nova"')  # 崩溃时写了一半的记录
+    restarted = make_store(tmp_path)
+    assert restarted.available_versions["Keystone"] == ["1.3"]
+    assert restarted.version_history["Keystone"] == [("1.0", "1.2"), ("1.2", "1.3")]
+    assert restarted.seq == 2
+    restarted.close()
+    crashed.close()
+
+
+def test_reset_discards_previous_run(tmp_path):
+    run1 = make_store(tmp_path)
+    run1.reset(VERSIONS)
+    run1.record("Keystone", "1.0", "1.2", ["1.2", "1.3"])
+    run1.record("Nova", "2.0", "2.1", ["2.1"])
+    run1.close()
+
+    run2 = make_store(tmp_path)
+    assert run2.available_versions["Nova"] == ["2.1"]  # 续跑时可恢复
+    run2.reset(VERSIONS)  # 不续跑：以配置中的版本重新开始
+    run2.flush()
+    assert read_snapshot(tmp_path)["available_versions"] == VERSIONS
+    assert run2.recover()[0] == VERSIONS
+    run2.close()
+
+
+def test_upgrader_does_not_persist_by_default(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    available = {s: list(v) for s, v in VERSIONS.items()}
+    upgrader = AppUpgrader({"Nova": 1}, available, {"Nova": "2.1"}, success_fn=lambda *a: True, verbose=False)
+    upgrader._complete_upgrade("Nova", "2.0", "2.1", None, upgrader.clock())
+    assert isinstance(upgrader.store, NullStateStore)
+    assert available["Nova"] == ["2.1"]
+    assert not os.listdir(tmp_path)
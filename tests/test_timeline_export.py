@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+from timeline_export import export_timeline, records_from_status, records_from_upgrader
+
+STATUS = {
+    "start_times": {"Keystone": 100.0, "Nova": 105.0},
+    "upgrade_times": {"Keystone": 4.0, "Nova": 6.0},
+    "upgrade_status": {"Keystone": False, "Nova": False},
+    "upgrade_durations": {"Keystone": 4, "Nova": 5},
+    "upgrade_candidates": {"Keystone": "1.2", "Nova": "2.1"},
+    # Keystone 成功（可用版本已前移到目标版本），Nova 失败
+    "available_versions": {"Keystone": ["1.2", "1.3"], "Nova": ["2.0", "2.1"]},
+}
+
+
+def test_status_records_distinguish_failed_upgrades():
+    records = {r[0]: r for r in records_from_status(STATUS, now=120.0)}
+    assert records["Keystone"][3] == "succeeded"
+    assert records["Nova"][3] == "failed"
+    assert records["Keystone"][1] == 0.0 and records["Nova"][1] == 5.0
+
+
+def test_upgrader_records_default_origin_is_earliest_start():
+    upgrader = SimpleNamespace(
+        start_times=STATUS["start_times"], upgrade_candidates=STATUS["upgrade_candidates"],
+        available_versions=STATUS["available_versions"], upgrade_durations=STATUS["upgrade_durations"],
+        get_upgrade_status=lambda: STATUS["upgrade_status"], get_upgrade_times=lambda: STATUS["upgrade_times"])
+    records = records_from_upgrader(upgrader, now=120.0)
+    assert sorted(r[1] for r in records) == [0.0, 5.0]
+    assert records == records_from_status(STATUS, now=120.0)
+
+
+def test_export_writes_svg(tmp_path):
+    path = export_timeline(records_from_status(STATUS, now=120.0), str(tmp_path / "t.svg"))
+    with open(path, encoding="utf-8") as f:
+        assert f.read().lstrip().startswith("<?xml")
+
+
+def test_state_manager_status_marks_failed_upgrades():
+    from getpod import UpgradeStateManager, task_key
+    manager = UpgradeStateManager()
+    tasks = [{"name": "Keystone", "version": {"from": "1.1", "to": "1.2"}},
+             {"name": "Nova", "version": {"from": "2.0", "to": "2.1"}}]
+    manager.register_tasks(tasks)
+    for task, ok in zip(tasks, (True, False)):
+        manager.start_task(task_key(task))
+        manager.finish_task(task_key(task), ok, 1.0)
+    states = {r[0]: r[3] for r in records_from_status(manager.get_data_for_visualizer())}
+    assert states == {"Keystone": "succeeded", "Nova": "failed"}
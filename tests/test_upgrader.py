@@ -0,0 +1,28 @@
+from simulator import SimulatedEngine, VirtualClock
+from upgrader import AppUpgrader
+
+DURATIONS = {"A": 2, "B": 5, "C": 3, "D": 4}
+
+
+def test_backfill_refills_freed_lane_within_window():
+    clock = VirtualClock()
+    versions = {c: ["1", "2"] for c in DURATIONS}
+    upgrader = AppUpgrader({}, versions, {}, engine=SimulatedEngine(clock), clock=clock,
+                           success_fn=lambda *args: True, verbose=False)
+    calls = []
+
+    def plan(rest_time, running):
+        calls.append((clock.now, sorted(running)))
+        # 故意返回全部未开始的组件，名额由 backfill 按 lanes 截断
+        pending = [c for c in DURATIONS if c not in upgrader.start_times]
+        return pending, {c: "2" for c in pending}
+
+    launched = upgrader.backfill(plan, window_end=10, durations=DURATIONS, lanes=2)
+    assert launched == 4
+    # A 在 2 时完成，空出的通道立即由 C 补上，不等 B 在 5 时结束
+    assert upgrader.start_times == {"A": 0, "B": 0, "C": 2, "D": 5}
+    assert calls[1] == (2, ["B"])
+    for t in upgrader.start_times.values():
+        active = [c for c, s in upgrader.start_times.items() if s <= t < s + DURATIONS[c]]
+        assert len(active) <= 2
+    assert all(vs == ["2"] for vs in upgrader.available_versions.values())
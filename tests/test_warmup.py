@@ -0,0 +1,79 @@
+import subprocess
+from types import SimpleNamespace
+
+import warmup
+from cluster import FakeClusterClient
+from metrics import MetricsRegistry
+from warmup import FakeImagePuller, ImagePuller, KubectlImagePuller, WarmupPipeline, get_puller, images_in
+
+
+def test_auto_puller_never_picks_kubectl():
+    assert isinstance(get_puller("auto", FakeClusterClient()), FakeImagePuller)
+    for client in (None, SimpleNamespace(name="subprocess"), SimpleNamespace(name="kubernetes+cache")):
+        puller = get_puller("auto", client)
+        assert type(puller) is ImagePuller and puller.name == "none"
+    assert isinstance(get_puller("kubectl", per_image_timeout=5), KubectlImagePuller)
+
+
+def fake_kubectl(monkeypatch, phases):
+    """按顺序返回 Pod 阶段的 kubectl 替身，记录调用的子命令"""
+    calls = []
+    phases = iter(phases)
+
+    def run(cmd, **kwargs):
+        calls.append(cmd[1])
+        stdout = next(phases, "Pending") if cmd[1] == "get" else ""
+        return subprocess.CompletedProcess(cmd, 0, stdout, "")
+
+    monkeypatch.setattr(warmup.subprocess, "run", run)
+    return calls
+
+
+def test_kubectl_puller_returns_on_failed_pod(monkeypatch):
+    calls = fake_kubectl(monkeypatch, ["Pending", "Failed"])
+    ok, err = KubectlImagePuller(per_image_timeout=60, poll_interval=0.001).pull("ns", ["img:1", "img:2"], 600)
+    assert not ok and "失败" in err
+    assert calls == ["run", "get", "get", "delete"]
+
+
+def test_kubectl_puller_succeeds_and_cleans_up(monkeypatch):
+    calls = fake_kubectl(monkeypatch, ["Running", "Succeeded", "Succeeded"])
+    ok, _ = KubectlImagePuller(poll_interval=0.001).pull("ns", ["img:1", "img:2"], 600)
+    assert ok
+    assert calls.count("delete") == 2
+
+
+def test_kubectl_puller_stops_at_per_image_timeout(monkeypatch):
+    fake_kubectl(monkeypatch, [])  # 镜像拉取失败的 Pod 一直停在 Pending
+    ok, err = KubectlImagePuller(per_image_timeout=0.05, poll_interval=0.01).pull("ns", ["missing:1"], float("inf"))
+    assert not ok and "超时" in err
+
+
+def test_pipeline_warms_each_namespace_and_image_once():
+    client = FakeClusterClient(fail_upgrades=["heat-1"])
+    client.namespaces.add("ns")
+    puller = FakeImagePuller()
+    pipeline = WarmupPipeline(client, "/charts", puller, metrics=MetricsRegistry())
+    task = lambda name, frm, to: {"name": name, "region": "ns", "version": {"from": frm, "to": to}}
+    try:
+        summary = pipeline.warm([task("nova", "1", "2"), task("glance", "1", "2"), task("heat", "1", "2")])
+        again = pipeline.warm([task("nova", "1", "2")])
+    finally:
+        pipeline.shutdown()
+    assert summary == {"warmed": 2, "invalid": 1, "images": 2, "skipped": 0}
+    assert again["images"] == 0
+    assert sorted(puller.pulled) == [("ns", "registry.local/glance:2"), ("ns", "registry.local/nova:2")]
+    assert pipeline.secret_ready("ns")
+    assert pipeline.chart_error(task("heat", "1", "2")) is not None
+    assert pipeline.chart_error(task("nova", "1", "2")) is None
+    assert sum(1 for c in client.calls if c[0] == "ensure_pull_secret") == 1
+
+
+def test_tasks_after_window_start_are_skipped():
+    pipeline = WarmupPipeline(FakeClusterClient(), "/charts", metrics=MetricsRegistry())
+    try:
+        summary = pipeline.warm([{"name": "nova", "version": {"from": "1", "to": "2"}}], deadline=0.0)
+    finally:
+        pipeline.shutdown()
+    assert summary["skipped"] == 1
+    assert images_in("  - image: a:1\n    image: 'b:2'\n  image: a:1\n") == ["a:1", "b:2"]
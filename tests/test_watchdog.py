@@ -0,0 +1,88 @@
+from duration_model import DurationModel
+from watchdog import RolloutWatchdog, TaskBudget
+
+
+class Clock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_planned_task_ending_at_window_end_is_not_aborted_before_start():
+    # 规划器把任务排到时间窗结束为止：开始时刻略有延迟也不应在开始前放弃
+    clock = Clock(100.3)
+    watchdog = RolloutWatchdog(margin=5.0, clock=clock)
+    for planned, start in ((60, 40), (100, 0), (30, 70)):
+        clock.now = start + 0.3
+        budget = watchdog.budget("nova", "1", "2", planned, window_end=100.0)
+        assert budget.rollback is None
+        assert budget.check() is None
+
+
+def test_task_that_cannot_finish_in_window_is_aborted_before_start():
+    clock = Clock(50.0)
+    budget = RolloutWatchdog(margin=5.0, clock=clock).budget("nova", "1", "2", 80, window_end=100.0)
+    assert budget.check() is not None
+    assert "nova" in budget.reason
+
+
+def test_observed_rollbacks_are_reserved():
+    clock = Clock(0.0)
+    watchdog = RolloutWatchdog(margin=5.0, min_samples=3, clock=clock)
+    for d in (10, 10, 10):
+        watchdog.observe_rollback("nova", d)
+    assert watchdog.rollback_time("nova") == 10
+    assert watchdog.rollback_time("glance") is None
+    assert watchdog.budget("nova", "1", "2", 90, window_end=100.0).check() is not None  # 90 + 10 + 5 > 100
+    assert watchdog.budget("nova", "1", "2", 80, window_end=100.0).rollback_deadline == 85.0
+    assert watchdog.budget("glance", "1", "2", 90, window_end=100.0).check() is None
+
+
+def test_progress_extrapolation_aborts_slow_rollout_in_flight():
+    clock = Clock(0.0)
+    progress = [0.0]
+    budget = TaskBudget("nova", expected=40, rollback=10, started=0.0, window_end=100.0, margin=5.0,
+                        progress=lambda: progress[0], clock=clock)
+    assert budget.check() is None
+    clock.now, progress[0] = 40.0, 0.8
+    assert abs(budget.remaining() - 8.0) < 1e-9 and budget.check() is None
+    clock.now, progress[0] = 60.0, 0.2  # 用时超出预计且进度缓慢：按已用时外推
+    assert abs(budget.remaining() - 48.0) < 1e-9
+    assert budget.check() is not None
+
+
+def test_expected_uses_model_median():
+    model = DurationModel(None, min_samples=3)
+    for d in (20, 30, 40):
+        model.observe("nova", "1", "2", d, True)
+    watchdog = RolloutWatchdog(model)
+    assert abs(watchdog.expected("nova", "1", "2", 99) - 30) < 1
+    assert watchdog.expected("glance", "1", "2", 99) == 99
+
+
+def test_planner_output_is_not_aborted_before_start():
+    import json
+    import os
+    from datetime import datetime
+    from getpod import window_bounds
+    from planner import HorizonPlanner
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(root, "data copy.json")) as f:
+        data = json.load(f)
+    planner = HorizonPlanner(data, time_unit=10)
+    schedule = planner.to_schedule(planner.plan(), datetime(2099, 1, 1))["upgrade_schedule"]
+    clock = Clock()
+    watchdog = RolloutWatchdog(clock=clock)
+    aborted, total = 0, 0
+    for w in schedule["time_windows"]:
+        ws, we = window_bounds(w)
+        for t in w["tasks"]:
+            timeline = t["timeline"]
+            clock.now = ws.timestamp() + timeline["start"] + 0.5  # 定时器的少量延迟
+            budget = watchdog.budget(t["name"], t["version"]["from"], t["version"]["to"],
+                                     timeline["end"] - timeline["start"], we.timestamp())
+            total += 1
+            aborted += budget.check() is not None
+    assert total > 0 and aborted == 0
@@ -0,0 +1,199 @@
+# 无界面时间线导出：把已完成或进行中的升级渲染为 SVG / PNG / 自包含 HTML，不依赖 GUI 和 plt.show()
+import io
+import os
+import html
+import json
+import time
+import argparse
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PolyCollection
+from matplotlib.patches import Patch
+
+matplotlib.rcParams['font.sans-serif'] = ['SimHei']  # 用来正常显示中文标签
+matplotlib.rcParams['axes.unicode_minus'] = False  # 用来正常显示负号
+
+STATUS_COLORS = {
+    'expected': 'lightgray',   # 进行中任务的预计时长
+    'running': 'skyblue',
+    'succeeded': 'lightgreen',
+    'failed': 'red',
+}
+
+# 单条记录：(行名, 开始偏移, 时长, 状态, 说明文字)
+Record = Tuple[str, float, float, str, str]
+
+# 导出在单独的后台线程中串行执行，不阻塞调度循环
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="timeline-export")
+
+
+def records_from_upgrader(upgrader, origin: Optional[float] = None, now: Optional[float] = None) -> List[Record]:
+    """
+    从 AppUpgrader（或 api 中的 ApiUpgraderAdapter）取当前状态的快照
+
+    :param origin: 时间轴零点（时间窗开始的 time.time()），默认取最早的开始时间
+    """
+    now = time.time() if now is None else now
+    if origin is None:
+        origin = min(upgrader.start_times.values(), default=now)
+    status = upgrader.get_upgrade_status()
+    upgrade_times = upgrader.get_upgrade_times()
+    labels = getattr(upgrader, "labels", {})  # ApiUpgraderAdapter 按任务为键，行名取服务名
+    records = []
+    for component, start in upgrader.start_times.items():
+        row = labels.get(component, component)
+        original = upgrader.available_versions.get(component, ["?"])[0]
+        target = upgrader.upgrade_candidates.get(component, "?")
+        left = start - origin
+        if status.get(component, False):
+            records.append((row, left, upgrader.upgrade_durations.get(component, 0), 'expected', ""))
+            records.append((row, left, now - start, 'running', f"{original} -> {target}"))
+        elif component in upgrade_times:
+            # 成功时可用版本已前移到目标版本
+            state = 'succeeded' if original == target else 'failed'
+            records.append((row, left, upgrade_times[component], state, f"{original} -> {target}"))
+    return records
+
+
+def records_from_status(data: Dict[str, dict], origin: Optional[float] = None, now: Optional[float] = None) -> List[Record]:
+    """
+    从 /api/upgrade_status 返回的 JSON 生成记录
+
+    :param origin: 时间轴零点，默认取最早的开始时间
+    """
+    now = time.time() if now is None else now
+    start_times = data.get("start_times", {})
+    if origin is None:
+        origin = min(start_times.values(), default=now)
+    labels = data.get("labels", {})  # 执行器的状态按任务为键，行名取服务名
+    records = []
+    for component, start in start_times.items():
+        row = labels.get(component, component)
+        left = start - origin
+        original = data.get('available_versions', {}).get(component, ['?'])[0]
+        target = data.get('upgrade_candidates', {}).get(component, '?')
+        label = f"{original} -> {target}"
+        if data.get("upgrade_status", {}).get(component, False):
+            records.append((row, left, data.get("upgrade_durations", {}).get(component, 0), 'expected', ""))
+            records.append((row, left, now - start, 'running', label))
+        elif component in data.get("upgrade_times", {}):
+            # 与 records_from_upgrader 相同：成功时可用版本已前移到目标版本
+            state = 'succeeded' if original == target else 'failed'
+            records.append((row, left, data["upgrade_times"][component], state, label))
+    return records
+
+
+def _rows(records: List[Record], max_rows: int) -> Tuple[List[str], Dict[str, int]]:
+    """行名 -> 纵轴位置；行数超过 max_rows 时把相邻的行合并为一组"""
+    names = sorted({r[0] for r in records})
+    if len(names) <= max_rows:
+        return names, {n: i for i, n in enumerate(names)}
+    per_row = -(-len(names) // max_rows)
+    labels = [f"{names[i]} … ({len(names[i:i + per_row])})" for i in range(0, len(names), per_row)]
+    return labels, {n: i // per_row for i, n in enumerate(names)}
+
+
+def render_figure(records: List[Record],
+                  total_time: Optional[float] = None,
+                  title: str = "升级时间线",
+                  max_rows: int = 200,
+                  max_labels: int = 300) -> Figure:
+    """
+    渲染时间线
+
+    所有时间条放进同一个 PolyCollection，而不是每条一个图元；行数过多时按 max_rows 合并，
+    记录数超过 max_labels 时不绘制说明文字。
+    """
+    labels, row_of = _rows(records, max_rows)
+    height = min(4 + 0.25 * len(labels), 60)
+    fig = Figure(figsize=(12, height))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    verts, colors = [], []
+    for name, left, width, state, _ in records:
+        y = row_of[name]
+        verts.append([(left, y - 0.3), (left, y + 0.3), (left + width, y + 0.3), (left + width, y - 0.3)])
+        colors.append(STATUS_COLORS.get(state, 'gray'))
+    ax.add_collection(PolyCollection(verts, facecolors=colors, edgecolors='none'))
+
+    if len(records) <= max_labels:
+        for name, left, width, state, text in records:
+            if text:
+                ax.text(left + width / 2, row_of[name], text, ha='center', va='center', fontsize=7)
+
+    end = max((r[1] + r[2] for r in records), default=1)
+    ax.set_xlim(0, max(total_time or 0, end))
+    ax.set_ylim(-1, max(len(labels), 1))
+    ax.set_yticks(range(len(labels)))
+    ax.set_yticklabels(labels, fontsize=8 if len(labels) <= 100 else 5)
+    ax.set_xlabel("时间 (秒)")
+    ax.set_ylabel("组件")
+    ax.set_title(title)
+    ax.grid(axis='x', linestyle='--', alpha=0.6)
+    ax.legend(handles=[Patch(color=c, label=s) for s, c in STATUS_COLORS.items()], loc='upper right', fontsize=8)
+    fig.tight_layout()
+    return fig
+
+
+def export_timeline(records: List[Record], path: str, fmt: Optional[str] = None, **kwargs) -> str:
+    """
+    导出时间线到文件
+
+    :param fmt: svg / png / html，默认取文件扩展名
+    :param kwargs: 传给 render_figure
+    :return: 写入的文件路径
+    """
+    fmt = (fmt or os.path.splitext(path)[1].lstrip('.') or 'png').lower()
+    fig = render_figure(records, **kwargs)
+    if fmt in ('svg', 'png'):
+        fig.savefig(path, format=fmt)
+        return path
+    if fmt != 'html':
+        raise ValueError(f"不支持的格式: {fmt}")
+    buf = io.StringIO()
+    fig.savefig(buf, format='svg')
+    svg = buf.getvalue()
+    svg = svg[svg.index('<svg'):]  # 去掉 XML 声明和 DOCTYPE，直接内嵌
+    title = html.escape(kwargs.get('title', "升级时间线"))
+    counts = {}
+    for r in records:
+        counts[r[3]] = counts.get(r[3], 0) + 1
+    summary = "".join(f"<li>{html.escape(k)}: {v}</li>" for k, v in sorted(counts.items()))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>{title}</title></head>\n"
+                f"<body><h2>{title}</h2><p>生成时间: {time.strftime('%Y-%m-%d %H:%M:%S')}</p>"
+                f"<ul>{summary}</ul>\n{svg}\n</body></html>\n")
+    return path
+
+
+def export_timeline_async(source, path: str, origin: Optional[float] = None, **kwargs) -> Future:
+    """
+    在后台线程中导出，立即返回 Future
+
+    :param source: AppUpgrader / ApiUpgraderAdapter（在调用线程中立即取快照），或记录列表
+    :param origin: source 为升级器时的时间轴零点，默认取最早的开始时间
+    """
+    records = source if isinstance(source, list) else records_from_upgrader(source, origin)
+    return _executor.submit(export_timeline, records, path, **kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="从执行器 API 或状态 JSON 文件导出升级时间线")
+    parser.add_argument("--api", default="http://127.0.0.1:5001/api/upgrade_status")
+    parser.add_argument("--input", help="读取保存下来的 /api/upgrade_status JSON，而不是请求 API")
+    parser.add_argument("--out", default="timeline.html", help="输出文件，扩展名决定格式 (svg/png/html)")
+    parser.add_argument("--max-rows", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, encoding='utf-8') as f:
+            status = json.load(f)
+    else:
+        import requests
+        status = requests.get(args.api, timeout=5).json()
+    print(export_timeline(records_from_status(status), args.out, max_rows=args.max_rows))
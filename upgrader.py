@@ -1,60 +1,94 @@
 
 import time
-import threading
 from typing import Dict, List, Tuple, Callable, Optional
 import random
 import json
 import os
+from concurrent.futures import Future
+from catalog import VersionCatalog
+from engine import UpgradeEngine, default_engine
+from state_store import VersionStateStore, NullStateStore
 
 
 class AppUpgrader:
     def __init__(self, 
                  upgrade_durations: Dict[str, int],
                  available_versions: Dict[str, List[str]],
-                 upgrade_candidates: Dict[str, str]):
+                 upgrade_candidates: Dict[str, str],
+                 catalog: Optional[VersionCatalog] = None,
+                 engine: Optional[UpgradeEngine] = None,
+                 store: Optional[VersionStateStore] = None,
+                 clock: Callable[[], float] = time.time,
+                 success_fn: Optional[Callable[[str, str, str], bool]] = None,
+                 duration_fn: Optional[Callable[[str], float]] = None,
+                 verbose: bool = True,
+                 metrics=None,
+                 duration_model=None):
         """
         增强版App升级器，带用时统计
         
         :param upgrade_durations: 各组件升级所需时间(秒)
         :param available_versions: 各组件可用版本 {组件: [当前版本, ...]}
         :param upgrade_candidates: 各组件目标升级版本 {组件: 目标版本}
+        :param catalog: 编译后的版本目录，默认按 available_versions 生成
+        :param engine: 跟踪所有进行中升级的事件引擎，默认使用进程内共享引擎
+        :param store: 版本状态存储（WAL + 快照），如 state_store.default_store()；默认不落盘
+        :param clock: 时钟函数，模拟模式下传入虚拟时钟
+        :param success_fn: 判定升级是否成功 (组件, 原版本, 目标版本) -> bool，默认随机 0/1
+        :param duration_fn: 组件实际升级用时，默认等于 upgrade_durations
+        :param verbose: 是否打印升级过程
+        :param metrics: metrics.MetricsRegistry，给定时记录每次升级的用时及与计划用时之差
+        :param duration_model: duration_model.DurationModel，给定时把每次升级的用时和结果计入模型
         """
         self.upgrade_durations = upgrade_durations
         self.available_versions = available_versions
         self.upgrade_candidates = upgrade_candidates
+        self.catalog = catalog or VersionCatalog(available_versions)
+        self.engine = engine or default_engine()
+        self.futures: Dict[str, Future] = {}  # 各组件升级完成的 Future
+        self.store = store or NullStateStore()
+        self.store.seed(available_versions)
+        self.clock = clock
+        self.success_fn = success_fn or (lambda component, original, target: random.randint(0, 1))
+        self.duration_fn = duration_fn or (lambda component: self.upgrade_durations[component])
+        self.verbose = verbose
+        self.metrics = metrics
+        self.duration_model = duration_model
         self.upgrade_status = {c: False for c in upgrade_durations}
         self.version_history = {}
         self.upgrade_times = {}  # 记录各组件实际升级用时
         self.start_times = {} # 记录组件开始时间
         self.success = False # 记录升级是否成功
+        self.backfilling = False # 补位模式下，在时间窗内仍可能加入新的升级
         self.initial_versions_for_plot = {
         s: available_versions[s][0] for s in upgrade_durations.keys()
         }
-    def _upgrade_component(self, component: str, callback: Optional[Callable] = None) -> None:
+    def _upgrade_component(self, component: str, callback: Optional[Callable] = None) -> Optional[Future]:
         """执行组件升级（内部方法）"""
         if component not in self.upgrade_durations:
             raise ValueError(f"未知组件: {component}")
             
         if self.upgrade_status[component]:
-            print(f"警告: 组件 '{component}' 已经在升级中")
-            return
+            self._log(f"警告: 组件 '{component}' 已经在升级中")
+            return self.futures.get(component)
             
         # 获取版本信息
         original = self.available_versions[component][0]
         target = self.upgrade_candidates[component]
         
-        print(f"开始升级 {component} 从 {original} 到 {target} (预计耗时: {self.upgrade_durations[component]}秒)...")
+        self._log(f"开始升级 {component} 从 {original} 到 {target} (预计耗时: {self.upgrade_durations[component]}秒)...")
         
         self.upgrade_status[component] = True
-        self.start_times[component] = time.time()  # 记录开始时间
+        self.start_times[component] = self.clock()  # 记录开始时间
         
-        # 创建计时器线程
-        timer = threading.Timer(
-            interval=self.upgrade_durations[component],
-            function=self._complete_upgrade,
-            args=(component, original, target, callback, self.start_times[component])
+        # 由引擎在到期时回调，不再为每个组件创建计时器线程
+        future = self.engine.schedule(
+            self.duration_fn(component),
+            self._complete_upgrade,
+            component, original, target, callback, self.start_times[component]
         )
-        timer.start()
+        self.futures[component] = future
+        return future
         
     def _complete_upgrade(self, 
                          component: str, 
@@ -64,13 +98,13 @@ class AppUpgrader:
                          start_time: float) -> None:
         """升级完成处理（内部方法）"""
         # 计算实际用时
-        actual_duration = time.time() - start_time
+        actual_duration = self.clock() - start_time
         self.upgrade_times[component] = actual_duration  # 记录用时
         
         # 检查升级是否成功
         def judge_success():
-            self.success = random.randint(0, 1)
-            # return(self.success)# 这里设置了随机01
+            self.success = self.success_fn(component, original, target)
+            # return(self.success)# 默认随机01，模拟模式下按成功概率判定
 
 
 #_________________________________________________________________________________________________
@@ -80,14 +114,14 @@ class AppUpgrader:
         versions = self.available_versions[component]
         # 更新版本库
         if self.success:
-            target_idx = versions.index(target)
+            target_idx = self.catalog.offset(component, versions, target)
             self.available_versions[component] = versions[target_idx:]
+            # 只追加一条迁移记录，由存储的后台线程批量落盘
+            self.store.record(component, original, target, self.available_versions[component])
             
-            print(f"升级成功。{component} 的可用版本已更新为: {self.available_versions[component]}")
+            self._log(f"升级成功。{component} 的可用版本已更新为: {self.available_versions[component]}")
         else:
-            print(f"升级失败。{component} 的可用版本保持不变。")
-        with open('data.json', 'w', encoding='utf-8') as f:
-            json.dump(self.available_versions, f, ensure_ascii=False, indent=4)
+            self._log(f"升级失败。{component} 的可用版本保持不变。")
   
         # success = self.available_versions[component][0] == target
         
@@ -98,8 +132,14 @@ class AppUpgrader:
             else f" (延迟{time_diff:.2f}秒)" if time_diff > 0 
             else " (准时完成)"
         )
-        print(f"{component} 升级{'成功' if self.success else '失败'} - "
+        self._log(f"{component} 升级{'成功' if self.success else '失败'} - "
               f"实际用时: {actual_duration:.2f}秒{time_info}")
+        if self.metrics is not None:
+            self.metrics.record("upgrade", actual_duration, bool(self.success),
+                                service=component, task=f"{component}:{original}->{target}")
+            self.metrics.observe("upgrade_duration_deviation_seconds", time_diff, service=component)
+        if self.duration_model is not None:
+            self.duration_model.observe(component, original, target, actual_duration, bool(self.success))
         
         # 记录版本历史
         if self.success:
@@ -111,6 +151,11 @@ class AppUpgrader:
         
         if callback:
             callback(component, original, target, actual_duration)
+        return bool(self.success)
+
+    def _log(self, message: str) -> None:
+        if self.verbose:
+            print(message)
 
     #_________________________________________________________________________________________________ 
     
@@ -127,9 +172,77 @@ class AppUpgrader:
         :param component: 组件名称
         :return: 升级函数
         """
-        def upgrade(callback: Callable = None) -> None:
-            self._upgrade_component(component, callback)
+        def upgrade(callback: Callable = None) -> Optional[Future]:
+            return self._upgrade_component(component, callback)
         return upgrade
+
+    def add_upgrades(self, upgrade_durations: Dict[str, float], upgrade_candidates: Dict[str, str]) -> None:
+        """
+        加入新的待升级组件，可在其他组件升级过程中调用；已结束的组件可以再次加入
+
+        :param upgrade_durations: 新组件的升级所需时间
+        :param upgrade_candidates: 新组件的目标版本
+        """
+        for component, duration in upgrade_durations.items():
+            self.upgrade_durations[component] = duration
+            self.upgrade_candidates[component] = upgrade_candidates[component]
+            self.upgrade_status.setdefault(component, False)
+            self.initial_versions_for_plot.setdefault(component, self.available_versions[component][0])
+
+    def backfill(self,
+                 plan: Callable[[float, Dict[str, str]], Tuple[List[str], Dict[str, str]]],
+                 window_end: float,
+                 durations: Dict[str, float],
+                 lanes: Optional[int] = None) -> int:
+        """
+        完成即补位：任一升级完成时，立即按剩余时间和仍在进行的升级重新求解，把空出的并行名额补上，
+        而不是等整批中最慢的升级结束
+
+        :param plan: (剩余时间, 进行中的升级 {组件: 目标版本}) -> (新启动的组件, {组件: 目标版本})，
+                     通常为 optimizer.optimize
+        :param window_end: 时间窗结束时刻（与 clock 同一时间基准）
+        :param durations: 各组件升级所需时间
+        :param lanes: 并行升级数上限，给定时名额已满不再求解，plan 选出的超出空余名额的组件不启动
+        :return: 本时间窗内启动的升级数
+        """
+        running: Dict[str, Future] = {}
+        launched = 0
+        self.backfilling = True
+        try:
+            while True:
+                rest_time = window_end - self.clock()
+                if rest_time > 0 and (lanes is None or len(running) < lanes):
+                    selected, candidates = plan(rest_time, {c: self.upgrade_candidates[c] for c in running})
+                    selected = [c for c in selected if c not in running]
+                    if lanes is not None:
+                        selected = selected[:lanes - len(running)]
+                    self.add_upgrades({c: durations[c] for c in selected}, candidates)
+                    for component in selected:
+                        running[component] = self._upgrade_component(component)
+                        launched += 1
+                if not running:
+                    return launched
+                next(iter(self.engine.as_completed(running.values())))
+                for component in [c for c, f in running.items() if f.done()]:
+                    del running[component]
+        finally:
+            self.backfilling = False
+
+    def as_completed(self, timeout: Optional[float] = None):
+        """
+        按完成顺序迭代本升级器启动的升级
+
+        :return: Future 迭代器，结果为升级是否成功
+        """
+        return self.engine.as_completed(self.futures.values(), timeout)
+
+    def await_all(self, timeout: Optional[float] = None) -> bool:
+        """
+        阻塞直到本升级器启动的升级全部完成，完成即唤醒而非轮询
+
+        :return: 是否在 timeout 内全部完成
+        """
+        return self.engine.await_all(self.futures.values(), timeout)
     
     def get_upgrade_status(self, component: str = None) -> Dict[str, bool]:
         """
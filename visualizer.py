@@ -8,13 +8,23 @@ class AppUpgradeVisualizer:
     def __init__(self, upgrader, services, total_time, start_time):
         self.upgrader:AppUpgrader = upgrader
         self.services = services  # 所有服务列表
+        # 组件 -> 纵轴位置，与版本目录的服务顺序一致时直接复用其下标表
+        catalog = getattr(upgrader, 'catalog', None)
+        if catalog is not None and catalog.services == list(services):
+            self.row_index = catalog.service_index
+        else:
+            self.row_index = {s: i for i, s in enumerate(services)}
         self.total_time = total_time  # 时间窗总时间
         self.start_time = start_time  # 时间窗开始的真实时间（time.time()）
         self.fig, self.ax = plt.subplots(figsize=(10, 6))
         self.completed_apps = []  # (component, start_time, end_time)
+        self.artists = {}
+        self.drawn = {}
 
     def init_plot(self):
-        """初始化图表"""
+        """初始化图表：坐标轴只设置一次，每个组件的时间条和文字只创建一次"""
+        if self.artists:  # FuncAnimation 在窗口缩放等情况下会再次调用 init_func
+            return self._visible_artists()
         self.ax.set_xlim(0, self.total_time)
         self.ax.set_ylim(-1, len(self.services))
         self.ax.set_xlabel("时间 (秒)")
@@ -22,81 +32,98 @@ class AppUpgradeVisualizer:
         self.ax.set_yticks(range(len(self.services)))
         self.ax.set_yticklabels(self.services)
         self.ax.set_title("升级时间线")
-        self.bars = []
-        self.texts = []
-        self.time_line = self.ax.axvline(x=0, color='red', linestyle='--')
-        self.time_text = self.ax.text(0.95, 0.95, "时间: 0秒", transform=self.ax.transAxes, ha='right', va='top')
-        return self.bars + [self.time_line, self.time_text]
+        # 只为本批升级的组件创建图元：(时间条, 状态文字, 版本文字)，初始不可见
+        self.artists = {}
+        self.drawn = {}  # 组件 -> 上次绘制的 (状态, 左端, 宽度)，未变化时不修改图元
+        for component in list(self.upgrader.upgrade_durations):
+            self._add_component(component)
+        self.time_line = self.ax.axvline(x=0, color='red', linestyle='--', animated=True)
+        self.time_text = self.ax.text(0.95, 0.95, "时间: 0秒", transform=self.ax.transAxes, ha='right', va='top', animated=True)
+        return self._visible_artists()
+
+    def _add_component(self, component):
+        """为组件创建 (时间条, 状态文字, 版本文字)，初始不可见"""
+        app_index = self.row_index[component]
+        bar = self.ax.barh(app_index, 0, left=0, color='skyblue')[0]
+        text = self.ax.text(0, app_index, "", va='center')
+        version = self.ax.text(0, app_index + 0.3, "", ha='center', va='bottom', fontsize=8)
+        for artist in (bar, text, version):
+            artist.set_visible(False)
+            artist.set_animated(True)
+        self.artists[component] = (bar, text, version)
+
+    def _visible_artists(self):
+        """blit 时需要重绘的图元：可见的时间条/文字以及时间线"""
+        artists = [a for group in self.artists.values() for a in group if a.get_visible()]
+        return artists + [self.time_line, self.time_text]
+
+    def _place(self, component, state, left, width, label):
+        """按状态更新组件的时间条和文字，仅在状态或宽度变化时修改图元"""
+        bar, text, version = self.artists[component]
+        if self.drawn.get(component) != (state, left, width):
+            self.drawn[component] = (state, left, width)
+            bar.set_x(left)
+            bar.set_width(width)
+            bar.set_color({'running': 'skyblue', 'done': 'lightgreen', 'failed': 'red'}[state])
+            text.set_x(left + width + 0.5)
+            # 添加版本信息
+            original = self.upgrader.available_versions[component][0]
+            target = self.upgrader.upgrade_candidates[component]
+            version.set_text(f"{original} -> {target}")
+            version.set_x(left + width / 2)
+            for artist in (bar, text, version):
+                artist.set_visible(True)
+        text.set_text(label)
 
     def update_plot(self, frame):
-        """更新图表"""
+        """更新图表：只修改状态变化的图元，纵轴位置来自预先计算的 row_index"""
         # 计算当前时间相对于时间窗开始的偏移
-        current_time = time.time() - self.start_time
+        now = time.time()
+        current_time = now - self.start_time
         if current_time > self.total_time:
             current_time = self.total_time  # 限制在时间窗内
 
-        self.ax.clear()
-        self.ax.set_xlim(0, self.total_time)
-        self.ax.set_ylim(-1, len(self.services))
-        self.ax.set_xlabel("时间 (秒)")
-        self.ax.set_ylabel("组件")
-        self.ax.set_yticks(range(len(self.services)))
-        self.ax.set_yticklabels(self.services)
-        self.ax.set_title("升级时间线")
-
         # 获取当前状态
         status = self.upgrader.get_upgrade_status()
         upgrade_times = self.upgrader.get_upgrade_times()
 
-        # 绘制时间条
-        self.bars = []
-        self.texts = []
-        for component in self.services:
-            app_index = self.services.index(component)
+        # 补位模式下升级器会在窗内加入新组件
+        for component in list(self.upgrader.upgrade_durations):
+            if component not in self.artists:
+                self._add_component(component)
+
+        for component in self.artists:
             start_time = self.upgrader.start_times.get(component, 0)
+            left = start_time - self.start_time
             if status.get(component, False):  # 正在升级
                 duration = self.upgrader.upgrade_durations[component]
-                remaining_time = duration - (time.time() - start_time)
+                remaining_time = duration - (now - start_time)
                 if remaining_time > 0:
-                    bar = self.ax.barh(app_index, duration, left=start_time - self.start_time, color='skyblue')
-                    self.bars.append(bar)
-                    text = self.ax.text((start_time - self.start_time) + duration + 0.5, app_index, f"{remaining_time:.1f}秒", va='center')
-                    self.texts.append(text)
-                    # 添加版本信息
-                    original = self.upgrader.available_versions[component][0]
-                    target = self.upgrader.upgrade_candidates[component]
-                    version_text = f"{original} -> {target}"
-                    self.ax.text((start_time - self.start_time) + duration / 2, app_index + 0.3, version_text, ha='center', va='bottom', fontsize=8)
+                    self._place(component, 'running', left, duration, f"{remaining_time:.1f}秒")
+                elif self.drawn.pop(component, None):  # 超出预计时长且尚未完成时不显示
+                    for artist in self.artists[component]:
+                        artist.set_visible(False)
             elif component in upgrade_times:  # 已完成
-                duration = upgrade_times[component]
                 # 判断升级是否成功
                 success = self.upgrader.available_versions[component][0] != self.upgrader.upgrade_candidates[component]
-                color = 'lightgreen' if not success else 'red'
-                label = "完成" if not success else "失败"
-                bar = self.ax.barh(app_index, duration, left=start_time - self.start_time, color=color)
-                self.bars.append(bar)
-                text = self.ax.text((start_time - self.start_time) + duration + 0.5, app_index, label, va='center')
-                self.texts.append(text)
-                # 添加版本信息
-                original = self.upgrader.available_versions[component][0]
-                target = self.upgrader.upgrade_candidates[component]
-                version_text = f"{original} -> {target}"
-                self.ax.text((start_time - self.start_time) + duration / 2, app_index + 0.3, version_text, ha='center', va='bottom', fontsize=8)
+                self._place(component, 'failed' if success else 'done', left, upgrade_times[component],
+                            "失败" if success else "完成")
 
         # 更新时间线和时间文本
-        self.time_line = self.ax.axvline(x=current_time, color='red', linestyle='--')
-        self.time_text = self.ax.text(0.95, 0.95, f"时间: {current_time:.1f}秒", transform=self.ax.transAxes, ha='right', va='top')
+        self.time_line.set_xdata([current_time, current_time])
+        self.time_text.set_text(f"时间: {current_time:.1f}秒")
 
         # 检查是否所有升级完成且时间窗结束
-        if (not any(status.values()) and len(upgrade_times) == len(self.upgrader.upgrade_durations)) or current_time >= self.total_time:
+        finished = not any(status.values()) and len(upgrade_times) == len(self.upgrader.upgrade_durations)
+        if (finished and not getattr(self.upgrader, 'backfilling', False)) or current_time >= self.total_time:
             self.ani.event_source.stop()
 
-        return self.bars + [self.time_line, self.time_text]
+        return self._visible_artists()
 
     def animate(self):
         """启动动画"""
         self.ani = FuncAnimation(self.fig, self.update_plot, init_func=self.init_plot,
-                                interval=100, blit=False, repeat=False)
+                                interval=100, blit=True, repeat=False)
 
         plt.show()
         
\ No newline at end of file
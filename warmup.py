@@ -0,0 +1,240 @@
+# 时间窗之间的预热：在 gap_length 间隔内为下一个时间窗的任务校验并预渲染 chart、给 ServiceAccount 加上 pull secret、
+# 预拉取目标镜像，时间窗开始后只剩升级本身
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from cluster import ClusterClient
+from metrics import MetricsRegistry, default_registry
+
+IMAGE_RE = re.compile(r'^\s*(?:-\s*)?image:\s*["\']?([^"\'\s]+)', re.M)
+
+
+def images_in(manifest: str) -> List[str]:
+    """渲染出的清单中引用的镜像（去重，保持出现顺序）"""
+    return list(dict.fromkeys(IMAGE_RE.findall(manifest)))
+
+
+class ImagePuller:
+    """镜像预拉取钩子：在时间窗开始前把目标镜像拉到节点上；基类不做任何事"""
+    name = "none"
+
+    def pull(self, namespace: str, images: List[str], timeout: float) -> Tuple[bool, str]:
+        """
+        :param timeout: 最多可用的秒数（到下一个时间窗开始为止）
+        :return: (是否全部拉取成功, 错误信息)
+        """
+        return True, ""
+
+
+class KubectlImagePuller(ImagePuller):
+    """
+    为每个镜像创建一个立即退出的 Pod（imagePullPolicy=IfNotPresent，使用命名空间 default ServiceAccount 的 pull secret），
+    Pod 结束即删除；只预热该 Pod 被调度到的节点
+    """
+    name = "kubectl"
+
+    def __init__(self, per_image_timeout: float = 120.0, poll_interval: float = 2.0):
+        """
+        :param per_image_timeout: 每个镜像最多等待的秒数（镜像不存在时 Pod 一直停在 Pending/ErrImagePull，不会进入 Failed）
+        :param poll_interval: 查询 Pod 阶段的间隔(秒)
+        """
+        self.per_image_timeout = per_image_timeout
+        self.poll_interval = poll_interval
+
+    def _wait(self, namespace: str, pod: str, timeout: float) -> Tuple[bool, str]:
+        """轮询 Pod 阶段直到 Succeeded 或 Failed（kubectl wait 只能等待一个条件，Pod 失败时会一直等到超时）"""
+        deadline = time.time() + timeout
+        while True:
+            res = subprocess.run(["kubectl", "get", "pod", pod, "-n", namespace, "-o", "jsonpath={.status.phase}"],
+                                 capture_output=True, text=True)
+            phase = res.stdout.strip()
+            if phase == "Succeeded":
+                return True, ""
+            if phase == "Failed":
+                return False, f"预拉取 Pod {pod} 失败"
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False, f"等待预拉取 Pod {pod} 超时 ({timeout:.0f}s, 阶段: {phase or res.stderr.strip()})"
+            time.sleep(min(self.poll_interval, remaining))
+
+    def pull(self, namespace, images, timeout):
+        deadline = time.time() + timeout
+        for image in images:
+            pod = "prepull-" + hashlib.sha1(image.encode('utf-8')).hexdigest()[:10]
+            res = subprocess.run(["kubectl", "run", pod, "-n", namespace, f"--image={image}", "--restart=Never",
+                                  "--image-pull-policy=IfNotPresent", "--command", "--", "true"],
+                                 capture_output=True, text=True)
+            if res.returncode != 0:
+                return False, res.stderr.strip()
+            try:
+                ok, err = self._wait(namespace, pod, min(self.per_image_timeout, max(deadline - time.time(), 0.0)))
+            finally:
+                subprocess.run(["kubectl", "delete", "pod", pod, "-n", namespace, "--wait=false"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            if not ok:
+                return False, err
+        return True, ""
+
+
+class FakeImagePuller(ImagePuller):
+    """本地模拟：记录拉取的镜像，每个镜像耗时 delay 秒，fail 中的镜像拉取失败"""
+    name = "fake"
+
+    def __init__(self, delay: float = 0.0, fail: Iterable[str] = ()):
+        self.delay = delay
+        self.fail = set(fail)
+        self._lock = threading.Lock()
+        self.pulled: List[Tuple[str, str]] = []  # (命名空间, 镜像)
+
+    def pull(self, namespace, images, timeout):
+        for image in images:
+            if self.delay > timeout:
+                return False, f"拉取 {image} 超时"
+            time.sleep(self.delay)
+            timeout -= self.delay
+            if image in self.fail:
+                return False, f"拉取 {image} 失败"
+            with self._lock:
+                self.pulled.append((namespace, image))
+        return True, ""
+
+
+PULLERS = {
+    "none": ImagePuller,
+    "kubectl": KubectlImagePuller,
+    "fake": FakeImagePuller,
+}
+
+
+def get_puller(name: str = "auto", client: Optional[ClusterClient] = None, **kwargs) -> ImagePuller:
+    """
+    按名称创建镜像预拉取钩子
+
+    :param name: none / kubectl / fake / auto（集群后端为 fake 时用 fake，否则不预拉取；
+                 kubectl 会在集群中创建 Pod，只在显式指定时使用）
+    """
+    if name == "auto":
+        name = "fake" if client is not None and client.name.split("+")[0] == "fake" else "none"
+    if name not in PULLERS:
+        raise ValueError(f"未知的镜像预拉取方式: {name}，可选 {', '.join(PULLERS)}")
+    return PULLERS[name](**kwargs)
+
+
+class WarmupPipeline:
+    def __init__(self,
+                 client: ClusterClient,
+                 chart_root: str,
+                 puller: Optional[ImagePuller] = None,
+                 secret_name: str = "cloudsim-docker",
+                 max_workers: int = 4,
+                 metrics: Optional[MetricsRegistry] = None):
+        """
+        时间窗开始前的预热流水线
+
+        每个任务依次：给所在命名空间的 default ServiceAccount 加上 pull secret（每个命名空间只做一次）、
+        用 helm template 在本地渲染目标版本的 chart（校验 chart 并找出镜像）、通过 puller 预拉取尚未拉过的镜像。
+        预热在独立的线程池中进行，不占用升级的工作线程；时间窗开始后尚未预热的任务直接跳过。
+
+        :param client: 集群客户端
+        :param chart_root: chart 根目录，与升级使用的相同
+        :param puller: 镜像预拉取钩子，默认不预拉取
+        :param secret_name: 镜像拉取 secret
+        :param max_workers: 同时预热的任务数
+        :param metrics: 记录 warmup_* 阶段耗时的登记表
+        """
+        self.client = client
+        self.chart_root = chart_root
+        self.puller = puller or ImagePuller()
+        self.secret_name = secret_name
+        self.metrics = metrics or default_registry()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="warmup")
+        self._runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="warmup-window")
+        self._lock = threading.Lock()
+        self._secrets: Set[str] = set()  # 已加上 pull secret 的命名空间
+        self._charts: Dict[Tuple[str, str, str, str], Optional[str]] = {}  # (命名空间, 服务, 原版本, 目标版本) -> 渲染错误
+        self._pulled: Set[Tuple[str, str]] = set()  # (命名空间, 镜像)
+
+    @staticmethod
+    def _key(task: dict) -> Tuple[str, str, str, str]:
+        ver = task.get("version", {})
+        return task.get("region", "default"), task.get("name"), ver.get("from"), ver.get("to")
+
+    def secret_ready(self, namespace: str) -> bool:
+        """预热阶段是否已给该命名空间加上 pull secret（升级时可跳过 ensure_pull_secret）"""
+        with self._lock:
+            return namespace in self._secrets
+
+    def chart_error(self, task: dict) -> Optional[str]:
+        """预热阶段渲染该任务的 chart 失败时返回错误信息；成功或尚未预热时为 None"""
+        with self._lock:
+            return self._charts.get(self._key(task))
+
+    def submit(self, tasks: List[dict], deadline: Optional[float] = None) -> Future:
+        """在后台预热一个时间窗的任务，deadline 为时间窗开始时刻（time.time() 基准）"""
+        return self._runner.submit(self.warm, tasks, deadline)
+
+    def warm(self, tasks: List[dict], deadline: Optional[float] = None) -> Dict[str, int]:
+        """
+        预热一个时间窗的任务，阻塞直到全部完成或跳过
+
+        :return: {"warmed": 完成预热的任务数, "invalid": chart 渲染失败数, "images": 新拉取的镜像数, "skipped": 跳过数}
+        """
+        summary = {"warmed": 0, "invalid": 0, "images": 0, "skipped": 0}
+        for outcome, pulled in self.pool.map(lambda t: self._warm_task(t, deadline), tasks):
+            summary[outcome] += 1
+            summary["images"] += pulled
+        return summary
+
+    def _ensure_secret(self, namespace: str, labels: dict) -> None:
+        if self.secret_ready(namespace):
+            return
+        with self.metrics.span("warmup_pull_secret", **labels) as span:
+            span["ok"] = ok = self.client.ensure_pull_secret(namespace, self.secret_name)
+        if ok:
+            with self._lock:
+                self._secrets.add(namespace)
+
+    def _warm_task(self, task: dict, deadline: Optional[float]) -> Tuple[str, int]:
+        ns, name, frm_ver, to_ver = key = self._key(task)
+        if deadline is not None and time.time() >= deadline:
+            logging.info(f"时间窗已开始，跳过 {name} 的预热")
+            return "skipped", 0
+        labels = {"service": name, "namespace": ns, "task": f"{name}:{frm_ver}->{to_ver}"}
+        # 命名空间尚不存在时（首次安装）失败，升级时仍会再做一次
+        self._ensure_secret(ns, labels)
+
+        with self.metrics.span("warmup_render", **labels) as span:
+            ok, out = self.client.render_chart(f"{name}-{frm_ver}", os.path.join(self.chart_root, name, to_ver), ns,
+                                               {"upgrade_path": f"{frm_ver}-{to_ver}"})
+            span["ok"] = ok
+        with self._lock:
+            self._charts[key] = None if ok else out
+        if not ok:
+            logging.warning(f"{name} {frm_ver} → {to_ver} 的 chart 校验失败: {out}")
+            return "invalid", 0
+
+        with self._lock:
+            images = [i for i in images_in(out) if (ns, i) not in self._pulled]
+            self._pulled.update((ns, i) for i in images)  # 先占位，同一镜像只拉一次
+        if not images:
+            return "warmed", 0
+        timeout = float("inf") if deadline is None else deadline - time.time()
+        with self.metrics.span("warmup_image_pull", **labels) as span:
+            ok, err = self.puller.pull(ns, images, timeout)
+            span["ok"] = ok
+        if not ok:
+            logging.warning(f"{name} 的镜像预拉取失败（升级时仍会拉取）: {err}")
+            with self._lock:
+                self._pulled.difference_update((ns, i) for i in images)
+            return "warmed", 0
+        return "warmed", len(images)
+
+    def shutdown(self) -> None:
+        self._runner.shutdown(wait=False)
+        self.pool.shutdown(wait=False)
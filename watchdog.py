@@ -0,0 +1,147 @@
+# 时间窗预算看门狗：结合学习到的用时估计和实时滚动进度预测升级的完成时刻，
+# 预计 完成时刻 + 回滚用时 超出时间窗时立即放弃并开始回滚，不再等到时间窗结束才回滚。
+# 回滚用时只取实测样本，没有样本时不预留回滚时间，只在预计完成时刻明显超出时间窗时放弃
+import time
+import threading
+from typing import Callable, Dict, Optional
+from duration_model import QuantileSketch
+
+
+class TaskBudget:
+    def __init__(self,
+                 service: str,
+                 expected: float,
+                 rollback: Optional[float],
+                 started: float,
+                 window_end: float,
+                 margin: float = 5.0,
+                 progress: Optional[Callable[[], Optional[float]]] = None,
+                 clock: Callable[[], float] = time.time):
+        """
+        单个升级任务的时间预算
+
+        :param service: 服务名（用于日志）
+        :param expected: 预计升级用时(秒)
+        :param rollback: 预计回滚用时(秒)，None 表示没有实测的回滚用时
+        :param started: 任务开始时刻（与 clock 同一时间基准）
+        :param window_end: 时间窗结束时刻
+        :param margin: 回滚结束与时间窗结束之间保留的余量(秒)；回滚用时未知时为预计完成时刻允许超出时间窗的量，
+                       计划在窗尾结束的任务不会因开始时刻的微小延迟而被放弃
+        :param progress: 返回滚动进度 0~1 的函数，没有进度信息时返回 None
+        """
+        self.service = service
+        self.expected = expected
+        self.rollback = rollback
+        self.started = started
+        self.window_end = window_end
+        self.margin = margin
+        self.progress = progress
+        self.clock = clock
+        self.reason: Optional[str] = None  # 放弃的原因，未放弃时为 None
+
+    @property
+    def rollback_deadline(self) -> float:
+        """最晚开始回滚的时刻：此后再回滚就会越过时间窗；回滚用时未知时为时间窗结束时刻加上 margin"""
+        if self.rollback is None:
+            return self.window_end + self.margin
+        return self.window_end - self.rollback - self.margin
+
+    def remaining(self, now: Optional[float] = None) -> float:
+        """
+        预计剩余用时
+
+        没有进度信息时为 max(预计用时 - 已用时, 0)；有滚动进度 p 时为 (1 - p) * max(预计用时, 已用时)，
+        即剩余工作比例乘以预计总用时，超时仍未完成的升级按已用时外推
+        """
+        now = self.clock() if now is None else now
+        elapsed = max(now - self.started, 0.0)
+        p = self.progress() if self.progress is not None else None
+        if p is None:
+            return max(self.expected - elapsed, 0.0)
+        return (1 - min(max(p, 0.0), 1.0)) * max(self.expected, elapsed)
+
+    def check(self, now: Optional[float] = None) -> Optional[str]:
+        """
+        预计完成时刻晚于 rollback_deadline 时记录并返回放弃原因，否则返回 None
+        """
+        now = self.clock() if now is None else now
+        finish = now + self.remaining(now)
+        if finish > self.rollback_deadline:
+            rollback = "" if self.rollback is None else f"，加上回滚 {self.rollback:.0f}s"
+            self.reason = (f"{self.service} 预计 {finish - now:.0f}s 后完成{rollback} "
+                           f"将超出时间窗剩余的 {self.window_end - now:.0f}s")
+        return self.reason
+
+
+class RolloutWatchdog:
+    def __init__(self,
+                 model=None,
+                 quantile: float = 0.5,
+                 rollback_quantile: float = 0.9,
+                 margin: float = 5.0,
+                 interval: float = 5.0,
+                 min_samples: int = 3,
+                 clock: Callable[[], float] = time.time):
+        """
+        按时间预算提前放弃升级
+
+        :param model: duration_model.DurationModel，给定时用其分位数估计升级用时，否则使用计划中的用时
+        :param quantile: 预测完成时刻使用的用时分位数（取中位数，避免把计划在窗尾结束的任务过早放弃）
+        :param rollback_quantile: 回滚用时的分位数（取偏保守的 p90，保证回滚能在窗内结束）
+        :param margin: 回滚结束与时间窗结束之间保留的余量(秒)
+        :param interval: 等待就绪期间重新预测的间隔(秒)
+        :param min_samples: 使用回滚样本所需的最少样本数
+        """
+        self.model = model
+        self.quantile = quantile
+        self.rollback_quantile = rollback_quantile
+        self.margin = margin
+        self.interval = interval
+        self.min_samples = min_samples
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._rollbacks: Dict[str, QuantileSketch] = {}  # 服务 -> 回滚用时
+
+    def observe_rollback(self, service: str, duration: float) -> None:
+        """记录一次回滚用时(秒)"""
+        with self._lock:
+            self._rollbacks.setdefault(service, QuantileSketch()).add(duration)
+
+    def expected(self, service: str, from_ver: str, to_ver: str, planned: float) -> float:
+        """预计升级用时(秒)：模型样本不足时使用计划用时"""
+        if self.model is None:
+            return planned
+        return self.model.estimate(service, planned, from_ver, to_ver, q=self.quantile)
+
+    def rollback_time(self, service: str) -> Optional[float]:
+        """
+        预计回滚用时(秒)，该服务的回滚样本不足 min_samples 时为 None
+
+        不按升级用时的比例猜测：规划器把任务排到时间窗结束为止，猜测的回滚时间会让这些任务在开始前就被放弃
+        """
+        with self._lock:
+            sketch = self._rollbacks.get(service)
+            if sketch is not None and sketch.count >= self.min_samples:
+                return sketch.quantile(self.rollback_quantile)
+        return None
+
+    def budget(self,
+               service: str,
+               from_ver: str,
+               to_ver: str,
+               planned: float,
+               window_end: float,
+               started: Optional[float] = None,
+               progress: Optional[Callable[[], Optional[float]]] = None) -> TaskBudget:
+        """
+        为一次升级建立时间预算
+
+        :param planned: 计划中的升级用时(秒)
+        :param window_end: 时间窗结束时刻（与 clock 同一时间基准）
+        :param started: 任务开始时刻，默认为现在
+        :param progress: 返回滚动进度 0~1 的函数
+        """
+        expected = self.expected(service, from_ver, to_ver, planned)
+        return TaskBudget(service, expected, self.rollback_time(service),
+                          self.clock() if started is None else started, window_end,
+                          self.margin, progress, self.clock)